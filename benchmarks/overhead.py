@@ -0,0 +1,278 @@
+"""Benchmarks the overhead of torchtyping's runtime checking.
+
+Every case times the same function both undecorated and decorated with
+`torchtyping.typechecked`, on CPU, and reports the time per call of each along with
+the overhead of checking (their difference) and the ratio between them.
+
+Usage:
+
+    python benchmarks/overhead.py [--output results.json] [--filter substring]
+    python benchmarks/overhead.py --compare baseline.json [--tolerance 1.25]
+
+Results are printed as a table, and optionally written as JSON. With --compare, the
+exit code is nonzero if the overhead of any case has grown by more than a factor of
+--tolerance relative to the given earlier results.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+import torch
+import torchtyping
+from torchtyping import SampleEvery, TensorType, typechecked
+from typing import Dict, List, Tuple, Union
+
+# Silence flake8 about the dimension names.
+a = b = c = d = batch = channels = None
+
+
+CASES = {}
+
+
+def case(name):
+    def register(make):
+        CASES[name] = make
+        return make
+
+    return register
+
+
+def _make(source: str, namespace: Dict, **options):
+    # Returns the same function undecorated and decorated. Building it from source means
+    # the number of arguments / dimensions can vary.
+    namespace = dict(namespace, TensorType=TensorType)
+    exec(source, namespace)
+    undecorated = namespace["func"]
+    exec(source, namespace)
+    decorated = typechecked(namespace["func"], **options)
+    return undecorated, decorated
+
+
+def _arguments_case(num_args):
+    def make():
+        params = ", ".join(
+            f"x{i}: TensorType['batch', 'channels']" for i in range(num_args)
+        )
+        source = f"def func({params}):\n    return x0\n"
+        undecorated, decorated = _make(source, {})
+        args = [torch.rand(4, 3) for _ in range(num_args)]
+        return undecorated, decorated, args, {}
+
+    return make
+
+
+for _num_args in (1, 4, 16):
+    case(f"arguments/{_num_args}")(_arguments_case(_num_args))
+
+
+def _dims_case(num_dims):
+    def make():
+        dims = ", ".join(repr(f"d{i}") for i in range(num_dims))
+        source = f"def func(x: TensorType[{dims}], y: TensorType[{dims}]):\n    pass\n"
+        undecorated, decorated = _make(source, {})
+        shape = (1,) * num_dims
+        return undecorated, decorated, [torch.rand(shape), torch.rand(shape)], {}
+
+    return make
+
+
+for _num_dims in (1, 4, 8):
+    case(f"named_dims/{_num_dims}")(_dims_case(_num_dims))
+
+
+@case("ellipsis/unnamed")
+def _():
+    def func(x: TensorType[..., "c"], y: TensorType[..., "c"]):
+        pass
+
+    return func, typechecked(func), [torch.rand(2, 3, 4), torch.rand(5, 4)], {}
+
+
+@case("ellipsis/named")
+def _():
+    def func(x: TensorType["batch":..., "c"], y: TensorType["batch":..., "d"]):
+        pass
+
+    return func, typechecked(func), [torch.rand(2, 3, 4), torch.rand(2, 3, 5)], {}
+
+
+@case("nested/tuple")
+def _():
+    def func(x: Tuple[TensorType["a", "b"], TensorType["b", "c"]]):
+        pass
+
+    return func, typechecked(func), [(torch.rand(2, 3), torch.rand(3, 4))], {}
+
+
+@case("nested/list")
+def _():
+    def func(x: List[TensorType["a", "b"]]):
+        pass
+
+    return func, typechecked(func), [[torch.rand(2, 3) for _ in range(8)]], {}
+
+
+@case("union")
+def _():
+    def func(x: Union[TensorType["a", "b"], TensorType["a"]], y: TensorType["a"]):
+        pass
+
+    return func, typechecked(func), [torch.rand(2), torch.rand(2)], {}
+
+
+@case("return")
+def _():
+    def func(x: TensorType["a", "b"], y: TensorType["b"]) -> TensorType["a"]:
+        return x @ y
+
+    return func, typechecked(func), [torch.rand(2, 3), torch.rand(3)], {}
+
+
+@case("failure")
+def _():
+    def func(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    def undecorated(x, y):
+        try:
+            raise TypeError
+        except TypeError:
+            pass
+
+    checked = typechecked(func)
+
+    def decorated(x, y):
+        try:
+            checked(x, y)
+        except TypeError:
+            pass
+
+    return undecorated, decorated, [torch.rand(2), torch.rand(3)], {}
+
+
+@case("non_tensor")
+def _():
+    def func(x: int, y: str) -> int:
+        return x
+
+    return func, typechecked(func), [1, "y"], {}
+
+
+@case("options/cache")
+def _():
+    # Named `...` needs the generic checks, which is where a cache helps. (Simpler
+    # annotations are compiled to inline checks, and ignore `cache_size`.)
+    def func(x: TensorType["b":..., "c"], y: TensorType["b":...]):
+        return x
+
+    decorated = typechecked(func, cache_size=16)
+    return func, decorated, [torch.rand(2, 3), torch.rand(2)], {}
+
+
+@case("options/no_cache")
+def _():
+    def func(x: TensorType["b":..., "c"], y: TensorType["b":...]):
+        return x
+
+    return func, typechecked(func), [torch.rand(2, 3), torch.rand(2)], {}
+
+
+@case("options/sample_every_100")
+def _():
+    def func(x: TensorType["a", "b"], y: TensorType["b"]) -> TensorType["a"]:
+        return x @ y
+
+    decorated = typechecked(func, sample=SampleEvery(100))
+    return func, decorated, [torch.rand(2, 3), torch.rand(3)], {}
+
+
+def _time(func, args, kwargs, number: int, repeat: int) -> float:
+    # Best time per call, in microseconds.
+    func(*args, **kwargs)  # warm up, e.g. compiling the check plan
+    times = timeit.repeat(lambda: func(*args, **kwargs), number=number, repeat=repeat)
+    return min(times) / number * 1e6
+
+
+def run(names: List[str], number: int, repeat: int) -> Dict:
+    results = {}
+    for name in names:
+        undecorated, decorated, args, kwargs = CASES[name]()
+        baseline = _time(undecorated, args, kwargs, number, repeat)
+        checked = _time(decorated, args, kwargs, number, repeat)
+        results[name] = {
+            "baseline_us": baseline,
+            "checked_us": checked,
+            "overhead_us": checked - baseline,
+            "ratio": checked / baseline,
+        }
+    return {
+        "torchtyping": torchtyping.__version__,
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "number": number,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(output: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in output["results"].items():
+        try:
+            previous = baseline["results"][name]
+        except KeyError:
+            continue
+        if result["overhead_us"] > tolerance * max(previous["overhead_us"], 0.1):
+            regressions.append(
+                f"{name}: overhead {result['overhead_us']:.2f}us, previously "
+                f"{previous['overhead_us']:.2f}us"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", help="Write the results to this file as JSON.")
+    parser.add_argument("--filter", default="", help="Only run cases containing this.")
+    parser.add_argument("--number", type=int, default=2000, help="Calls per timing.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timings per case.")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="Allowed growth in overhead when comparing.",
+    )
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if args.filter in name]
+    output = run(names, args.number, args.repeat)
+
+    print(f"{'case':<28}{'baseline us':>14}{'checked us':>14}{'overhead us':>14}")
+    for name, result in output["results"].items():
+        print(
+            f"{name:<28}{result['baseline_us']:>14.2f}{result['checked_us']:>14.2f}"
+            f"{result['overhead_us']:>14.2f}"
+        )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+            f.write("\n")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(output, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
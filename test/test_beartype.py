@@ -0,0 +1,144 @@
+import pytest
+import torch
+from torchtyping import beartyped, disable_checking, enable_checking, TensorType
+from typing import List, Optional, Tuple
+
+beartype = pytest.importorskip("beartype")
+from beartype.roar import BeartypeCallHintViolation  # noqa: E402
+
+# Silence flake8.
+a = b = c = None
+
+
+def test_dims():
+    @beartyped
+    def func(x: TensorType["a", "b"], y: TensorType["b"]) -> TensorType["a"]:
+        return x @ y
+
+    func(torch.rand(2, 3), torch.rand(3))
+    # Sizes are only consistent within a single call.
+    func(torch.rand(4, 5), torch.rand(5))
+    with pytest.raises(BeartypeCallHintViolation):
+        func(torch.rand(2, 3), torch.rand(4))
+    with pytest.raises(BeartypeCallHintViolation):
+        func(torch.rand(2), torch.rand(2))
+    with pytest.raises(BeartypeCallHintViolation):
+        func(torch.rand(2, 3), 1)
+
+    @beartyped
+    def bad_return(x: TensorType["a"]) -> TensorType["a"]:
+        return torch.rand(3)
+
+    bad_return(torch.rand(3))
+    with pytest.raises(BeartypeCallHintViolation):
+        bad_return(torch.rand(2))
+
+
+def test_details():
+    @beartyped
+    def func(x: TensorType[3, float], y: TensorType["a", "a"]):
+        pass
+
+    func(torch.rand(3), torch.rand(2, 2))
+    with pytest.raises(BeartypeCallHintViolation):
+        func(torch.rand(3).int(), torch.rand(2, 2))
+    with pytest.raises(BeartypeCallHintViolation):
+        func(torch.rand(4), torch.rand(2, 2))
+    with pytest.raises(BeartypeCallHintViolation):
+        func(torch.rand(3), torch.rand(2, 3))
+
+
+def test_nested():
+    @beartyped
+    def func(x: Tuple[TensorType["a"], TensorType["a"]], y: List[TensorType["a"]]):
+        pass
+
+    func((torch.rand(2), torch.rand(2)), [torch.rand(2)])
+    with pytest.raises(BeartypeCallHintViolation):
+        func((torch.rand(2), torch.rand(3)), [torch.rand(2)])
+    with pytest.raises(BeartypeCallHintViolation):
+        func((torch.rand(2), torch.rand(2)), [torch.rand(3)])
+
+
+def test_optional():
+    @beartyped
+    def func(x: Optional[TensorType["a"]], y: TensorType["a"] = None):
+        pass
+
+    func(None, torch.rand(3))
+    func(torch.rand(3), None)
+    func(torch.rand(3), torch.rand(3))
+    with pytest.raises(BeartypeCallHintViolation):
+        func(torch.rand(2), torch.rand(3))
+
+
+def test_ellipsis():
+    @beartyped
+    def func(x: TensorType["b":..., "c"], y: TensorType["b":...]):
+        pass
+
+    func(torch.rand(2, 3, 4), torch.rand(2, 3))
+    with pytest.raises(BeartypeCallHintViolation):
+        func(torch.rand(2, 3, 4), torch.rand(2, 4))
+
+    @beartyped
+    def deferred(x: TensorType["b":..., "c":...], y: TensorType["b":...]):
+        pass
+
+    deferred(torch.rand(2, 3, 4), torch.rand(2))
+    with pytest.raises(BeartypeCallHintViolation):
+        deferred(torch.rand(2, 3, 4), torch.rand(3, 3, 3, 3))
+
+
+def test_nested_calls():
+    @beartyped
+    def inner(x: TensorType["a"]) -> TensorType["a"]:
+        return x
+
+    @beartyped
+    def outer(x: TensorType["a"]) -> TensorType["a"]:
+        inner(torch.rand(5))
+        return x
+
+    outer(torch.rand(2))
+
+
+def test_class():
+    @beartyped
+    class Model:
+        def forward(self, x: TensorType["a"]) -> TensorType["a"]:
+            return x[:1]
+
+        @staticmethod
+        def static(x: TensorType["a"], y: TensorType["a"]):
+            pass
+
+    model = Model()
+    model.forward(torch.rand(1))
+    with pytest.raises(BeartypeCallHintViolation):
+        model.forward(torch.rand(2))
+    with pytest.raises(BeartypeCallHintViolation):
+        Model.static(torch.rand(2), torch.rand(3))
+
+
+def test_switch():
+    @beartyped
+    def func(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    disable_checking()
+    try:
+        func(torch.rand(2), torch.rand(3))
+    finally:
+        enable_checking()
+    with pytest.raises(BeartypeCallHintViolation):
+        func(torch.rand(2), torch.rand(3))
+
+
+def test_wraps():
+    def func(x: TensorType["a"]) -> TensorType["a"]:
+        return x
+
+    checked = beartyped(func)
+    assert checked.__wrapped__ is func
+    assert checked.__annotations__ == func.__annotations__
@@ -0,0 +1,166 @@
+import pytest
+import torch
+from torchtyping import cache_info, is_named, TensorDetail, TensorType, typechecked
+from typing import Optional, Tuple
+
+a = b = x = y = None
+
+
+def test_hits_and_misses():
+    # Named `...` needs the generic checks, which are the ones that use the cache.
+    @typechecked(cache_size=8)
+    def func(x: TensorType["a":..., "b"], y: TensorType["b"]) -> TensorType["a":...]:
+        return x @ y
+
+    assert cache_info(func) is None  # not yet called
+    func(torch.rand(2, 3), torch.rand(3))
+    func(torch.rand(2, 3), torch.rand(3))
+    func(torch.rand(4, 3), torch.rand(3))
+    info = cache_info(func)
+    # Arguments and return values are cached separately.
+    assert info.hits == 2
+    assert info.misses == 4
+    assert info.evictions == 0
+    assert info.maxsize == 8
+    assert info.currsize == 4
+
+    with pytest.raises(TypeError):
+        func(torch.rand(2, 3), torch.rand(4))
+    with pytest.raises(TypeError):
+        func(torch.rand(2, 3, 1), torch.rand(3))
+    with pytest.raises(TypeError):
+        func(torch.rand(2, 3), 3)
+    assert cache_info(func).currsize == 4
+
+
+def test_no_cache():
+    @typechecked
+    def func(x: TensorType["a"]):
+        pass
+
+    func(torch.rand(2))
+    assert cache_info(func) is None
+
+
+def test_inline_not_cached():
+    # Simple annotations are checked inline, which is cheaper than the cache.
+    @typechecked(cache_size=8)
+    def func(x: TensorType["a", "b"], y: TensorType["b"]):
+        pass
+
+    func(torch.rand(2, 3), torch.rand(3))
+    assert cache_info(func) is None
+    with pytest.raises(TypeError):
+        func(torch.rand(2, 3), torch.rand(4))
+
+
+def test_eviction():
+    @typechecked(cache_size=2)
+    def func(x: TensorType["a":...]):
+        pass
+
+    for size in (1, 2, 3, 1):
+        func(torch.rand(size))
+    info = cache_info(func)
+    assert info.hits == 0
+    assert info.misses == 4
+    assert info.evictions == 2
+    assert info.currsize == 2
+    func(torch.rand(1))
+    assert cache_info(func).hits == 1
+
+
+def test_dtype_in_key():
+    @typechecked(cache_size=8)
+    def func(x: TensorType["a", float]):
+        pass
+
+    func(torch.rand(2))
+    with pytest.raises(TypeError):
+        func(torch.rand(2).double())
+
+
+def test_optional():
+    @typechecked(cache_size=8)
+    def func(x: Optional[TensorType["a"]], y: Optional[TensorType["a"]]):
+        pass
+
+    func(torch.rand(2), None)
+    func(None, torch.rand(3))
+    with pytest.raises(TypeError):
+        func(torch.rand(2), torch.rand(3))
+    func(torch.rand(2), torch.rand(2))
+
+
+def test_nested():
+    @typechecked(cache_size=8)
+    def func(x: Tuple[TensorType["a"], TensorType["b"]], y: TensorType["b"]):
+        pass
+
+    func((torch.rand(2), torch.rand(3)), torch.rand(3))
+    func((torch.rand(2), torch.rand(3)), torch.rand(3))
+    assert cache_info(func).hits == 1
+    with pytest.raises(TypeError):
+        func((torch.rand(2), torch.rand(3)), torch.rand(2))
+
+
+def test_names():
+    @typechecked(cache_size=8)
+    def func(x: TensorType["a", "b", is_named]):
+        pass
+
+    func(torch.rand(3, 2, names=("a", "b")))
+    with pytest.raises(TypeError):
+        func(torch.rand(3, 2, names=("b", "a")))
+    with pytest.raises(TypeError):
+        func(torch.rand(3, 2))
+    func(torch.rand(3, 2, names=("a", "b")))
+    assert cache_info(func).hits == 1
+
+
+def test_return_reuses_bindings():
+    @typechecked(cache_size=8)
+    def func(x: TensorType["a"], y: int) -> TensorType["a"]:
+        return torch.rand(y)
+
+    func(torch.rand(2), 2)
+    func(torch.rand(2), 2)
+    with pytest.raises(TypeError):
+        func(torch.rand(2), 3)
+    func(torch.rand(3), 3)
+
+
+class EvenDetail(TensorDetail):
+    def __repr__(self):
+        return "EvenDetail"
+
+    def check(self, tensor):
+        return bool((tensor % 2 == 0).all())
+
+    @classmethod
+    def tensor_repr(cls, tensor):
+        return "EvenDetail" if cls().check(tensor) else ""
+
+
+def test_other_details_not_cached():
+    @typechecked(cache_size=8)
+    def func(x: TensorType["a":..., EvenDetail()]):
+        pass
+
+    func(torch.tensor([0, 2]))
+    func(torch.tensor([4, 6]))
+    assert cache_info(func).hits == 1
+    with pytest.raises(TypeError):
+        func(torch.tensor([1, 2]))
+
+
+def test_class():
+    @typechecked(cache_size=8)
+    class A:
+        def method(self, x: TensorType["a":...]) -> TensorType["a":...]:
+            return x
+
+    a = A()
+    a.method(torch.rand(2))
+    a.method(torch.rand(2))
+    assert cache_info(A.method).hits == 2
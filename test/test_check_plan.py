@@ -0,0 +1,168 @@
+import pytest
+import torch
+from torchtyping import TensorType
+import typeguard
+from typeguard import typechecked
+from typing import Optional, Tuple, Union
+
+a = b = x = y = None
+
+
+def test_plan_cached():
+    @typechecked
+    def func(x: TensorType["a"], y: TensorType["a"]) -> TensorType["a"]:
+        return x + y
+
+    func(torch.rand(2), torch.rand(2))
+    plan = func.__wrapped__.__torchtyping_plan__
+    func(torch.rand(3), torch.rand(3))
+    assert func.__wrapped__.__torchtyping_plan__ is plan
+    assert plan.size_names == ["a"]
+    with pytest.raises(TypeError):
+        func(torch.rand(2), torch.rand(3))
+
+
+def test_nested_specs_compiled():
+    @typechecked
+    def func(x: Tuple[TensorType["a"], TensorType["b"]], y: TensorType["b"]):
+        pass
+
+    func((torch.rand(2), torch.rand(3)), torch.rand(3))
+    plan = func.__wrapped__.__torchtyping_plan__
+    assert sorted(plan.size_names) == ["a", "b"]
+    with pytest.raises(TypeError):
+        func((torch.rand(2), torch.rand(3)), torch.rand(2))
+
+
+def test_optional():
+    @typechecked
+    def func(x: TensorType["a"], y: Optional[TensorType["a"]] = None):
+        pass
+
+    func(torch.rand(2))
+    func(torch.rand(2), None)
+    func(torch.rand(2), torch.rand(2))
+    with pytest.raises(TypeError):
+        func(torch.rand(2), torch.rand(3))
+    with pytest.raises(TypeError):
+        func(torch.rand(2), 3)
+
+
+def test_resolution_order():
+    @typechecked
+    def func(
+        x: TensorType["x":..., "x":...],
+        y: TensorType["x":..., "y":...],
+        z: TensorType["y":...],
+    ):
+        pass
+
+    func(torch.rand(3, 4, 3, 4), torch.rand(3, 4, 5), torch.rand(5))
+    plan = func.__wrapped__.__torchtyping_plan__
+    assert plan.order == (2, 1, 0)
+    with pytest.raises(TypeError):
+        func(torch.rand(3, 4, 3, 5), torch.rand(3, 4, 5), torch.rand(5))
+
+
+def test_calling_conventions():
+    @typechecked
+    def func(x: TensorType["a"], *args: TensorType["a"], y: TensorType["a"], **kwargs):
+        pass
+
+    for _ in range(2):  # second time around takes the fast path
+        func(torch.rand(2), y=torch.rand(2))
+        func(torch.rand(2), torch.rand(2), torch.rand(2), y=torch.rand(2), z=3)
+        func(x=torch.rand(2), y=torch.rand(2))
+        with pytest.raises(TypeError):
+            func(torch.rand(2), torch.rand(3), y=torch.rand(2))
+        with pytest.raises(TypeError):
+            func(torch.rand(2), y=torch.rand(3))
+        with pytest.raises(TypeError):
+            func(torch.rand(2))
+        with pytest.raises(TypeError):
+            func(torch.rand(2), x=torch.rand(2), y=torch.rand(2))
+
+
+def test_annotations_changed():
+    @typechecked
+    def func(x: "TensorType['a']", y: "TensorType['a']"):
+        pass
+
+    func(torch.rand(2), torch.rand(2))
+    with pytest.raises(TypeError):
+        func(torch.rand(2), torch.rand(3))
+    func.__wrapped__.__annotations__["y"] = "TensorType['b']"
+    func(torch.rand(2), torch.rand(3))
+    func.__wrapped__.__annotations__ = {"x": TensorType[float]}
+    with pytest.raises(TypeError):
+        func(torch.rand(2).int(), torch.rand(3))
+
+
+def test_type_hints_cached():
+    from torchtyping.typechecker import _type_hints_cache
+
+    @typechecked
+    def func(x: "TensorType['a']") -> "TensorType['a']":
+        return x
+
+    func(torch.rand(2))
+    hints = _type_hints_cache[func.__wrapped__][-1]
+    typeguard._type_hints_map.clear()
+    func(torch.rand(2))
+    assert _type_hints_cache[func.__wrapped__][-1] is hints
+
+
+def test_lazy_error_message(monkeypatch):
+    from torchtyping import check_plan
+
+    formatted = []
+    original = check_plan._mismatch_message
+
+    def mismatch_message(*args):
+        formatted.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(check_plan, "_mismatch_message", mismatch_message)
+
+    @typechecked
+    def func(x: Union[TensorType[float], TensorType[int]]):
+        pass
+
+    # The first member of the Union doesn't match, but its message isn't needed.
+    func(torch.tensor([1]))
+    assert formatted == []
+    with pytest.raises(TypeError):
+        func(torch.tensor([True]))
+
+    spec = check_plan._CheckPlan({}).spec(TensorType["a", float])
+    with pytest.raises(TypeError) as exc_info:
+        spec.check('argument "x"', torch.tensor([1]))
+    message = (
+        "argument \"x\" must be of type TensorType['a', torch.float32], got type "
+        "TensorType[1, torch.int64] instead."
+    )
+    assert exc_info.value.args == (message,)
+    assert str(exc_info.value) == message
+    assert len(formatted) == 1
+
+
+def test_scratch_reused(monkeypatch):
+    from torchtyping import typechecker
+
+    def check_values(*args):
+        raise AssertionError("No value details to check.")
+
+    monkeypatch.setattr(typechecker, "_check_values", check_values)
+
+    @typechecked
+    def func(x: TensorType["a":...], y: TensorType["a":...]) -> TensorType["a":...]:
+        return x
+
+    for size in (2, 3):
+        func(torch.rand(size), torch.rand(size))
+    with pytest.raises(TypeError):
+        func(torch.rand(2), torch.rand(3))
+    plan = func.__wrapped__.__torchtyping_plan__
+    # The same list is reused by every call, and doesn't keep the tensors alive.
+    assert len(plan.scratch) == 1
+    assert plan.scratch[0] == [None, None]
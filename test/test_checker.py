@@ -0,0 +1,97 @@
+import pytest
+import torch
+import torchtyping
+import typeguard
+import weakref
+from torchtyping import Checker, TensorType, check
+from torchtyping import typeguard_lookup
+from typing import Tuple, Union
+
+# Silence flake8.
+b = c = None
+
+if typeguard_lookup._available:
+    _error = typeguard.TypeCheckError
+else:
+    _error = TypeError
+
+
+def test_consistent():
+    checker = Checker(x=TensorType["b", "c"], y=TensorType["b"])
+    checker(torch.rand(2, 3), torch.rand(2))
+    checker(x=torch.rand(2, 3), y=torch.rand(2))
+    checker(torch.rand(4, 3), y=torch.rand(4))
+    with pytest.raises(_error, match="Dimension 'b' of inconsistent size"):
+        checker(torch.rand(2, 3), torch.rand(3))
+    with pytest.raises(_error, match='argument "y" must be of type'):
+        checker(torch.rand(2, 3), 1)
+    with pytest.raises(_error, match='argument "x" must be of type'):
+        checker(torch.rand(2), torch.rand(2))
+
+
+def test_independent_calls():
+    checker = Checker(x=TensorType["b"])
+    checker(torch.rand(2))
+    checker(torch.rand(3))
+
+
+def test_generic():
+    checker = Checker(
+        x=Tuple[TensorType["b"], TensorType["b"]], y=Union[TensorType["b"], None]
+    )
+    checker((torch.rand(2), torch.rand(2)), None)
+    checker((torch.rand(2), torch.rand(2)), torch.rand(2))
+    with pytest.raises(_error):
+        checker((torch.rand(2), torch.rand(3)), None)
+    with pytest.raises(_error):
+        checker((torch.rand(2), torch.rand(2)), torch.rand(3))
+
+
+def test_string_annotations():
+    checker = Checker(x="TensorType['b']", y="TensorType['b']")
+    checker(torch.rand(2), torch.rand(2))
+    with pytest.raises(_error):
+        checker(torch.rand(2), torch.rand(3))
+
+
+def test_check():
+    for size in (2, 3):
+        check(x=(torch.rand(size, 3), TensorType["b", "c"]), y=(size, int))
+    check(x=(torch.rand(2), TensorType["b"]), y=(torch.rand(2), TensorType["b"]))
+    with pytest.raises(_error, match="Dimension 'b' of inconsistent size"):
+        check(x=(torch.rand(2), TensorType["b"]), y=(torch.rand(3), TensorType["b"]))
+
+
+def test_locals_not_kept():
+    # Neither a Checker nor the cache used by `check` keeps its creator's locals alive.
+    refs = []
+
+    def step():
+        big = torch.rand(10, 10)
+        refs.append(weakref.ref(big))
+        check(x=(big, TensorType["b", "c"]))
+        return Checker(x=TensorType["b"])
+
+    checker = step()
+    assert refs[0]() is None
+    checker(torch.rand(2))
+
+
+def test_check_string_annotations():
+    # String annotations are resolved in the caller's scope on every call.
+    def call(annotation_type, value):
+        Local = annotation_type  # noqa: F841
+        check(x=(value, "Local"))
+
+    call(int, 1)
+    call(str, "1")
+    with pytest.raises(_error):
+        call(int, "1")
+
+
+def test_switch():
+    checker = Checker(x=TensorType["b"], y=TensorType["b"])
+    with torchtyping.checking(enabled=False, module=__name__):
+        checker(torch.rand(2), torch.rand(3))
+    with pytest.raises(_error):
+        checker(torch.rand(2), torch.rand(3))
@@ -0,0 +1,136 @@
+import pytest
+import threading
+import torch
+import torchtyping
+from torchtyping import Checker, is_finite, TensorType, typechecked, typeguard_lookup
+from torchtyping import deferred
+
+# Silence flake8.
+b = None
+
+pytestmark = pytest.mark.skipif(
+    typeguard_lookup._available, reason="typeguard 3+ doesn't defer checks"
+)
+
+
+@pytest.fixture
+def defer():
+    torchtyping.set_deferred(True)
+    try:
+        yield
+    finally:
+        deferred._failures.clear()
+        torchtyping.set_deferred(False)
+
+
+@pytest.fixture
+def blocked(monkeypatch, defer):
+    # Holds up the background thread until the event is set.
+    event = threading.Event()
+    values_match = deferred._values_match
+
+    def wait(items):
+        if threading.current_thread() is deferred._worker:
+            event.wait()
+        return values_match(items)
+
+    monkeypatch.setattr(deferred, "_values_match", wait)
+    try:
+        yield event
+    finally:
+        event.set()
+
+
+@typechecked
+def func(x: TensorType["b", is_finite], y: TensorType["b"]) -> TensorType["b"]:
+    return y
+
+
+def _nan(size=2):
+    return torch.full((size,), float("nan"))
+
+
+def test_deferred(defer):
+    assert torchtyping.get_deferred()
+    func(_nan(), torch.rand(2))
+    with pytest.raises(TypeError) as exc_info:
+        torchtyping.flush()
+    message = str(exc_info.value)
+    assert 'argument "x"' in message
+    assert "func" in message
+    assert "not is_finite" in message
+    torchtyping.flush()
+
+
+def test_return_value(defer):
+    func(torch.rand(2), _nan())
+
+    @typechecked
+    def returns(x: TensorType["b"]) -> TensorType["b", is_finite]:
+        return x
+
+    returns(_nan())
+    with pytest.raises(TypeError, match="return value"):
+        torchtyping.flush()
+
+
+def test_next_call(blocked):
+    func(_nan(), torch.rand(2))
+    blocked.set()
+    deferred._queue.join()
+    with pytest.raises(TypeError, match="not is_finite"):
+        func(torch.rand(2), torch.rand(2))
+    func(torch.rand(2), torch.rand(2))
+
+
+def test_metadata_synchronous(defer):
+    with pytest.raises(TypeError):
+        func(_nan(2), torch.rand(3))
+    torchtyping.flush()
+
+
+def test_modified(blocked):
+    x = _nan()
+    func(x, torch.rand(2))
+    x.zero_()
+    blocked.set()
+    torchtyping.flush()
+
+
+def test_full(blocked):
+    torchtyping.set_deferred(True, max_pending=1)
+    func(_nan(), torch.rand(2))  # taken by the background thread, which then blocks
+    while deferred._queue.unfinished_tasks and not deferred._queue.empty():
+        pass
+    func(_nan(), torch.rand(2))  # queued
+    with pytest.raises(TypeError):
+        func(_nan(), torch.rand(2))  # checked immediately
+    blocked.set()
+    with pytest.raises(TypeError, match="And 1 more"):
+        torchtyping.flush()
+
+
+def test_checker(defer):
+    check = Checker(x=TensorType["b", is_finite])
+    check(_nan())
+    with pytest.raises(TypeError, match="not is_finite"):
+        torchtyping.flush()
+
+
+def test_off():
+    assert not torchtyping.get_deferred()
+    with pytest.raises(TypeError):
+        func(_nan(), torch.rand(2))
+    with pytest.raises(ValueError):
+        torchtyping.set_deferred(True, max_pending=0)
+
+
+def test_generic(defer):
+    # Named `...` isn't inlined, so this goes through the generic checks.
+    @typechecked
+    def generic(x: TensorType["b":..., is_finite]):
+        pass
+
+    generic(torch.zeros(2, 3).fill_(float("inf")))
+    with pytest.raises(TypeError, match="generic"):
+        torchtyping.flush()
@@ -2,6 +2,7 @@ import pytest
 import torch
 from torchtyping import TensorType
 from typeguard import typechecked
+from typing import Tuple
 
 
 dim1 = dim2 = dim3 = channel = None
@@ -164,3 +165,52 @@ def test_ambiguous_ellipsis():
 
     with pytest.raises(TypeError):
         func2(torch.rand(2, 2))
+
+
+def test_many_ellipsis_arguments():
+    # The only argument determining "batch" comes last.
+    num_args = 30
+    params = ", ".join(
+        f"x{i}: TensorType['batch':..., 'batch':..., {i}]" for i in range(num_args)
+    )
+    namespace = {"TensorType": TensorType}
+    exec(f"def func({params}, y: TensorType['batch':...]):\n    pass", namespace)
+    func = typechecked(namespace["func"])
+
+    func(*[torch.rand(2, 3, 2, 3, i) for i in range(num_args)], torch.rand(2, 3))
+    func(*[torch.rand(i) for i in range(num_args)], torch.rand(()))
+    with pytest.raises(TypeError):
+        func(*[torch.rand(2, 3, 2, 3, i) for i in range(num_args)], torch.rand(2, 4))
+    bad = [torch.rand(2, 3, 2, 3, i) for i in range(num_args)]
+    bad[-1] = torch.rand(2, 3, 3, 2, num_args - 1)
+    with pytest.raises(TypeError):
+        func(*bad, torch.rand(2, 3))
+
+
+def test_nested_ellipsis_resolution():
+    @typechecked
+    def func(
+        x: TensorType["dim1":..., "dim1":...],
+        y: Tuple[TensorType["dim1":..., "dim2"]],
+    ):
+        pass
+
+    func(torch.rand(3, 4, 3, 4, 5)[..., 0], (torch.rand(3, 4, 5),))
+    with pytest.raises(TypeError):
+        func(torch.rand(3, 4, 3, 5), (torch.rand(3, 4, 5),))
+    with pytest.raises(TypeError):
+        func(torch.rand(3, 4, 3, 4, 3, 4), (torch.rand(3, 4, 5),))
+
+
+def test_empty_ellipsis_group():
+    @typechecked
+    def func(
+        x: TensorType["dim1":..., 1],
+        y: TensorType["dim2":..., "dim1":..., "dim3"],
+        z: TensorType["dim2":...],
+    ):
+        pass
+
+    func(torch.rand(1), torch.rand(3, 4, 2), torch.rand(3, 4))
+    with pytest.raises(TypeError):
+        func(torch.rand(1), torch.rand(3, 2), torch.rand(3, 4))
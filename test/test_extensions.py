@@ -1,9 +1,10 @@
 import pytest
+import torchtyping
 from torch import rand, Tensor
-from torchtyping import TensorDetail, TensorType
+from torchtyping import DetailCost, TensorDetail, TensorType
 from typeguard import typechecked
 
-good = foo = None
+a = good = foo = None
 
 # Write the extension
 
@@ -63,3 +64,47 @@ def test_extensions():
         invalid_foo_one()
     with pytest.raises(TypeError):
         invalid_foo_two()
+
+
+class _Recorder(TensorDetail):
+    def __init__(self, name, calls, cost=None):
+        super().__init__()
+        self.name = name
+        self.calls = calls
+        if cost is not None:
+            self.cost = cost
+
+    def check(self, tensor: Tensor) -> bool:
+        self.calls.append(self.name)
+        return True
+
+    def __repr__(self) -> str:
+        return self.name
+
+    @classmethod
+    def tensor_repr(cls, tensor: Tensor) -> str:
+        return ""
+
+
+@pytest.mark.parametrize("decorator", [typechecked, torchtyping.typechecked])
+def test_cost_order(decorator):
+    calls = []
+    values = _Recorder("values", calls)
+    metadata = _Recorder("metadata", calls, DetailCost.METADATA)
+
+    @decorator
+    def func(x: TensorType["a", float, values, metadata], y: TensorType["a"]):
+        pass
+
+    func(rand(2), rand(2))
+    assert calls == ["metadata", "values"]
+    # The values aren't read if the dimensions are inconsistent.
+    del calls[:]
+    with pytest.raises(TypeError):
+        func(rand(2), rand(3))
+    assert "values" not in calls
+    # Nor if the dtype is wrong.
+    del calls[:]
+    with pytest.raises(TypeError):
+        func(rand(2).int(), rand(2))
+    assert "values" not in calls
@@ -0,0 +1,125 @@
+import pytest
+import sys
+import textwrap
+import torch
+from torchtyping import install_import_hook
+
+_source = '''
+"""A docstring."""
+from __future__ import annotations
+
+import typeguard
+from torchtyping import TensorType as TT, typechecked
+from typing import Optional
+
+
+def tensors(x: TT["a"], y: TT["a"]) -> TT["a"]:
+    return x
+
+
+def strings(x: "Optional[TT['a']]", y: TT["a"]):
+    pass
+
+
+def plain(x: int) -> int:
+    return x
+
+
+@typechecked
+def decorated(x: TT["a"], y: TT["a"]):
+    pass
+
+
+@typeguard.typechecked
+def with_typeguard(x: TT["a"], y: TT["a"]):
+    pass
+
+
+@typeguard.typechecked
+def plain_with_typeguard(x: int):
+    pass
+
+
+class Model:
+    def forward(self, x: TT["a"], y: TT["a"]):
+        pass
+
+    @staticmethod
+    def static(x: TT["a"], y: TT["a"]):
+        pass
+
+    def plain(self, x: int):
+        pass
+'''
+
+
+@pytest.fixture
+def package(tmp_path, request):
+    name = f"_torchtyping_hook_{request.node.name}"
+    directory = tmp_path / name
+    directory.mkdir()
+    (directory / "__init__.py").write_text("")
+    (directory / "module.py").write_text(textwrap.dedent(_source))
+    sys.path.insert(0, str(tmp_path))
+    try:
+        yield name
+    finally:
+        sys.path.remove(str(tmp_path))
+        for module_name in list(sys.modules):
+            if module_name.startswith(name):
+                del sys.modules[module_name]
+
+
+def _import(name):
+    __import__(name + ".module")
+    return sys.modules[name + ".module"]
+
+
+def _raises(func, *args):
+    try:
+        func(*args)
+    except TypeError:
+        return True
+    return False
+
+
+def test_instrument(package):
+    with install_import_hook(package):
+        module = _import(package)
+    x = torch.rand(2)
+    y = torch.rand(3)
+    assert _raises(module.tensors, x, y)
+    assert _raises(module.strings, x, y)
+    assert _raises(module.decorated, x, y)
+    assert _raises(module.with_typeguard, x, y)
+    assert _raises(module.Model().forward, x, y)
+    assert _raises(module.Model.static, x, y)
+    # Functions without tensor annotations aren't touched.
+    assert not hasattr(module.plain, "__wrapped__")
+    assert not hasattr(module.Model.plain, "__wrapped__")
+    # Nor are those that are already checked.
+    assert not hasattr(module.decorated.__wrapped__, "__wrapped__")
+
+
+def test_strip(package):
+    with install_import_hook([package], mode="strip"):
+        module = _import(package)
+    x = torch.rand(2)
+    y = torch.rand(3)
+    assert not _raises(module.decorated, x, y)
+    assert not _raises(module.with_typeguard, x, y)
+    assert not hasattr(module.decorated, "__wrapped__")
+    # typeguard is left alone on functions without tensor annotations.
+    assert _raises(module.plain_with_typeguard, "1")
+
+
+def test_uninstalled(package):
+    hook = install_import_hook(package)
+    hook.uninstall()
+    module = _import(package)
+    assert not _raises(module.tensors, torch.rand(2), torch.rand(3))
+
+
+def test_bad_mode():
+    with pytest.raises(ValueError):
+        install_import_hook("foo", mode="bar")
@@ -1,6 +1,7 @@
 import pytest
 import torch
-from torchtyping import TensorType
+from torchtyping import DtypeDetail, is_named, ShapeDetail, TensorType
+from torchtyping.tensor_details import _Dim
 from typeguard import typechecked
 from typing import Tuple
 
@@ -176,3 +177,31 @@ def test_repeat():
         func(torch.rand(4, 3, 5), torch.rand(3, 3))
     with pytest.raises(TypeError):
         func(torch.rand(4, 3, 3), torch.rand(0, 2))
+
+
+def test_interning():
+    assert TensorType["a", 3, float] is TensorType["a", 3, float]
+    assert TensorType["a":..., "b"] is TensorType["a":..., "b"]
+    assert TensorType["a", is_named] is not TensorType["a"]
+    TensorType[1]
+    with pytest.raises(TypeError):
+        TensorType[True]
+
+    # Equal, even when built separately.
+    details = TensorType["a", torch.float32].__metadata__[0]["details"]
+    assert details == (
+        ShapeDetail(dims=[_Dim(name="a", size=-1)], check_names=False),
+        DtypeDetail(dtype=torch.float32),
+    )
+    assert hash(details[0]) == hash(
+        ShapeDetail(dims=[_Dim(name="a", size=-1)], check_names=False)
+    )
+
+    original = torch.get_default_dtype()
+    try:
+        torch.set_default_dtype(torch.float64)
+        assert TensorType[float] != TensorType[torch.float32]
+        assert TensorType[float] == TensorType[torch.float64]
+    finally:
+        torch.set_default_dtype(original)
+    assert TensorType[float] is TensorType[torch.float32]
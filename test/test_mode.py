@@ -0,0 +1,178 @@
+import os
+import pytest
+import subprocess
+import sys
+import torch
+from torchtyping import (
+    checking,
+    checking_enabled,
+    disable_checking,
+    enable_checking,
+    get_mode,
+    reset_checking,
+    SampleEvery,
+    SampleNewShapes,
+    TensorType,
+    typechecked,
+)
+from torchtyping.mode import _parse_policy
+
+a = None
+
+
+def func(x: TensorType["a"], y: TensorType["a"]):
+    pass
+
+
+def test_off(monkeypatch):
+    monkeypatch.setenv("TORCHTYPING_MODE", "off")
+    assert get_mode() == "off"
+    assert typechecked(func) is func
+    assert typechecked(cache_size=4)(func) is func
+
+
+def test_on(monkeypatch):
+    monkeypatch.setenv("TORCHTYPING_MODE", "on")
+    checked = typechecked(func)
+    assert checked is not func
+    with pytest.raises(TypeError):
+        checked(torch.rand(2), torch.rand(3))
+
+
+def test_sample(monkeypatch):
+    monkeypatch.setenv("TORCHTYPING_MODE", "sample")
+    monkeypatch.setenv("TORCHTYPING_SAMPLE", "first:1")
+
+    @typechecked
+    def func2(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    with pytest.raises(TypeError):
+        func2(torch.rand(2), torch.rand(3))
+    func2(torch.rand(2), torch.rand(3))
+
+
+def test_bad_mode(monkeypatch):
+    monkeypatch.setenv("TORCHTYPING_MODE", "sometimes")
+    with pytest.raises(ValueError):
+        typechecked(func)
+
+
+def test_parse_policy():
+    assert isinstance(_parse_policy(""), SampleNewShapes)
+    policy = _parse_policy("every:10")
+    assert isinstance(policy, SampleEvery)
+    assert policy.n == 10
+    with pytest.raises(ValueError):
+        _parse_policy("every")
+    with pytest.raises(ValueError):
+        _parse_policy("never")
+
+
+# Not asserts: these run under -O.
+_script = """
+import sys, torchtyping, typeguard
+check_type = typeguard.check_type
+def func(x: torchtyping.TensorType["a"]):
+    pass
+torchtyping.patch_typeguard()
+if typeguard.check_type is not check_type:
+    sys.exit(1)
+if torchtyping.typechecked(func) is not func:
+    sys.exit(1)
+"""
+
+
+@pytest.mark.parametrize("flags,mode", [(["-O"], ""), ([], "off")])
+def test_disabled_in_subprocess(flags, mode):
+    env = dict(os.environ, TORCHTYPING_MODE=mode)
+    subprocess.run([sys.executable, *flags, "-c", _script], env=env, check=True)
+
+
+_always_script = """
+import sys, torch, torchtyping
+@torchtyping.typechecked(always=sys.argv[2] == "always")
+def func(x: torchtyping.TensorType["a"], y: torchtyping.TensorType["a"]):
+    pass
+try:
+    func(torch.rand(2), torch.rand(3))
+except TypeError:
+    checked = True
+else:
+    checked = False
+if checked != (sys.argv[1] == "checked"):
+    sys.exit(1)
+"""
+
+
+@pytest.mark.parametrize(
+    "mode,always,expected",
+    [
+        ("", "always", "checked"),
+        ("on", "always", "checked"),
+        ("off", "always", "unchecked"),
+        ("", "", "unchecked"),
+        ("on", "", "checked"),
+        ("off", "", "unchecked"),
+    ],
+)
+def test_optimisations(mode, always, expected):
+    # Under -O the default mode is "off". As with typeguard, `always=True` overrides
+    # that, but not an explicit "off"; an explicit "on" checks everything regardless.
+    env = dict(os.environ, TORCHTYPING_MODE=mode)
+    subprocess.run(
+        [sys.executable, "-O", "-c", _always_script, expected, always],
+        env=env,
+        check=True,
+    )
+
+
+def _num_checked(func):
+    try:
+        func(torch.rand(2), torch.rand(3))
+    except TypeError:
+        return 1
+    return 0
+
+
+def test_runtime_toggle():
+    checked = typechecked(func)
+    try:
+        disable_checking()
+        assert not checking_enabled()
+        assert _num_checked(checked) == 0
+        with checking():
+            assert _num_checked(checked) == 1
+        assert _num_checked(checked) == 0
+        enable_checking()
+        assert _num_checked(checked) == 1
+    finally:
+        reset_checking()
+
+
+def test_disabled_before_first_call():
+    @typechecked
+    def func2(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    with checking(False):
+        assert _num_checked(func2) == 0
+    assert _num_checked(func2) == 1
+
+
+def test_per_module():
+    checked = typechecked(func)
+    try:
+        disable_checking(__name__.rpartition(".")[0] or __name__)
+        assert not checking_enabled(__name__)
+        assert checking_enabled("some.other.module")
+        assert _num_checked(checked) == 0
+        with checking(module=sys.modules[__name__]):
+            assert _num_checked(checked) == 1
+        assert _num_checked(checked) == 0
+        with checking(False):
+            enable_checking(__name__)
+            assert _num_checked(checked) == 1
+    finally:
+        reset_checking()
+    assert _num_checked(checked) == 1
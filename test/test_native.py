@@ -0,0 +1,260 @@
+import inspect
+import pytest
+import torch
+import typeguard
+from torchtyping import (
+    function_stats,
+    is_float,
+    patch_typeguard,
+    TensorType,
+    typechecked,
+)
+from typing import Iterator, List, Optional, Tuple
+
+# Silence flake8.
+a = b = c = None
+
+
+patch_typeguard()
+
+
+def _native(func):
+    return func.__code__.co_filename.startswith("<torchtyping")
+
+
+def _error(func, *args, **kwargs):
+    try:
+        func(*args, **kwargs)
+    except TypeError as e:
+        return str(e)
+    return None
+
+
+_cases = [
+    (
+        "def f(x: TensorType['a', 'b'], y: TensorType['b']) -> TensorType['a']:\n"
+        "    return x @ y",
+        [
+            (torch.rand(2, 3), torch.rand(3)),
+            (torch.rand(2, 3), torch.rand(4)),
+            (torch.rand(2, 3), 1),
+            (torch.rand(2), torch.rand(2)),
+        ],
+    ),
+    (
+        "def f(x: TensorType[3, float], n: int = 1):\n    pass",
+        [
+            (torch.rand(3),),
+            (torch.rand(3).int(),),
+            (torch.rand(4),),
+            (torch.rand(3), "n"),
+        ],
+    ),
+    (
+        "def f(x: TensorType['a'] = None, y: TensorType['a'] = None)"
+        " -> TensorType['a']:\n"
+        "    return torch.rand(4)",
+        [(), (torch.rand(4),), (None, torch.rand(3)), (torch.rand(3), None)],
+    ),
+    (
+        "def f(x: TensorType[..., 'c'], y: TensorType['c']):\n    pass",
+        [(torch.rand(2, 3), torch.rand(3)), (torch.rand(2, 3), torch.rand(4))],
+    ),
+    (
+        "def f(x: TensorType['a': 'b', 'b']):\n    pass",
+        [(torch.rand(2, 2),), (torch.rand(2, 3),)],
+    ),
+    (
+        "def f(x: TensorType['b': ..., 'c'], y: TensorType['b': ...]):\n    pass",
+        [(torch.rand(2, 3), torch.rand(2)), (torch.rand(2, 3), torch.rand(3))],
+    ),
+    (
+        "def f(x: Tuple[TensorType['a'], TensorType['a']]):\n    pass",
+        [((torch.rand(2), torch.rand(2)),), ((torch.rand(2), torch.rand(3)),)],
+    ),
+    (
+        "def f(x: TensorType[is_float]) -> int:\n    return 'x'",
+        [(torch.rand(2),), (torch.rand(2).long(),)],
+    ),
+]
+
+
+@pytest.mark.parametrize("source,calls", _cases)
+def test_same_as_typeguard(source, calls):
+    namespace = dict(TensorType=TensorType, Tuple=Tuple, is_float=is_float, torch=torch)
+    exec(source, namespace)
+    native = typechecked(namespace["f"])
+    exec(source, namespace)
+    generic = typeguard.typechecked(namespace["f"])
+    assert _native(native)
+    for args in calls:
+        assert _error(native, *args) == _error(generic, *args)
+
+
+_in_place = [
+    (
+        "def f(x: TensorType['a', 'b']) -> TensorType['a', 'b']:\n"
+        "    x.t_()\n"
+        "    return x",
+        lambda: torch.rand(2, 3),
+    ),
+    (
+        "def f(x: TensorType['a']) -> TensorType['a']:\n"
+        "    x.unsqueeze_(0)\n"
+        "    return torch.rand(1)",
+        lambda: torch.rand(3),
+    ),
+]
+
+
+@pytest.mark.parametrize("source,make_arg", _in_place)
+def test_return_after_in_place(source, make_arg):
+    # The return value is checked against the arguments as they were passed, not as
+    # the function left them.
+    namespace = dict(TensorType=TensorType, torch=torch)
+    exec(source, namespace)
+    native = typechecked(namespace["f"])
+    exec(source, namespace)
+    generic = typeguard.typechecked(namespace["f"])
+    error = _error(native, make_arg())
+    assert error is not None
+    assert not error.startswith('type of argument "x"')
+    assert error == _error(generic, make_arg())
+
+
+def test_calling_conventions():
+    def func(
+        x: TensorType["a"],
+        y: TensorType["a"] = None,
+        *args: TensorType["a"],
+        k: TensorType["a"],
+        n: int = 3,
+        **kwargs: TensorType["a"],
+    ) -> int:
+        return n + len(args) + len(kwargs)
+
+    checked = typechecked(func)
+    assert inspect.signature(checked) == inspect.signature(func)
+    assert checked.__wrapped__ is func
+    assert checked.__name__ == "func"
+    x = torch.rand(2)
+    assert checked(x, k=x) == 3
+    assert checked(x, x, x, x, k=x, n=1, z=x) == 4
+    assert checked(x=x, y=None, k=x) == 3
+    with pytest.raises(TypeError):
+        checked(x, x, torch.rand(3), k=x)
+    with pytest.raises(TypeError):
+        checked(x, k=x, z=torch.rand(3))
+    with pytest.raises(TypeError):
+        checked(x, k=x, n="3")
+    with pytest.raises(TypeError):
+        checked(x)  # missing k
+
+
+def test_optional_binding():
+    @typechecked
+    def func(x: Optional[TensorType["a"]], y: TensorType["a"]) -> TensorType["a"]:
+        return y
+
+    func(None, torch.rand(3))
+    func(torch.rand(3), torch.rand(3))
+    with pytest.raises(TypeError):
+        func(torch.rand(2), torch.rand(3))
+
+
+def test_forward_reference():
+    @typechecked
+    def func(x: "Later") -> TensorType["a"]:
+        return x.tensor
+
+    class Later:
+        def __init__(self, tensor):
+            self.tensor = tensor
+
+    with pytest.raises(NameError):
+        func(Later(torch.rand(2)))
+    globals()["Later"] = Later
+    try:
+        func(Later(torch.rand(2)))
+        with pytest.raises(TypeError):
+            func(Later(torch.rand(2, 2)))
+    finally:
+        del globals()["Later"]
+
+
+def test_class():
+    @typechecked
+    class Model:
+        def forward(self, x: TensorType["a"]) -> TensorType["a"]:
+            return x
+
+        @staticmethod
+        def static(x: TensorType["a"], y: TensorType["a"]):
+            pass
+
+        @classmethod
+        def cls(cls, x: TensorType["a"], y: TensorType["a"]):
+            pass
+
+        @property
+        def prop(self) -> TensorType["a"]:
+            return torch.rand(2, 2)
+
+    model = Model()
+    model.forward(torch.rand(2))
+    with pytest.raises(TypeError):
+        model.forward(torch.rand(2, 2))
+    with pytest.raises(TypeError):
+        Model.static(torch.rand(2), torch.rand(3))
+    with pytest.raises(TypeError):
+        Model.cls(torch.rand(2), torch.rand(3))
+    with pytest.raises(TypeError):
+        model.prop
+
+
+def test_typeguard_fallback():
+    @typechecked
+    def generator(x: TensorType["a"]) -> Iterator[TensorType["a"]]:
+        yield x
+        yield torch.rand(2, 2)
+
+    assert not _native(generator)
+    values = generator(torch.rand(2))
+    next(values)
+    with pytest.raises(TypeError):
+        next(values)
+
+    @typechecked
+    def returns_iterator(x: TensorType["a"]) -> Iterator[int]:
+        return (value for value in [1, "2"])
+
+    values = returns_iterator(torch.rand(2))
+    next(values)
+    with pytest.raises(TypeError):
+        next(values)
+
+    @typechecked
+    def reserved(_tt_x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    assert not _native(reserved)
+    with pytest.raises(TypeError):
+        reserved(torch.rand(2), torch.rand(3))
+
+
+def test_stats():
+    @typechecked
+    def func(x: TensorType["a"], y: List[int]) -> TensorType["a"]:
+        return x
+
+    assert function_stats(func) is None
+    func(torch.rand(2), [1])
+    with pytest.raises(TypeError):
+        func(torch.rand(2, 2), [1])
+    with pytest.raises(TypeError):
+        func(torch.rand(2), ["1"])
+    stats = function_stats(func)
+    assert stats["calls"] == 3
+    assert stats["checked"] == 3
+    assert stats["failures"] == 2
+    assert stats["check_time_ns"] > 0
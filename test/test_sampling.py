@@ -0,0 +1,152 @@
+import pytest
+import torch
+from torchtyping import (
+    budget_info,
+    SampleBudget,
+    SampleEvery,
+    SampleFirst,
+    SampleNewShapes,
+    SampleRandom,
+    set_sampling,
+    TensorType,
+    typechecked,
+)
+import time
+import typeguard
+
+
+a = None
+
+
+def _num_checked(func, n):
+    # Calls `func` `n` times with bad arguments, and counts how many calls are checked.
+    num_checked = 0
+    for _ in range(n):
+        try:
+            func(torch.rand(2), torch.rand(3))
+        except TypeError:
+            num_checked += 1
+    return num_checked
+
+
+def test_first():
+    @typechecked(sample=SampleFirst(3))
+    def func(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    assert _num_checked(func, 10) == 3
+
+
+def test_every():
+    @typechecked(sample=SampleEvery(4))
+    def func(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    assert _num_checked(func, 10) == 3
+
+
+def test_random():
+    @typechecked(sample=SampleRandom(0.5, seed=0))
+    def func(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    assert 20 < _num_checked(func, 100) < 80
+
+    @typechecked(sample=SampleRandom(0))
+    def func2(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    assert _num_checked(func2, 10) == 0
+
+    with pytest.raises(ValueError):
+        SampleRandom(2)
+
+
+def test_new_shapes():
+    @typechecked(sample=SampleNewShapes())
+    def func(x: TensorType["a"], y: TensorType["a"]) -> TensorType["a"]:
+        return x
+
+    assert _num_checked(func, 10) == 1
+    with pytest.raises(TypeError):
+        func(torch.rand(2), torch.rand(4))
+    func(torch.rand(2), torch.rand(2))
+    func(torch.rand(5), y=torch.rand(5))
+    with pytest.raises(TypeError):
+        func(torch.rand(5), y=torch.rand(6))
+    with pytest.raises(TypeError):
+        func(torch.rand(2), torch.rand(3).int())
+
+
+def test_return_not_checked():
+    @typechecked(sample=SampleFirst(1))
+    def func(x: TensorType["a"]) -> TensorType["a"]:
+        return torch.rand(3)
+
+    with pytest.raises(TypeError):
+        func(torch.rand(2))
+    func(torch.rand(2))
+
+
+def test_per_function():
+    @typechecked(sample=SampleFirst(1))
+    def func(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    @typechecked(sample=SampleFirst(1))
+    def func2(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    assert _num_checked(func, 5) == 1
+    assert _num_checked(func2, 5) == 1
+
+
+def test_global_default():
+    @typeguard.typechecked
+    def func(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    @typechecked(sample=SampleFirst(5))
+    def func2(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    try:
+        set_sampling(SampleEvery(2))
+        assert _num_checked(func, 10) == 5
+        assert _num_checked(func2, 10) == 5
+    finally:
+        set_sampling(None)
+    assert _num_checked(func, 10) == 10
+
+
+def test_budget():
+    @typechecked(sample=SampleBudget(1e-6, min_rate=0.01))
+    def func(x: TensorType["a"], y: TensorType["a"]) -> TensorType["a"]:
+        return x
+
+    assert budget_info(func) is None
+    for _ in range(1000):
+        func(torch.rand(2), torch.rand(2))
+    info = budget_info(func)
+    assert info.rate == 0.01
+    assert info.check_time > 0
+    assert info.func_time > 0
+    assert info.overhead == info.rate * info.check_time / info.func_time
+    assert 5 <= _num_checked(func, 1000) <= 15
+
+    @typechecked(sample=SampleBudget(10))
+    def slow(x: TensorType["a"], y: TensorType["a"]) -> TensorType["a"]:
+        time.sleep(0.001)
+        return x
+
+    for _ in range(5):
+        slow(torch.rand(2), torch.rand(2))
+    assert budget_info(slow).rate == 1
+    assert budget_info(slow).overhead < 1
+
+    @typechecked(sample=SampleFirst(1))
+    def other(x: TensorType["a"]):
+        pass
+
+    other(torch.rand(2))
+    assert budget_info(other) is None
@@ -0,0 +1,84 @@
+import pytest
+import subprocess
+import sys
+import torch
+import typeguard
+from torchtyping import TensorType, typechecked
+from torchtyping import typechecker
+from torchtyping.typechecker import _copy_typeguard, _scoped_patch
+from typing import Iterator, Tuple
+
+# Silence flake8.
+a = None
+
+
+def test_copy_is_independent():
+    original = dict(vars(typeguard))
+    namespace = _copy_typeguard()
+    assert vars(typeguard) == original
+    assert namespace["check_tuple"] is not typeguard.check_tuple
+    assert namespace["check_tuple"].__globals__ is namespace
+    assert namespace["origin_type_checkers"][tuple] is namespace["check_tuple"]
+    # Copied from the unpatched typeguard, even if typeguard itself has been patched.
+    if typechecker._global_patch is None:
+        call_memo = typeguard._CallMemo
+    else:
+        call_memo = typechecker._global_patch.originals["_CallMemo"]
+    assert namespace["_CallMemo"].__bases__ == (call_memo,)
+    assert namespace["typechecked"].__globals__ is namespace
+
+
+def test_typeguard_not_used(monkeypatch):
+    # Functions checked with torchtyping.typechecked never go through typeguard's own
+    # (possibly patched) functions.
+    def fail(*args, **kwargs):
+        raise AssertionError
+
+    patch = _scoped_patch()
+    for name in ("check_type", "check_argument_types", "check_return_type"):
+        monkeypatch.setattr(typeguard, name, fail)
+
+    @typechecked
+    def func(x: Tuple[TensorType["a"], TensorType["a"]]) -> TensorType["a"]:
+        return x[0]
+
+    @typechecked
+    def generator(x: TensorType["a"]) -> Iterator[TensorType["a"]]:
+        yield x
+        yield torch.rand(2, 2)
+
+    func((torch.rand(2), torch.rand(2)))
+    with pytest.raises(TypeError):
+        func((torch.rand(2), torch.rand(3)))
+    values = generator(torch.rand(2))
+    next(values)
+    with pytest.raises(TypeError):
+        next(values)
+    assert patch.namespace["check_type"] is not fail
+
+
+_script = """
+import torch
+import typeguard
+from torchtyping import TensorType, typechecked
+
+original = typeguard.check_type
+
+
+@typechecked
+def func(x: TensorType["a"], y: TensorType["a"]):
+    pass
+
+
+try:
+    func(torch.rand(2), torch.rand(3))
+except TypeError:
+    pass
+else:
+    raise AssertionError
+assert typeguard.check_type is original
+"""
+
+
+def test_typeguard_unpatched_in_subprocess():
+    subprocess.run([sys.executable, "-c", _script], check=True)
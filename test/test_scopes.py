@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+import threading
+import torch
+import typeguard
+from torchtyping import Checker, dims, TensorType, typechecked
+from torchtyping import typeguard_lookup
+
+# Silence flake8.
+batch = channels = None
+
+if typeguard_lookup._available:
+    _error = typeguard.TypeCheckError
+else:
+    _error = TypeError
+
+
+@typechecked
+def _sum(x: TensorType["batch", "channels"]) -> TensorType["batch"]:
+    return x.sum(1)
+
+
+@typechecked(cache_size=8)
+def _cached(x: TensorType["batch", "channels"]):
+    pass
+
+
+@typechecked
+def _pair(x: TensorType["batch"], y: TensorType["batch"]):
+    pass
+
+
+def test_unscoped():
+    _sum(torch.rand(2, 3))
+    _sum(torch.rand(4, 3))
+
+
+def test_prebound():
+    with dims(batch=2):
+        _sum(torch.rand(2, 3))
+        _cached(torch.rand(2, 3))
+        with pytest.raises(_error, match="Dimension 'batch'"):
+            _sum(torch.rand(3, 3))
+        with pytest.raises(_error, match="Dimension 'batch'"):
+            _cached(torch.rand(3, 3))
+        with pytest.raises(_error, match="Dimension 'batch'"):
+            Checker(x=TensorType["batch"])(torch.rand(3))
+    _sum(torch.rand(3, 3))
+    _cached(torch.rand(3, 3))
+
+
+def test_accumulate():
+    with dims("batch", channels=...):
+        _sum(torch.rand(4, 3))
+        _pair(torch.rand(4), torch.rand(4))
+        with pytest.raises(_error):
+            _sum(torch.rand(5, 3))
+        with pytest.raises(_error):
+            _sum(torch.rand(4, 2))
+        with pytest.raises(_error):
+            _pair(torch.rand(5), torch.rand(5))
+
+
+def test_nested():
+    with dims("batch"):
+        with dims(batch=7, channels=...):
+            _sum(torch.rand(7, 1))
+            with pytest.raises(_error):
+                _sum(torch.rand(7, 2))
+        # Bound in the inner scope, which doesn't apply any more.
+        _sum(torch.rand(4, 2))
+        with dims("batch"):
+            # Shares the outer binding.
+            with pytest.raises(_error):
+                _sum(torch.rand(5, 2))
+            _sum(torch.rand(4, 3))
+        with dims("channels"):
+            _sum(torch.rand(4, 5))
+        _sum(torch.rand(4, 6))
+
+
+def test_failed_call_binds_nothing():
+    with dims("batch"):
+        with pytest.raises(_error):
+            _sum(torch.rand(4))
+        _sum(torch.rand(5, 2))
+
+
+def test_tasks():
+    async def task(size):
+        with dims("batch"):
+            _sum(torch.rand(size, 1))
+            await asyncio.sleep(0)
+            _sum(torch.rand(size, 1))
+
+    async def main():
+        await asyncio.gather(task(1), task(2), task(3))
+
+    asyncio.run(main())
+
+
+def test_threads():
+    errors = []
+
+    def thread(size):
+        try:
+            with dims("batch"):
+                for _ in range(100):
+                    _sum(torch.rand(size, 1))
+        except _error as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=thread, args=(size,)) for size in range(1, 5)]
+    with dims(batch=7):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert not errors
+
+
+def test_bad_size():
+    with pytest.raises(TypeError):
+        with dims(batch="3"):
+            pass
+    with pytest.raises(TypeError):
+        with dims(batch=-1):
+            pass
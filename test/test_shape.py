@@ -474,3 +474,21 @@ def test_any_dim():
         x = _any4any_dim_checker(x)
     with pytest.raises(TypeError):
         _34any_dim_checker(x)
+
+
+class _NoNamesTensor(torch.Tensor):
+    @property
+    def names(self):
+        raise AssertionError("names should not be accessed")
+
+
+def test_names_not_accessed():
+    @typeguard.typechecked
+    def func(x: TensorType[..., "a", 3], y: TensorType["a"]):
+        pass
+
+    x = torch.rand(4, 2, 3).as_subclass(_NoNamesTensor)
+    y = torch.rand(2).as_subclass(_NoNamesTensor)
+    func(x, y)
+    with pytest.raises(TypeError):
+        func(x, y[:1])
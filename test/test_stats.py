@@ -0,0 +1,99 @@
+import io
+import json
+import pytest
+import torch
+from torchtyping import (
+    dump_stats,
+    function_stats,
+    reset_stats,
+    SampleEvery,
+    stats_snapshot,
+    TensorType,
+    typechecked,
+)
+
+from typing import Tuple
+
+a = None
+
+
+def test_function_stats():
+    @typechecked(cache_size=4)
+    def func(x: TensorType["a":...], y: TensorType["a":...]) -> TensorType["a":...]:
+        return x
+
+    assert function_stats(func) is None
+    func(torch.rand(2), torch.rand(2))
+    func(torch.rand(2), torch.rand(2))
+    with pytest.raises(TypeError):
+        func(torch.rand(2), torch.rand(3))
+    stats = function_stats(func)
+    assert stats["calls"] == 3
+    assert stats["checked"] == 3
+    assert stats["cache_hits"] == 1
+    assert stats["failures"] == 1
+    assert stats["check_time_ns"] > 0
+
+
+def test_reset_stats():
+    @typechecked(cache_size=4)
+    def func(x: Tuple[TensorType["a"], int]) -> TensorType["a"]:
+        return x[0]
+
+    for _ in range(3):
+        func((torch.rand(2), 1))
+    assert function_stats(func)["cache_hits"] == 2
+    reset_stats()
+    assert all(value == 0 for value in function_stats(func).values())
+
+
+def test_return_failure():
+    @typechecked(sample=SampleEvery(2))
+    def func(x: TensorType["a"]) -> TensorType["a"]:
+        return torch.rand(3)
+
+    for _ in range(3):
+        try:
+            func(torch.rand(2))
+        except TypeError:
+            pass
+    stats = function_stats(func)
+    assert stats["calls"] == 3
+    assert stats["checked"] == 2
+    assert stats["failures"] == 2
+
+
+def _make():
+    @typechecked
+    def closure(x: TensorType["a"]):
+        pass
+
+    return closure
+
+
+def test_snapshot_and_dump(tmp_path):
+    reset_stats()
+    funcs = [_make(), _make()]
+    for func in funcs:
+        func(torch.rand(2))
+    snapshot = stats_snapshot()
+    name = next(name for name in snapshot if name.endswith("_make.<locals>.closure"))
+    assert snapshot[name]["calls"] == 2
+
+    path = str(tmp_path / "stats.json")
+    dump_stats(path)
+    with open(path) as f:
+        assert json.load(f)[name]["calls"] == 2
+
+    file = io.StringIO()
+    dump_stats(file, format="prometheus")
+    text = file.getvalue()
+    assert "# TYPE torchtyping_calls_total counter" in text
+    assert f'torchtyping_calls_total{{function="{name}"}} 2' in text
+    assert "torchtyping_check_seconds_total" in text
+
+    with pytest.raises(ValueError):
+        dump_stats(file, format="csv")
+
+    reset_stats()
+    assert function_stats(funcs[0])["calls"] == 0
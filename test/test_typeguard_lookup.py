@@ -0,0 +1,108 @@
+import pytest
+import torch
+import torchtyping
+import typeguard
+from torchtyping import patch_typeguard, TensorType
+from torchtyping import typeguard_lookup
+from typing import Tuple, Union
+
+# Silence flake8.
+a = b = c = None
+
+
+pytestmark = pytest.mark.skipif(
+    not typeguard_lookup._available, reason="requires typeguard 3 or later"
+)
+
+if typeguard_lookup._available:
+    patch_typeguard()
+    _error = typeguard.TypeCheckError
+
+    @typeguard.typechecked
+    def _matmul(x: TensorType["a", "b"], y: TensorType["b"]) -> TensorType["a"]:
+        return x @ y
+
+    @typeguard.typechecked
+    def _pair(x: Tuple[TensorType["a"], TensorType["a"]]):
+        pass
+
+    # Not Optional[...], which some versions of typeguard don't check at all.
+    @typeguard.typechecked
+    def _optional(x: Union[TensorType["a"], None], y: TensorType["a"]):
+        pass
+
+    @typeguard.typechecked
+    def _ellipsis(x: TensorType["b":..., "c"], y: TensorType["b":...]):
+        pass
+
+    @typeguard.typechecked
+    def _float(x: TensorType[float]):
+        pass
+
+
+def test_dims():
+    _matmul(torch.rand(2, 3), torch.rand(3))
+    # Sizes are only consistent within a single call.
+    _matmul(torch.rand(4, 5), torch.rand(5))
+    with pytest.raises(_error):
+        _pair((torch.rand(2), torch.rand(3)))
+    with pytest.raises(_error):
+        _matmul(torch.rand(2), torch.rand(2))
+
+
+def test_nested():
+    _pair((torch.rand(2), torch.rand(2)))
+    with pytest.raises(_error):
+        _pair((torch.rand(2), torch.rand(3)))
+
+
+def test_optional():
+    _optional(None, torch.rand(3))
+    _optional(torch.rand(3), torch.rand(3))
+    with pytest.raises(_error):
+        _optional(torch.rand(2), torch.rand(3))
+
+
+def test_ellipsis():
+    _ellipsis(torch.rand(2, 3, 4), torch.rand(2, 3))
+    with pytest.raises(_error):
+        _ellipsis(torch.rand(2, 3, 4), torch.rand(2, 4))
+
+
+def test_dtype():
+    _float(torch.rand(2))
+    with pytest.raises(_error):
+        _float(torch.rand(2).int())
+    with pytest.raises(_error):
+        _float(1)
+
+
+def test_check_type():
+    typeguard.check_type(torch.rand(2), TensorType["a"])
+    with pytest.raises(_error):
+        typeguard.check_type(torch.rand(2, 2), TensorType["a"])
+
+
+def test_switch():
+    @torchtyping.typechecked
+    def func(x: TensorType["a"], y: TensorType["a"]):
+        pass
+
+    with torchtyping.checking(False):
+        func(torch.rand(2), torch.rand(3))
+        _pair((torch.rand(2), torch.rand(3)))
+    with torchtyping.checking(False, module=__name__):
+        func(torch.rand(2), torch.rand(3))
+    with pytest.raises(_error):
+        func(torch.rand(2), torch.rand(3))
+
+
+@pytest.mark.parametrize(
+    "options", [dict(cache_size=4), dict(sample=torchtyping.SampleEvery(2))]
+)
+def test_unsupported_options(options):
+    def func(x: TensorType["a"]):
+        pass
+
+    with pytest.warns(UserWarning, match="require typeguard<3"):
+        torchtyping.typechecked(func, **options)
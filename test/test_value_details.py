@@ -0,0 +1,282 @@
+import pytest
+import torch
+import torchtyping
+from torchtyping import (
+    Checker,
+    is_finite,
+    is_nonnegative,
+    is_normalized,
+    NormalizedDetail,
+    RangeDetail,
+    TensorDetail,
+    TensorType,
+    typechecked,
+    typeguard_lookup,
+)
+from torchtyping import value_details
+import typeguard
+
+_error = typeguard.TypeCheckError if typeguard_lookup._available else TypeError
+
+# Silence flake8.
+b = c = None
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64, torch.complex64])
+def test_finite(dtype):
+    @typechecked
+    def func(x: TensorType["b", is_finite]):
+        pass
+
+    func(torch.rand(3).to(dtype))
+    func(torch.rand(0).to(dtype))
+    for bad in (float("nan"), float("inf"), -float("inf")):
+        x = torch.rand(3).to(dtype)
+        x[1] = bad
+        with pytest.raises(_error):
+            func(x)
+
+
+def test_finite_integer():
+    assert is_finite.check(torch.arange(3))
+    assert is_finite.check(torch.tensor([True, False]))
+
+
+def test_range():
+    @typechecked
+    def func(x: TensorType[RangeDetail(min=-1, max=1)]):
+        pass
+
+    func(torch.tensor([-1.0, 0.0, 1.0]))
+    func(torch.tensor([0, 1]))
+    with pytest.raises(_error):
+        func(torch.tensor([-1.5, 0.0]))
+    with pytest.raises(_error):
+        func(torch.tensor([0.0, 2.0]))
+    with pytest.raises(_error):
+        func(torch.tensor([0.0, float("nan")]))
+    with pytest.raises(_error):
+        func(torch.zeros(2, dtype=torch.complex64))
+
+
+def test_nonnegative():
+    assert is_nonnegative == RangeDetail(min=0)
+    assert is_nonnegative.check(torch.tensor([0.0, 3.0]))
+    assert not is_nonnegative.check(torch.tensor([-0.1, 3.0]))
+    assert not is_nonnegative.check(torch.tensor([float("nan")]))
+
+
+def test_normalized():
+    @typechecked
+    def func(x: TensorType["b", "c", is_nonnegative, is_normalized]):
+        pass
+
+    func(torch.softmax(torch.rand(4, 3), dim=-1))
+    with pytest.raises(_error):
+        func(torch.rand(4, 3) + 1)
+    with pytest.raises(_error):
+        func(torch.softmax(torch.rand(4, 3), dim=0))
+
+    detail = NormalizedDetail(dim=0, atol=1e-3)
+    assert detail.check(torch.softmax(torch.rand(4, 3), dim=0))
+    assert not detail.check(torch.softmax(torch.rand(4, 3), dim=1))
+    assert not detail.check(torch.tensor(1.0))
+    assert not detail.check(torch.full((2, 2), float("nan")))
+
+
+def test_repr():
+    assert repr(is_finite) == "is_finite"
+    assert repr(is_nonnegative) == "RangeDetail(min=0)"
+    assert repr(is_normalized) == "is_normalized"
+    assert repr(RangeDetail(max=1.5)) == "RangeDetail(max=1.5)"
+    assert repr(NormalizedDetail(dim=0)) == "NormalizedDetail(dim=0, atol=1e-05)"
+    assert RangeDetail.tensor_repr(torch.tensor([-1.0, 2.5])) == (
+        "RangeDetail(min=-1, max=2.5)"
+    )
+
+
+def test_error_message():
+    @typechecked
+    def func(x: TensorType["b", is_finite]):
+        pass
+
+    with pytest.raises(_error) as exc_info:
+        func(torch.tensor([1.0, float("nan")]))
+    assert "not is_finite" in str(exc_info.value)
+
+
+@pytest.mark.skipif(
+    typeguard_lookup._available,
+    reason="typeguard 3+ checks each argument in turn, as it reaches it",
+)
+def test_metadata_checked_first(monkeypatch):
+    # A tensor of the wrong shape is rejected without reading any values.
+    def fail(*args, **kwargs):
+        raise AssertionError
+
+    @typechecked
+    def func(x: TensorType["b", is_finite], y: TensorType["b"]):
+        pass
+
+    monkeypatch.setattr(value_details, "_reduce", fail)
+    with pytest.raises(_error):
+        func(torch.rand(2), torch.rand(3))
+
+
+def test_fused(monkeypatch):
+    # is_finite and a range share a single reduction of each tensor, and both
+    # arguments are reduced before either is judged.
+    calls = []
+    reduce = value_details._reduce
+
+    def counted(tensor, key):
+        calls.append(key)
+        return reduce(tensor, key)
+
+    monkeypatch.setattr(value_details, "_reduce", counted)
+
+    @typechecked
+    def func(
+        x: TensorType["b", is_finite, is_nonnegative, RangeDetail(max=1)],
+        y: TensorType["b", "c", is_normalized],
+    ):
+        pass
+
+    func(torch.rand(2), torch.softmax(torch.rand(2, 3), dim=-1))
+    assert sorted(calls, key=str) == [("sums", -1), value_details._minmax]
+
+
+def test_checker():
+    check = Checker(x=TensorType["b", is_finite], y=TensorType["b", is_nonnegative])
+    check(torch.rand(2), torch.rand(2))
+    with pytest.raises(_error):
+        check(torch.rand(2), -torch.rand(2))
+    with pytest.raises(_error):
+        check(torch.full((2,), float("inf")), torch.rand(2))
+
+
+def test_values_match():
+    items = [
+        (None, (is_finite,)),
+        (torch.rand(2), (is_finite,)),
+        (torch.rand(2, 2), (is_normalized,)),
+        (-torch.rand(2), (is_nonnegative,)),
+    ]
+    assert value_details._values_match(items) == 2
+    assert value_details._values_match(items[:2]) == -1
+    assert value_details._values_match(items[3:]) == 0
+
+
+def test_no_grad(monkeypatch):
+    # Reading the values doesn't build an autograd graph.
+    results = []
+    reduce = value_details._reduce
+
+    def recorded(tensor, key):
+        result = reduce(tensor, key)
+        results.extend(result)
+        return result
+
+    monkeypatch.setattr(value_details, "_reduce", recorded)
+    torchtyping.set_value_cache(None)
+    try:
+        x = torch.rand(2, requires_grad=True)
+        assert value_details._values_match([(x, (is_finite,))]) == -1
+    finally:
+        torchtyping.set_value_cache()
+    assert results
+    assert not any(result.requires_grad for result in results)
+    assert torch.is_grad_enabled()
+
+
+@pytest.fixture
+def reductions(monkeypatch):
+    calls = []
+    reduce = value_details._reduce
+
+    def counted(tensor, key):
+        calls.append(key)
+        return reduce(tensor, key)
+
+    monkeypatch.setattr(value_details, "_reduce", counted)
+    torchtyping.set_value_cache()
+    try:
+        yield calls
+    finally:
+        torchtyping.set_value_cache()
+
+
+def test_cache(reductions):
+    @typechecked
+    def func(x: TensorType["b", is_finite]):
+        pass
+
+    x = torch.rand(3)
+    func(x)
+    func(x)
+    assert len(reductions) == 1
+    x.add_(1)
+    func(x)
+    assert len(reductions) == 2
+    x[0] = float("nan")
+    for _ in range(2):
+        with pytest.raises(_error):
+            func(x)
+    assert torchtyping.value_cache_info().currsize == 1
+    del x
+    assert torchtyping.value_cache_info().currsize == 0
+
+
+def test_cache_views(reductions):
+    x = torch.rand(3)
+    assert is_finite.check(x)
+    x[1:].fill_(float("inf"))  # shares x's version counter
+    assert not is_finite.check(x)
+
+
+def test_cache_per_details(reductions):
+    x = torch.rand(3)
+    assert is_finite.check(x)
+    assert not RangeDetail(min=2).check(x)
+    assert not RangeDetail(min=2).check(x)
+    assert len(reductions) == 3
+
+
+def test_cache_custom_details():
+    # Custom details may depend on more than the values, so aren't cached.
+    checks = []
+
+    class Custom(TensorDetail):
+        def check(self, tensor):
+            checks.append(tensor)
+            return True
+
+        def __repr__(self):
+            return "Custom()"
+
+        @classmethod
+        def tensor_repr(cls, tensor):
+            return ""
+
+    x = torch.rand(3)
+    for _ in range(2):
+        assert value_details._values_match([(x, (is_finite, Custom()))]) == -1
+    assert len(checks) == 2
+
+
+def test_cache_off(reductions):
+    torchtyping.set_value_cache(None)
+    assert torchtyping.value_cache_info() is None
+    x = torch.rand(3)
+    assert is_finite.check(x)
+    assert is_finite.check(x)
+    assert len(reductions) == 2
+
+
+@pytest.mark.skipif(not hasattr(torch, "inference_mode"), reason="torch<1.9")
+def test_cache_inference(reductions):
+    with torch.inference_mode():
+        x = torch.rand(3)
+    assert is_finite.check(x)
+    assert is_finite.check(x)
+    assert len(reductions) == 2
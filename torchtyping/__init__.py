@@ -1,4 +1,5 @@
 from .tensor_details import (
+    DetailCost,
     DtypeDetail,
     is_float,
     is_named,
@@ -7,7 +8,46 @@ from .tensor_details import (
     TensorDetail,
 )
 
+from .beartype_backend import beartyped
+from .checker import check, Checker
+from .deferred import flush, get_deferred, set_deferred
+from .importhook import install_import_hook
+from .mode import (
+    checking,
+    checking_enabled,
+    disable_checking,
+    enable_checking,
+    get_mode,
+    reset_checking,
+)
+from .sampling import (
+    get_sampling,
+    SampleBudget,
+    SampleEvery,
+    SampleFirst,
+    SampleNewShapes,
+    SampleRandom,
+    SamplingPolicy,
+    set_sampling,
+)
+from .scopes import dims
+from .stats import dump_stats, reset_stats, stats_snapshot
 from .tensor_type import TensorType
-from .typechecker import patch_typeguard
+from .value_details import (
+    is_finite,
+    is_nonnegative,
+    is_normalized,
+    NormalizedDetail,
+    RangeDetail,
+    set_value_cache,
+    value_cache_info,
+)
+from .typechecker import (
+    budget_info,
+    cache_info,
+    function_stats,
+    patch_typeguard,
+    typechecked,
+)
 
 __version__ = "0.1.5"
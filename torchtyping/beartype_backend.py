@@ -0,0 +1,212 @@
+import contextvars
+import functools
+import inspect
+import sys
+import types
+
+from .check_plan import (
+    _CheckPlan,
+    _Scope,
+    _to_string,
+    _torchtyping_metadata,
+)
+from .codegen import _tensor_predicate
+from .mode import _switch, get_mode
+
+from typing import Any, Callable, Dict, Optional
+
+# Annotated is available in python version 3.9 (PEP 593)
+if sys.version_info >= (3, 9):
+    from typing import Annotated
+else:
+    from typing_extensions import Annotated
+
+try:
+    import beartype
+    from beartype.vale import Is
+except ImportError:
+    beartype = None
+
+
+# BEARTYPE
+#######################
+# beartype checks each annotation with code generated once, at decoration time, and
+# only ever checks a single randomly-chosen item of a container, so that every check
+# is O(1). It ignores any metadata in an Annotated[...] other than its own validators,
+# so left to itself it would check a TensorType[...] as just a torch.Tensor.
+#
+# So `beartyped` gives beartype a copy of the function, in whose annotations every
+# TensorType[...] (anywhere, e.g. inside a Tuple[...]) has been replaced with
+# Annotated[torch.Tensor, Is[_Validator(...)]]. Each validator checks the details of a
+# single tensor, and binds its named dimensions in the _Scope of the current call.
+#
+# beartype doesn't tell the validators which call they're being run for, so the copy
+# is wrapped in a function that starts a new _Scope in a context variable for the
+# duration of each call. (Only functions that actually have named dimensions pay for
+# this.) As the variable is restored afterwards, nested and recursive calls to checked
+# functions each get their own scope, and the return value is checked in the same scope
+# as the arguments.
+
+
+_scope = contextvars.ContextVar("torchtyping_scope", default=None)
+
+
+class _Validator:
+    # The check of a single TensorType annotation.
+
+    __slots__ = ("spec", "plan", "switch", "predicate", "bound", "__weakref__")
+
+    def __init__(self, annotation: Any, plan: _CheckPlan, switch: Any):
+        spec = self.spec = plan.spec(annotation)
+        self.plan = plan
+        self.switch = switch
+        # Where possible, the details are checked with generated code (see codegen.py).
+        self.predicate = _tensor_predicate(spec) or self._check_details
+        self.bound = bool(spec.bindings or spec.group_counts)
+
+    def _check_details(self, value: Any) -> bool:
+        return self.spec.matches(value)
+
+    def __call__(self, value: Any) -> bool:
+        if not self.switch.enabled:
+            return True
+        if not self.predicate(value):
+            return False
+        if self.bound:
+            scope = _scope.get()
+            if scope is not None:
+                try:
+                    scope.bind(value, self.spec, self.plan)
+                except TypeError:
+                    return False
+        return True
+
+    def __repr__(self) -> str:
+        # Used by beartype in its error messages.
+        return _to_string(
+            self.spec.metadata["cls_name"],
+            [repr(detail) for detail in self.spec.metadata["details"]],
+        )
+
+
+def _rewrite(annotation: Any, plan: _CheckPlan, switch: Any) -> Any:
+    metadata = _torchtyping_metadata(annotation)
+    if metadata is not None:
+        return Annotated[metadata[0], Is[_Validator(annotation, plan, switch)]]
+    args = getattr(annotation, "__args__", None)
+    if not args or not hasattr(annotation, "copy_with"):
+        return annotation
+    new_args = tuple(_rewrite(arg, plan, switch) for arg in args)
+    if all(new_arg is arg for new_arg, arg in zip(new_args, args)):
+        return annotation
+    try:
+        return annotation.copy_with(new_args)
+    except Exception:
+        # Some unusual generic. Fall back to beartype's checks alone.
+        return annotation
+
+
+def _resolve_annotation(func: Callable, annotation: Any) -> Any:
+    if isinstance(annotation, str):
+        try:
+            return eval(annotation, func.__globals__)
+        except NameError:
+            # A forward reference. beartype resolves these itself when the function is
+            # first called, but without our validators.
+            pass
+    return annotation
+
+
+def _copy(func: types.FunctionType, annotations: Dict[str, Any]) -> Callable:
+    copy = types.FunctionType(
+        func.__code__,
+        func.__globals__,
+        func.__name__,
+        func.__defaults__,
+        func.__closure__,
+    )
+    copy.__kwdefaults__ = func.__kwdefaults__
+    copy.__qualname__ = func.__qualname__
+    copy.__module__ = func.__module__
+    copy.__doc__ = func.__doc__
+    copy.__annotations__ = annotations
+    return copy
+
+
+def _beartyped(func: Any, conf: Any) -> Any:
+    if inspect.isclass(func):
+        # Check every annotated method, as beartype would.
+        prefix = func.__qualname__ + "."
+        for key, attr in func.__dict__.items():
+            if inspect.isfunction(attr) or inspect.isclass(attr):
+                if attr.__qualname__.startswith(prefix):
+                    setattr(func, key, _beartyped(attr, conf))
+            elif isinstance(attr, (classmethod, staticmethod)):
+                setattr(func, key, type(attr)(_beartyped(attr.__func__, conf)))
+            elif isinstance(attr, property):
+                kwargs = dict(doc=attr.__doc__)
+                for name in ("fset", "fget", "fdel"):
+                    property_func = kwargs[name] = getattr(attr, name)
+                    if property_func is not None:
+                        kwargs[name] = _beartyped(property_func, conf)
+                setattr(func, key, attr.__class__(**kwargs))
+        return func
+
+    if not inspect.isfunction(func) or not getattr(func, "__annotations__", None):
+        return beartype.beartype(func, conf=conf)
+
+    plan = _CheckPlan({})
+    switch = _switch(func.__module__)
+    parameters = inspect.signature(func).parameters
+    annotations = {}
+    for name, annotation in func.__annotations__.items():
+        annotation = _resolve_annotation(func, annotation)
+        if name in parameters and parameters[name].default is None:
+            # As typeguard does.
+            annotation = Optional[annotation]
+        annotations[name] = _rewrite(annotation, plan, switch)
+    checked = beartype.beartype(_copy(func, annotations), conf=conf)
+    if plan.num_sizes == 0 and plan.num_groups == 0:
+        # No named dimensions, so no scope is needed.
+        return functools.update_wrapper(checked, func)
+
+    num_sizes = plan.num_sizes
+    if inspect.iscoroutinefunction(func):
+        # The arguments are only checked once the coroutine is awaited.
+
+        async def wrapper(*args, **kwargs):
+            token = _scope.set(_Scope(num_sizes))
+            try:
+                return await checked(*args, **kwargs)
+            finally:
+                _scope.reset(token)
+
+    else:
+
+        def wrapper(*args, **kwargs):
+            token = _scope.set(_Scope(num_sizes))
+            try:
+                return checked(*args, **kwargs)
+            finally:
+                _scope.reset(token)
+
+    return functools.update_wrapper(wrapper, func)
+
+
+def beartyped(func=None, *, conf: Any = None):
+    # Checks a function (or every method of a class) with beartype, including its
+    # TensorType annotations. The named dimensions of the tensors passed to and returned
+    # from each call must be consistent, as with typeguard.
+    #
+    # `conf` is an optional beartype.BeartypeConf, passed on to beartype.
+    #
+    # If checking is turned off (see mode.py) then the function is returned unchanged.
+    if beartype is None:
+        raise ImportError("torchtyping.beartyped requires beartype to be installed.")
+    if func is None:
+        return functools.partial(beartyped, conf=conf)
+    if get_mode() == "off":
+        return func
+    if conf is None:
+        conf = beartype.BeartypeConf()
+    return _beartyped(func, conf)
@@ -0,0 +1,898 @@
+import sys
+import torch
+
+from .tensor_details import (
+    _Dim,
+    _FloatDetail,
+    _no_name,
+    DetailCost,
+    DtypeDetail,
+    LayoutDetail,
+    ShapeDetail,
+    TensorDetail,
+)
+from .deferred import _values_match_later
+from .mode import _switch
+from .sampling import SamplingPolicy
+from .scopes import _dims, _record, _seed_list
+from .stats import _FunctionStats
+from .tensor_type import _AnnotatedType
+from .utils import LRUCache
+from .value_details import _values_match
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+# get_args is available in python version 3.8
+if sys.version_info >= (3, 9):
+    from typing import get_args, Type
+else:
+    from typing_extensions import get_args, Type
+
+
+# CHECK PLANS
+#######################
+# Everything that can be worked out from a function's annotations alone is worked out
+# once, the first time the function is checked, and stored in a _CheckPlan that is
+# cached on the function itself.
+#
+# This means that every `TensorType[...]` annotation appearing anywhere in the type
+# hints is compiled into a _TensorSpec, which records its details, and replaces every
+# dimension name (and every `...` group name) with an integer slot. At call time the
+# sizes of named dimensions are then stored in a flat list indexed by these slots,
+# rather than in dictionaries keyed by name.
+#
+# The plan also records, for every argument, whether it is directly annotated with a
+# TensorType (in which case it can be checked without going back through typeguard's
+# generic `check_type`), and precomputes an order in which the arguments can be
+# processed so that every named `...` can be resolved.
+#
+# Optionally, a plan may also hold a cache of the tensor metadata (shape, dtype, layout
+# and names) it has already seen validated. The outcome of the shape, dtype and layout
+# checks is fully determined by this metadata, so if a call's metadata matches that of
+# an earlier successful call then those checks can be skipped, and the sizes of the
+# named dimensions restored from the cache instead.
+
+
+# Details whose outcome is determined by a tensor's metadata alone.
+_metadata_details = (ShapeDetail, DtypeDetail, LayoutDetail, _FloatDetail)
+
+
+def _cost(detail: TensorDetail) -> int:
+    return getattr(detail, "cost", DetailCost.VALUES)
+
+
+def _to_string(name, detail_reprs: List[str]) -> str:
+    assert len(detail_reprs) > 0
+    string = name + "["
+    pieces = []
+    for detail_repr in detail_reprs:
+        if detail_repr != "":
+            pieces.append(detail_repr)
+    string += ", ".join(pieces)
+    string += "]"
+    return string
+
+
+# ERRORS
+#######################
+# Checking a tensor allocates nothing unless it fails: the details are checked with a
+# plain loop, and the error message is only formatted if it's actually used. (Which it
+# isn't always, e.g. typeguard checks each member of a Union in turn, catching the
+# TypeErrors of those that don't match.)
+
+
+class _TensorTypeError(TypeError):
+    # A value not matching a TensorType annotation, with a lazily formatted message.
+
+    def __init__(
+        self,
+        argname: str,
+        value: Any,
+        origin: Type[torch.Tensor],
+        metadata: Dict[str, Any],
+    ):
+        super().__init__()
+        self._parts = (argname, value, origin, metadata)
+        self._message = None
+
+    @property
+    def args(self) -> Tuple[str]:
+        return (str(self),)
+
+    def __str__(self) -> str:
+        if self._message is None:
+            argname, value, origin, metadata = self._parts
+            self._message = f"{argname} {_mismatch_message(value, origin, metadata)}"
+            self._parts = None  # don't keep the value alive
+        return self._message
+
+    def __reduce__(self):
+        return TypeError, self.args
+
+
+def _tensor_matches(value: Any, origin: Type[torch.Tensor], details: Any) -> bool:
+    if not isinstance(value, origin):
+        return False
+    for detail in details:
+        if not detail.check(value):
+            return False
+    return True
+
+
+def _check_tensor(
+    argname: str, value: Any, origin: Type[torch.Tensor], metadata: Dict[str, Any]
+):
+    if not _tensor_matches(value, origin, metadata["details"]):
+        raise _TensorTypeError(argname, value, origin, metadata)
+
+
+def _tensor_mismatch(value: Any, spec: "_TensorSpec") -> Optional[str]:
+    # Describes how `value` fails to match a TensorType annotation, or returns None if
+    # it does match.
+    if spec.matches(value):
+        return None
+    return _mismatch_message(value, spec.base_cls, spec.metadata)
+
+
+def _mismatch_message(
+    value: Any, origin: Type[torch.Tensor], metadata: Dict[str, Any]
+) -> str:
+    details = metadata["details"]
+    expected_string = _to_string(
+        metadata["cls_name"], [repr(detail) for detail in details]
+    )
+    if isinstance(value, torch.Tensor):
+        given_string = _to_string(
+            metadata["cls_name"], [detail.tensor_repr(value) for detail in details]
+        )
+    else:
+        value = type(value)
+        if hasattr(value, "__qualname__"):
+            given_string = value.__qualname__
+        elif hasattr(value, "__name__"):
+            given_string = value.__name__
+        else:
+            given_string = repr(value)
+    return f"must be of type {expected_string}, got type {given_string} instead."
+
+
+def _torchtyping_metadata(annotation: Any) -> Optional[Tuple[type, Dict[str, Any]]]:
+    # Returns the base class and metadata of a TensorType annotation, or None if
+    # `annotation` is anything else.
+    if isinstance(annotation, _AnnotatedType):
+        base_cls, *all_metadata = get_args(annotation)
+        if isinstance(base_cls, type) and issubclass(base_cls, torch.Tensor):
+            for metadata in all_metadata:
+                if isinstance(metadata, dict) and "__torchtyping__" in metadata:
+                    return base_cls, metadata
+    return None
+
+
+def _is_named(name: Any) -> bool:
+    return name is not None and name is not _no_name
+
+
+class _TensorSpec:
+    # A single TensorType annotation, compiled against the slots of a particular plan.
+    #
+    # `...` can only occur on the left of a shape, so the dimensions are split into the
+    # leading `...` and the remaining "plain" dimensions:
+    # - `groups` contains the slot of each leading `...` (left to right), with -1 for an
+    #   unnamed `...`.
+    # - `group_counts` contains (slot, count) pairs, counting how many times each named
+    #   `...` occurs.
+    # - `bindings` contains a triple (index, slot, name) for every named plain
+    #   dimension, where `index` is the (negative) index of the dimension into the
+    #   tensor's shape. `"a": "b"` produces two bindings, one for each name.
+    #
+    # The details are split into the `metadata_details` (shape, dtype, layout and
+    # is_float), whose outcome is determined by the tensor's metadata alone, the
+    # `other_details` that are cheap to check (see DetailCost), and the `value_details`
+    # that read the tensor's values. `details` holds all of them in that order, which is
+    # the order in which they're checked, and `cheap_details` all but the value details.
+    # (The value details of every tensor passed directly as an argument are only checked
+    # after everything else about a call, and together: see value_details.py.)
+
+    __slots__ = (
+        "base_cls",
+        "metadata",
+        "shape_detail",
+        "details",
+        "cheap_details",
+        "metadata_details",
+        "other_details",
+        "value_details",
+        "groups",
+        "group_counts",
+        "num_unnamed",
+        "num_plain",
+        "bindings",
+    )
+
+    def __init__(self, base_cls: type, metadata: Dict[str, Any], plan: "_CheckPlan"):
+        self.base_cls = base_cls
+        self.metadata = metadata
+        self.shape_detail = None
+        for detail in metadata["details"]:
+            if isinstance(detail, ShapeDetail):
+                self.shape_detail = detail
+                break
+        self.metadata_details = tuple(
+            detail
+            for detail in metadata["details"]
+            if isinstance(detail, _metadata_details)
+        )
+        # sorted is stable, so details of the same cost stay in the order they're given.
+        other_details = sorted(
+            (
+                detail
+                for detail in metadata["details"]
+                if not isinstance(detail, _metadata_details)
+            ),
+            key=_cost,
+        )
+        self.other_details = tuple(
+            detail for detail in other_details if _cost(detail) <= DetailCost.METADATA
+        )
+        self.value_details = tuple(
+            detail for detail in other_details if _cost(detail) > DetailCost.METADATA
+        )
+        self.cheap_details = self.metadata_details + self.other_details
+        self.details = self.cheap_details + self.value_details
+
+        groups = []
+        group_counts = {}
+        bindings = []
+        dims = () if self.shape_detail is None else self.shape_detail.dims
+        plain_dims = [dim for dim in dims if dim.size is not ...]
+        for dim in dims:
+            if dim.size is ...:
+                if _is_named(dim.name):
+                    slot = plan.group_slot(dim.name)
+                    group_counts[slot] = group_counts.get(slot, 0) + 1
+                else:
+                    slot = -1
+                groups.append(slot)
+        for index, dim in enumerate(plain_dims, start=-len(plain_dims)):
+            if _is_named(dim.name):
+                bindings.append((index, plan.size_slot(dim.name), dim.name))
+                if isinstance(dim.size, str):
+                    bindings.append((index, plan.size_slot(dim.size), dim.name))
+        self.groups = tuple(groups)
+        self.group_counts = tuple(group_counts.items())
+        self.num_unnamed = groups.count(-1)
+        self.num_plain = len(plain_dims)
+        self.bindings = tuple(bindings)
+
+    def matches(self, value: Any) -> bool:
+        return _tensor_matches(value, self.base_cls, self.cheap_details) and (
+            not self.value_details
+            or _values_match(((value, self.value_details),)) == -1
+        )
+
+    def check(self, argname: str, value: Any) -> None:
+        if not self.matches(value):
+            raise _TensorTypeError(argname, value, self.base_cls, self.metadata)
+
+    # `check_uncached`, `check_metadata` and `check_values` together are equivalent to
+    # `check`. The first must always be performed first. The second may be skipped if
+    # the tensor's metadata has already been checked.
+
+    def check_uncached(self, argname: str, value: Any) -> None:
+        if not isinstance(value, self.base_cls):
+            raise _TensorTypeError(argname, value, self.base_cls, self.metadata)
+        for detail in self.other_details:
+            if not detail.check(value):
+                raise _TensorTypeError(argname, value, self.base_cls, self.metadata)
+
+    def check_metadata(self, argname: str, value: torch.Tensor) -> None:
+        for detail in self.metadata_details:
+            if not detail.check(value):
+                raise _TensorTypeError(argname, value, self.base_cls, self.metadata)
+
+    def check_values(self, argname: str, value: torch.Tensor) -> None:
+        if _values_match(((value, self.value_details),)) != -1:
+            raise _TensorTypeError(argname, value, self.base_cls, self.metadata)
+
+    def mismatch_message(self, value: Any) -> str:
+        return _mismatch_message(value, self.base_cls, self.metadata)
+
+    @property
+    def check_names(self) -> bool:
+        return self.shape_detail is not None and self.shape_detail.check_names
+
+    def num_free_ellipsis(self, groups: List[Optional[Tuple[int, ...]]]) -> int:
+        num_free_ellipsis = self.num_unnamed
+        for slot, count in self.group_counts:
+            if groups[slot] is None:
+                num_free_ellipsis += count
+        return num_free_ellipsis
+
+
+class _CheckPlan:
+    # Everything about a function's annotations that doesn't depend on the arguments it
+    # is called with.
+    #
+    # `arguments` contains a tuple (argname, description, expected_type, spec, optional)
+    # for every annotated argument, where `spec` is the _TensorSpec of an argument
+    # annotated directly with a TensorType (possibly wrapped in an Optional), and None
+    # otherwise.
+    # `order` contains indices into `arguments`, giving an order in which the tensor
+    # arguments can be processed such that every named `...` can be resolved. (Assuming
+    # that every argument is passed.) `ranks` maps the other way: it contains the
+    # position in `order` of each argument, or -1 if it's not a tensor argument.
+    # `has_value_details` is whether any tensor argument (or the return value) has
+    # details that read its values (see value_details.py).
+    # `scratch` holds lists of `max(len(order), 1)` Nones, reused between calls to hold
+    # the tensor arguments (or return value) of a call in `order`: see
+    # typechecker.py.
+    # `cache` is an LRUCache of validated tensor metadata, or None if caching is
+    # disabled.
+    # `stats` counts the calls of this function (see stats.py).
+    # `switch` says whether checking is enabled for this function's module (see
+    # mode.py).
+    # `sample` is the SamplingPolicy for this function (or None to use the global
+    # default), and `sampler` the sampler created from `sampler_policy`, with
+    # `sampler_record` its `record` method if it has one.
+    # `binder` is used to bind the arguments of each call to their parameters,
+    # `annotations` is a copy of the function's __annotations__, used to detect whether
+    # they've changed since, and `func_name` and `is_generator` are as computed by
+    # typeguard. These are set by the typeguard patch (see typechecker.py) the first
+    # time that the function is called.
+
+    __slots__ = (
+        "type_hints",
+        "arguments",
+        "return_type",
+        "specs",
+        "size_names",
+        "group_names",
+        "_size_slots",
+        "_group_slots",
+        "order",
+        "ranks",
+        "has_value_details",
+        "scratch",
+        "cache",
+        "check_names",
+        "stats",
+        "switch",
+        "sample",
+        "sampler",
+        "sampler_policy",
+        "sampler_record",
+        "binder",
+        "annotations",
+        "func_name",
+        "is_generator",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        type_hints: Dict[str, Any],
+        cache_size: Optional[int] = None,
+        sample: Optional[SamplingPolicy] = None,
+    ):
+        self.type_hints = type_hints
+        self.cache = None if cache_size is None else LRUCache(cache_size)
+        self.check_names = False
+        self.stats = _FunctionStats()
+        self.switch = _switch(None)
+        self.sample = sample
+        self.sampler = None
+        self.sampler_policy = None
+        self.sampler_record = None
+        self.binder = None
+        self.annotations = None
+        self.func_name = None
+        self.is_generator = None
+        self.specs = {}
+        self.size_names = []
+        self.group_names = []
+        self._size_slots = {}
+        self._group_slots = {}
+
+        arguments = []
+        self.return_type = None
+        for argname, expected_type in type_hints.items():
+            self._collect_specs(expected_type)
+            spec, optional = self._direct_spec(expected_type)
+            if argname == "return":
+                self.return_type = ("the return value", expected_type, spec, optional)
+            else:
+                description = f'argument "{argname}"'
+                arguments.append((argname, description, expected_type, spec, optional))
+        self.arguments = tuple(arguments)
+        self.order = self._resolution_order()
+        ranks = [-1] * len(self.arguments)
+        for rank, index in enumerate(self.order):
+            ranks[index] = rank
+        self.ranks = tuple(ranks)
+        specs = [argument[3] for argument in self.arguments]
+        if self.return_type is not None:
+            specs.append(self.return_type[2])
+        self.has_value_details = any(
+            spec is not None and spec.value_details for spec in specs
+        )
+        self.scratch = []
+
+    @property
+    def num_sizes(self) -> int:
+        return len(self.size_names)
+
+    @property
+    def num_groups(self) -> int:
+        return len(self.group_names)
+
+    def size_slot(self, name: str) -> int:
+        try:
+            return self._size_slots[name]
+        except KeyError:
+            slot = self._size_slots[name] = len(self.size_names)
+            self.size_names.append(name)
+            return slot
+
+    def group_slot(self, name: str) -> int:
+        try:
+            return self._group_slots[name]
+        except KeyError:
+            slot = self._group_slots[name] = len(self.group_names)
+            self.group_names.append(name)
+            return slot
+
+    def spec(self, annotation: Any) -> Optional[_TensorSpec]:
+        # Looks up (or compiles, if this is an annotation we've not seen before) the
+        # spec for an annotation. Returns None if it's not a TensorType annotation.
+        try:
+            return self.specs[annotation]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable annotation
+            return None
+        metadata = _torchtyping_metadata(annotation)
+        if metadata is None:
+            spec = None
+        else:
+            spec = _TensorSpec(*metadata, plan=self)
+            if spec.check_names:
+                self.check_names = True
+        self.specs[annotation] = spec
+        return spec
+
+    def _collect_specs(self, annotation: Any) -> None:
+        # Compile every TensorType annotation appearing anywhere inside `annotation`,
+        # e.g. inside a Tuple[...], so that all the slots are known up front.
+        if self.spec(annotation) is None:
+            try:
+                args = get_args(annotation)
+            except Exception:
+                return
+            for arg in args:
+                if not isinstance(arg, (str, bytes)):
+                    self._collect_specs(arg)
+
+    def _direct_spec(self, annotation: Any) -> Tuple[Optional[_TensorSpec], bool]:
+        spec = self.spec(annotation)
+        if spec is not None:
+            return spec, False
+        # Optional[TensorType[...]], as produced by typeguard for arguments with a
+        # default value of None.
+        if getattr(annotation, "__origin__", None) is Union:
+            args = get_args(annotation)
+            if len(args) == 2 and type(None) in args:
+                for arg in args:
+                    if arg is not type(None):
+                        spec = self.spec(arg)
+                        if spec is not None:
+                            return spec, True
+        return None, False
+
+    def _resolution_order(self) -> Tuple[int, ...]:
+        # A tensor can be processed once it has at most one `...` whose size is
+        # unknown. Processing it then determines the size of every `...` it has.
+        resolved = [None] * self.num_groups
+        remaining = [
+            index
+            for index, (_, _, _, spec, _) in enumerate(self.arguments)
+            if spec is not None
+        ]
+        order = []
+        while True:
+            for index in remaining:
+                spec = self.arguments[index][3]
+                if spec.num_free_ellipsis(resolved) <= 1:
+                    for slot, _ in spec.group_counts:
+                        resolved[slot] = ()
+                    order.append(index)
+                    remaining.remove(index)
+                    break
+            else:
+                break
+        # Whatever is left is deferred to the end; _check_memo will wait for it to
+        # become resolvable, or report it if it can't be.
+        return tuple(order + remaining)
+
+
+def get_plan(func: Any, type_hints: Dict[str, Any]) -> _CheckPlan:
+    # Plans are cached on the function itself, so they live exactly as long as the
+    # function does. They are rebuilt if the type hints they were built from change.
+    plan = getattr(func, "__torchtyping_plan__", None)
+    if plan is None or plan.type_hints is not type_hints:
+        # Set by torchtyping.typechecked.
+        options = getattr(func, "__torchtyping_options__", {})
+        plan = _CheckPlan(type_hints, **options)
+        plan.switch = _switch(getattr(func, "__module__", None))
+        try:
+            func.__torchtyping_plan__ = plan
+        except (AttributeError, TypeError):
+            pass
+    return plan
+
+
+def _metadata_key(
+    direct: Sequence[Optional[Tuple[str, torch.Tensor, _TensorSpec]]],
+    value_info: List[Tuple[str, torch.Tensor, _TensorSpec]],
+    check_names: bool,
+) -> Tuple[Any, ...]:
+    # Everything that determines the outcome of the metadata checks and of _check_memo,
+    # for the same arguments. The spec is included so that e.g. Optional arguments being
+    # None can't cause two different calls to produce the same key.
+    key = []
+    for values in (direct, value_info):
+        for item in values:
+            if item is None:
+                continue
+            _, value, spec = item
+            key.append(spec)
+            key.append(value.shape)
+            key.append(value.dtype)
+            key.append(value.layout)
+            if check_names:
+                key.append(value.names)
+    return tuple(key)
+
+
+def _resolved_shape_detail(
+    spec: _TensorSpec,
+    plan: _CheckPlan,
+    sizes: List[Optional[int]],
+    groups: List[Optional[Tuple[int, ...]]],
+) -> ShapeDetail:
+    # The ShapeDetail with all the sizes we've inferred filled in. Only used for
+    # producing error messages.
+    dims = []
+    for dim in spec.shape_detail.dims:
+        name, size = dim
+        if _is_named(name):
+            if size == -1:
+                size = sizes[plan.size_slot(name)]
+            elif isinstance(size, str):
+                size = sizes[plan.size_slot(size)]
+            elif size is ...:
+                lookup_shape = groups[plan.group_slot(name)]
+                if lookup_shape is not None:
+                    for size in lookup_shape:
+                        dims.append(_Dim(name=_no_name, size=size))
+                    continue
+        dims.append(_Dim(name=name, size=size))
+    return spec.shape_detail.update(dims=tuple(dims))
+
+
+def _resolve(
+    argname: str,
+    value: torch.Tensor,
+    spec: _TensorSpec,
+    plan: _CheckPlan,
+    sizes: List[Optional[int]],
+    groups: List[Optional[Tuple[int, ...]]],
+) -> int:
+    # Binds (or checks against existing bindings) every named dimension and every named
+    # `...` of a single tensor. Requires that at most one of its `...` is of unknown
+    # size. Returns the slot of the named `...` whose size this determined, or -1.
+    shape = value.shape
+    for index, slot, name in spec.bindings:
+        size = shape[index]
+        lookup_size = sizes[slot]
+        if lookup_size is None:
+            sizes[slot] = size
+        elif lookup_size != size:
+            raise TypeError(
+                f"Dimension '{name}' of inconsistent size. Got both {size} and "
+                f"{lookup_size}."
+            )
+
+    spec_groups = spec.groups
+    if not spec_groups:
+        return -1
+    # The leading dimensions, shape[:end], are split between the `...`. Those to the
+    # right of the free `...` are matched from the right, and those to its left are
+    # matched from the left. (If every `...` has a known size then they're all matched
+    # from the right.)
+    end = len(shape) - spec.num_plain
+    free_index = -1
+    for group_index in range(len(spec_groups) - 1, -1, -1):
+        slot = spec_groups[group_index]
+        if slot == -1:
+            free_index = group_index
+            break
+        lookup_shape = groups[slot]
+        if lookup_shape is None:
+            free_index = group_index
+            break
+        start = max(end - len(lookup_shape), 0)
+        if not _shape_matches(shape, start, end, lookup_shape):
+            _group_error(plan.group_names[slot], shape[start:end], lookup_shape)
+        end = start
+    start = 0
+    for group_index in range(free_index):
+        slot = spec_groups[group_index]
+        lookup_shape = groups[slot]
+        stop = min(start + len(lookup_shape), end)
+        if not _shape_matches(shape, start, stop, lookup_shape):
+            _group_error(plan.group_names[slot], shape[start:stop], lookup_shape)
+        start = stop
+
+    if free_index == -1:
+        if end != 0:
+            # More dimensions than the `...` account for.
+            detail = _resolved_shape_detail(spec, plan, sizes, groups)
+            _check_tensor(
+                argname,
+                value,
+                torch.Tensor,
+                {"cls_name": spec.metadata["cls_name"], "details": [detail]},
+            )
+        return -1
+    slot = spec_groups[free_index]
+    if slot != -1:
+        groups[slot] = tuple(shape[start:end])
+    return slot
+
+
+def _shape_matches(
+    shape: torch.Size, start: int, stop: int, lookup_shape: Tuple[int, ...]
+) -> bool:
+    # shape[start:stop] == lookup_shape, without slicing.
+    if stop - start != len(lookup_shape):
+        return False
+    for index, size in enumerate(lookup_shape, start):
+        if shape[index] != size:
+            return False
+    return True
+
+
+def _group_error(
+    name: str, shape_piece: Tuple[int, ...], lookup_shape: Tuple[int, ...]
+):
+    raise TypeError(
+        f"Dimension group '{name}' of inconsistent shape. Got both "
+        f"{tuple(shape_piece)} and {lookup_shape}."
+    )
+
+
+def _check_memo(
+    direct: Sequence[Optional[Tuple[str, torch.Tensor, _TensorSpec]]],
+    value_info: List[Tuple[str, torch.Tensor, _TensorSpec]],
+    plan: _CheckPlan,
+    sizes: List[Optional[int]],
+    groups: List[Optional[Tuple[int, ...]]],
+) -> None:
+    ###########
+    # Figure out the sizes of all labelled dimensions, and check them for consistency.
+    #
+    # A tensor can be processed once at most one of its `...` is of unknown size, at
+    # which point _resolve determines the size of that `...` and checks everything
+    # else. The tensors are those of `direct` (skipping any Nones) followed by those of
+    # `value_info`. `direct` will usually be ordered as per `plan.order`, in which case
+    # every tensor can be processed as soon as we reach it.
+    #
+    # Otherwise (e.g. when `...` can only be resolved via a tensor inside a container)
+    # a tensor that can't yet be processed waits on each of its unresolved `...`. When
+    # one of those is resolved its waiting tensors are woken up, and processed as soon
+    # as they become resolvable. Overall this is linear in the number of tensors.
+    ###########
+
+    # Annotations we hadn't seen when the plan was built (and so were compiled during
+    # this call) may have introduced new slots.
+    if len(sizes) < plan.num_sizes:
+        sizes.extend([None] * (plan.num_sizes - len(sizes)))
+    if len(groups) < plan.num_groups:
+        groups.extend([None] * (plan.num_groups - len(groups)))
+
+    waiting = None
+    blocked = None
+    num_direct = len(direct)
+    for index in range(num_direct + len(value_info)):
+        if index < num_direct:
+            item = direct[index]
+            if item is None:
+                continue
+        else:
+            item = value_info[index - num_direct]
+        argname, value, spec = item
+        if spec.groups:
+            num_free_ellipsis = spec.num_free_ellipsis(groups)
+            if num_free_ellipsis > 1:
+                if waiting is None:
+                    waiting = {}
+                    blocked = {}
+                blocked[index] = num_free_ellipsis
+                for slot, count in spec.group_counts:
+                    if groups[slot] is None:
+                        waiting.setdefault(slot, []).append((index, count))
+                continue
+        slot = _resolve(argname, value, spec, plan, sizes, groups)
+        if waiting and slot in waiting:
+            _wake(slot, direct, value_info, plan, sizes, groups, waiting, blocked)
+
+    if blocked:
+        names = {_item(direct, value_info, index)[0] for index in blocked}
+        raise TypeError(
+            f"Could not resolve the size of all `...` in {names}. Either:\n"
+            "(1) the specification is ambiguous. For example "
+            "`func(tensor: TensorType['x': ..., 'y': ...])`.\n"
+            "(2) or repeated named `...` are used without being able to "
+            "resolve the size of those named `...` via another argument "
+            "For example `func(tensor: TensorType['x': ..., 'x': ...])`. "
+            "(But `func(tensor1: TensorType['x': ..., 'x': ...], tensor2: "
+            "TensorType['x': ...])` would be fine.)\n"
+            "\n"
+            "Removing the names of the `...` should suffice to resolve this "
+            "error. (But will of course remove that checking as well.)"
+        )
+
+
+def _check_values(
+    direct: Sequence[Optional[Tuple[str, torch.Tensor, _TensorSpec]]], func_name: str
+) -> None:
+    # The value details of tensors whose other details have already been checked, all
+    # checked together (or deferred: see deferred.py). Nones in `direct` are skipped.
+    checked = [item for item in direct if item is not None and item[2].value_details]
+    if not checked:
+        return
+    index = _values_match_later(
+        [(value, spec.value_details) for _, value, spec in checked],
+        [(argname, spec) for argname, _, spec in checked],
+        func_name,
+    )
+    if index != -1:
+        argname, value, spec = checked[index]
+        raise _TensorTypeError(argname, value, spec.base_cls, spec.metadata)
+
+
+def _item(
+    direct: Sequence[Optional[Tuple[str, torch.Tensor, _TensorSpec]]],
+    value_info: List[Tuple[str, torch.Tensor, _TensorSpec]],
+    index: int,
+) -> Tuple[str, torch.Tensor, _TensorSpec]:
+    # The tensor at `index`, as numbered by _check_memo.
+    if index < len(direct):
+        return direct[index]
+    return value_info[index - len(direct)]
+
+
+def _wake(
+    slot: int,
+    direct: Sequence[Optional[Tuple[str, torch.Tensor, _TensorSpec]]],
+    value_info: List[Tuple[str, torch.Tensor, _TensorSpec]],
+    plan: _CheckPlan,
+    sizes: List[Optional[int]],
+    groups: List[Optional[Tuple[int, ...]]],
+    waiting: Dict[int, List[Tuple[int, int]]],
+    blocked: Dict[int, int],
+) -> None:
+    resolved_slots = [slot]
+    while resolved_slots:
+        for index, count in waiting.pop(resolved_slots.pop(), ()):
+            if index not in blocked:  # already processed
+                continue
+            blocked[index] -= count
+            if blocked[index] <= 1:
+                del blocked[index]
+                argname, value, spec = _item(direct, value_info, index)
+                slot = _resolve(argname, value, spec, plan, sizes, groups)
+                if slot != -1:
+                    resolved_slots.append(slot)
+
+
+class _Scope:
+    # The sizes bound so far during a single call, for backends that check each tensor
+    # on its own rather than all of a call's tensors together (see typeguard_lookup.py
+    # and beartype_backend.py).
+    #
+    # A `...` can only be resolved once at most one of the `...` of a tensor are of
+    # unknown size by that point. Tensors for which this isn't the case are put aside,
+    # and checked once enough of their `...` have been resolved by later tensors. If
+    # that never happens then they're not checked at all.
+    #
+    # `dims` is the dimension scope (see scopes.py) that was current when the call
+    # started, if any.
+
+    __slots__ = ("sizes", "groups", "pending", "dims")
+
+    def __init__(self, num_sizes: int = 0):
+        self.sizes = [None] * num_sizes
+        self.groups = []
+        self.pending = []
+        self.dims = _dims.get()
+
+    def bind(self, value: torch.Tensor, spec: _TensorSpec, plan: _CheckPlan) -> None:
+        # Checks the named dimensions of `value` against those bound so far, and binds
+        # any new ones. Raises a TypeError if they're inconsistent, in which case
+        # nothing is bound. (Which might not be an error overall, e.g. inside a Union.)
+        dims = self.dims
+        if dims is None:
+            self._bind(value, spec, plan)
+        else:
+            sizes = self.sizes
+            if len(sizes) < plan.num_sizes:
+                sizes.extend([None] * (plan.num_sizes - len(sizes)))
+            _seed_list(dims, plan.size_names, sizes)
+            self._bind(value, spec, plan)
+            _record(dims, plan.size_names, self.sizes)
+
+    def _bind(self, value: torch.Tensor, spec: _TensorSpec, plan: _CheckPlan) -> None:
+        if not spec.group_counts:
+            self._bind_plain(value, spec, plan)
+            return
+        sizes = self.sizes + [None] * (plan.num_sizes - len(self.sizes))
+        groups = self.groups + [None] * (plan.num_groups - len(self.groups))
+        if not _bind(value, spec, plan, sizes, groups):
+            self.pending.append((value, spec))
+            return
+        pending = self.pending
+        progress = bool(pending)
+        while progress:
+            progress = False
+            for index, (pending_value, pending_spec) in enumerate(pending):
+                if _bind(pending_value, pending_spec, plan, sizes, groups):
+                    pending = pending[:index] + pending[index + 1 :]
+                    progress = True
+                    break
+        self.sizes = sizes
+        self.groups = groups
+        self.pending = pending
+
+    def _bind_plain(
+        self, value: torch.Tensor, spec: _TensorSpec, plan: _CheckPlan
+    ) -> None:
+        # The common case of a tensor without any named `...`, which can always be
+        # processed straight away, and can't allow any pending tensors to be processed.
+        sizes = self.sizes
+        num_sizes = len(plan.size_names)
+        if len(sizes) < num_sizes:
+            sizes.extend([None] * (num_sizes - len(sizes)))
+        shape = value.shape
+        bound = None
+        for index, slot, name in spec.bindings:
+            size = shape[index]
+            lookup_size = sizes[slot]
+            if lookup_size is None:
+                sizes[slot] = size
+                if bound is None:
+                    bound = [slot]
+                else:
+                    bound.append(slot)
+            elif lookup_size != size:
+                for slot in bound or ():
+                    sizes[slot] = None
+                raise TypeError(
+                    f"Dimension '{name}' of inconsistent size. Got both {size} and "
+                    f"{lookup_size}."
+                )
+
+
+def _bind(
+    value: torch.Tensor,
+    spec: _TensorSpec,
+    plan: _CheckPlan,
+    sizes: List[Optional[int]],
+    groups: List[Optional[Tuple[int, ...]]],
+) -> bool:
+    # Like _resolve, but returns False (without doing anything) if the tensor can't be
+    # processed yet.
+    if spec.num_free_ellipsis(groups) > 1:
+        return False
+    _resolve("", value, spec, plan, sizes, groups)
+    return True
@@ -0,0 +1,142 @@
+import inspect
+import sys
+import typeguard
+
+from . import typeguard_lookup
+from .check_plan import _CheckPlan
+from .codegen import _make_checker
+from .mode import _switch, get_mode
+from .typechecker import _helpers, _scoped_patch, patch_typeguard
+from .utils import LRUCache
+
+from typing import Any, Callable, Dict, Tuple
+
+# INLINE CHECKS
+#######################
+# For code that can't be decorated (lambdas, loops, generated code, ...), a Checker
+# checks values against annotations given up front, e.g.
+#
+# check_xy = Checker(x=TensorType["b", "c"], y=TensorType["b"])
+# ...
+# check_xy(x, y)
+#
+# The annotations are compiled into a _CheckPlan exactly as if they were the
+# annotations of a function with parameters `x` and `y`, and the check itself is a
+# function with those parameters, generated in the same way as the wrappers made by
+# torchtyping.typechecked (see codegen.py). So no signature is inspected and no
+# arguments are bound when it's called, and checking tensors directly annotated with
+# TensorTypes comes down to comparisons of their shapes, dtypes and layouts. Anything
+# else, and any error message, goes through the same generic checks as
+# torchtyping.typechecked.
+#
+# With typeguard 3 or later, there's no copy of typeguard 2 to generate code against,
+# so the values are checked with typeguard's checker lookup instead (see
+# typeguard_lookup.py), as torchtyping.typechecked does.
+#
+# `check` does the same for a one-off check, looking up a Checker for the annotations
+# it's given in a cache.
+
+
+def _noop(*args, **kwargs) -> None:
+    pass
+
+
+def _lookup_checker(
+    annotations: Dict[str, Any], switch: Any, globalns: Any
+) -> Callable:
+    signature = inspect.Signature(
+        [
+            inspect.Parameter(name, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+            for name in annotations
+        ]
+    )
+
+    def check(*args, **kwargs):
+        if not switch.enabled:
+            return
+        arguments = signature.bind(*args, **kwargs).arguments
+        # A new dictionary of locals for each call, to hold its _Scope.
+        memo = typeguard.TypeCheckMemo(globalns, {})
+        for name, value in arguments.items():
+            try:
+                typeguard.check_type_internal(value, annotations[name], memo)
+            except typeguard.TypeCheckError as exc:
+                exc.append_path_element(f'argument "{name}"')
+                raise
+
+    return check
+
+
+class Checker:
+    # Checks its arguments against the annotations it was created with, raising a
+    # TypeError if they don't match. It may be called with the values either
+    # positionally (in the same order as the annotations) or by name.
+
+    __slots__ = ("annotations", "_check")
+
+    def __init__(self, **annotations: Any):
+        self._compile(annotations, sys._getframe(1))
+
+    def _compile(self, annotations: Dict[str, Any], frame: Any) -> None:
+        # The frame's locals are only used to evaluate string annotations here. They
+        # aren't kept afterwards, as they may hold e.g. large tensors.
+        globalns = frame.f_globals
+        annotations = {
+            name: (
+                eval(annotation, globalns, frame.f_locals)
+                if isinstance(annotation, str)
+                else annotation
+            )
+            for name, annotation in annotations.items()
+        }
+        localns = {}
+        self.annotations = annotations
+        if get_mode() == "off":
+            self._check = _noop
+            return
+        module = globalns.get("__name__")
+        if typeguard_lookup._available:
+            patch_typeguard()
+            self._check = _lookup_checker(annotations, _switch(module), globalns)
+            return
+        plan = _CheckPlan(annotations)
+        plan.switch = _switch(module)
+        plan.func_name = f"{Checker.__name__} in {module}"
+        plan.is_generator = False
+        helpers = _helpers(_scoped_patch(), None, plan, globalns, localns)
+        self._check = _make_checker(list(annotations), plan, helpers, plan.func_name)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> None:
+        self._check(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        annotations = ", ".join(
+            f"{name}={annotation!r}" for name, annotation in self.annotations.items()
+        )
+        return f"{type(self).__name__}({annotations})"
+
+
+_checkers = LRUCache(maxsize=1024)
+
+
+def check(**values: Tuple[Any, Any]) -> None:
+    # check(x=(x, TensorType["b", "c"]), y=(y, TensorType["b"])) checks each value
+    # against its annotation, and the dimensions of all of them for consistency, as
+    # Checker does.
+    frame = sys._getframe(1)
+    annotations = tuple((name, annotation) for name, (_, annotation) in values.items())
+    if any(isinstance(annotation, str) for _, annotation in annotations):
+        # These depend on the caller's locals, so aren't cached.
+        key = checker = None
+    else:
+        key = (frame.f_globals.get("__name__"), annotations)
+        try:
+            checker = _checkers.get(key)
+        except TypeError:  # unhashable annotation
+            key = checker = None
+    if checker is None:
+        checker = Checker.__new__(Checker)
+        checker._compile(dict(annotations), frame)
+        if key is not None:
+            _checkers.put(key, checker)
+    checker._check(**{name: value for name, (value, _) in values.items()})
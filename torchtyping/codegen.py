@@ -0,0 +1,588 @@
+import inspect
+import sys
+import time
+
+from . import sampling
+from .check_plan import _CheckPlan, _TensorSpec
+from .deferred import _failures, _report, _values_match_later
+from .scopes import _dims, _record, _seed
+from .tensor_details import _FloatDetail, DtypeDetail, LayoutDetail, ShapeDetail
+from .value_details import _values_match
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# get_args is available in python version 3.8
+if sys.version_info >= (3, 9):
+    from typing import get_args
+else:
+    from typing_extensions import get_args
+
+
+# CODE GENERATION
+#######################
+# torchtyping.typechecked doesn't use typeguard's generic wrapper, which binds the
+# arguments and builds a _CallMemo on every call. Instead it generates (with `exec`) a
+# wrapper specialised to the function being checked. This has the same parameters as
+# the function, so the arguments are just local variables, and every argument annotated
+# directly with a TensorType is checked by inlined code: an isinstance, comparisons of
+# its number of dimensions, sizes, dtype and layout against constants, and comparisons
+# of the sizes of its named dimensions against local variables. Details that read the
+# tensors' values (see DetailCost) are only checked after all of that (if they're not
+# deferred to a background thread: see deferred.py). Arguments with any other
+# annotation are checked with typeguard's check_type.
+#
+# The inlined checks don't produce any error messages. If any of them fails then the
+# call is checked again the generic way (exactly as for typeguard.typechecked), which
+# produces the usual error message.
+#
+# Named dimensions may also be bound by a dimension scope (see scopes.py). So if there
+# are any, every size starts out as None, and is seeded from the current scope (if
+# there is one) before the checks, which then record any newly inferred sizes in it.
+#
+# Some annotations need more than this: named `...`, is_named, or TensorTypes inside
+# other types (e.g. Tuple[TensorType[...], ...]). Functions with these still get a
+# generated wrapper, but it just builds a memo for the call and hands it straight to the
+# generic checks. A metadata cache (`cache_size`) is only used by these: the inlined
+# checks are cheaper than looking up a key in a cache.
+
+
+class _Mismatch(Exception):
+    # Raised by the inlined checks.
+    pass
+
+
+_prefix = "_tt_"
+
+
+def _inlinable(spec: _TensorSpec) -> bool:
+    shape_detail = spec.shape_detail
+    return (
+        (shape_detail is None or type(shape_detail) is ShapeDetail)
+        and not spec.check_names
+        and not spec.group_counts
+        and len(spec.groups) <= 1
+    )
+
+
+def _contains_spec(plan: _CheckPlan, annotation: Any) -> bool:
+    if plan.spec(annotation) is not None:
+        return True
+    try:
+        args = get_args(annotation)
+    except Exception:
+        return False
+    return any(
+        not isinstance(arg, (str, bytes)) and _contains_spec(plan, arg) for arg in args
+    )
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+        self.indent = 1
+        self.namespace = {}
+
+    def line(self, text: str) -> None:
+        self.lines.append("    " * self.indent + text)
+
+    def constant(self, value: Any) -> str:
+        name = f"{_prefix}c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+
+class _Sizes:
+    # Which named dimensions already have their size in a local variable (`bound`), and
+    # which might do, depending on whether an optional argument was passed (`maybe`).
+    # The latter are initialised to None up front.
+    def __init__(self):
+        self.bound = set()
+        self.maybe = set()
+
+    def copy(self) -> "_Sizes":
+        sizes = _Sizes()
+        sizes.bound = set(self.bound)
+        sizes.maybe = self.maybe
+        return sizes
+
+
+def _write_binding(writer: _Writer, expr: str, slot: int, sizes: _Sizes) -> None:
+    var = f"{_prefix}size{slot}"
+    if slot in sizes.bound:
+        writer.line(f"if {expr} != {var}: raise {_prefix}Mismatch")
+    elif slot in sizes.maybe:
+        writer.line(f"if {var} is None: {var} = {expr}")
+        writer.line(f"elif {expr} != {var}: raise {_prefix}Mismatch")
+    else:
+        writer.line(f"{var} = {expr}")
+    sizes.bound.add(slot)
+
+
+def _write_tensor_check(
+    writer: _Writer, value: str, spec: _TensorSpec, optional: bool, sizes: _Sizes
+) -> None:
+    mismatch = f"raise {_prefix}Mismatch"
+    if optional:
+        writer.line(f"if {value} is not None:")
+        writer.indent += 1
+        outer, sizes = sizes, sizes.copy()
+    writer.line(
+        f"if not {_prefix}isinstance({value}, {writer.constant(spec.base_cls)}): "
+        f"{mismatch}"
+    )
+    for detail in spec.metadata_details:
+        if type(detail) is DtypeDetail:
+            writer.line(
+                f"if {value}.dtype != {writer.constant(detail.dtype)}: {mismatch}"
+            )
+        elif type(detail) is LayoutDetail:
+            writer.line(
+                f"if {value}.layout != {writer.constant(detail.layout)}: {mismatch}"
+            )
+        elif type(detail) is _FloatDetail:
+            writer.line(f"if not {value}.is_floating_point(): {mismatch}")
+        elif detail is not spec.shape_detail:
+            writer.line(f"if not {writer.constant(detail)}.check({value}): {mismatch}")
+    for detail in spec.other_details:
+        writer.line(f"if not {writer.constant(detail)}.check({value}): {mismatch}")
+    if spec.shape_detail is not None:
+        shape = f"{_prefix}shape"
+        writer.line(f"{shape} = {value}.shape")
+        comparison = "<" if spec.groups else "!="
+        writer.line(
+            f"if {_prefix}len({shape}) {comparison} {spec.num_plain}: {mismatch}"
+        )
+        for index, size in spec.shape_detail._size_checks:
+            writer.line(f"if {shape}[{index}] != {size!r}: {mismatch}")
+        for index, slot, _ in spec.bindings:
+            _write_binding(writer, f"{shape}[{index}]", slot, sizes)
+    if optional:
+        writer.indent -= 1
+        outer.maybe.update(sizes.bound - outer.bound)
+
+
+def _write_value_checks(
+    writer: _Writer,
+    checks: List[Tuple[str, str, _TensorSpec]],
+    func_name: Optional[str],
+) -> None:
+    # The details reading the tensors' values, which are left until after every other
+    # check (see DetailCost), and then checked all together (see value_details.py), or
+    # deferred if `func_name` is given (see deferred.py). `checks` contains triples
+    # (value, description, spec). Optional values that are None are skipped.
+    checks = [check for check in checks if check[2].value_details]
+    if not checks:
+        return
+    items = "".join(
+        f"({value}, {writer.constant(spec.value_details)}), "
+        for value, _, spec in checks
+    )
+    if func_name is None:
+        call = f"{_prefix}values_match(({items}))"
+    else:
+        targets = tuple((description, spec) for _, description, spec in checks)
+        call = (
+            f"{_prefix}values_match_later(({items}), {writer.constant(targets)}, "
+            f"{writer.constant(func_name)})"
+        )
+    writer.line(f"if {call} != -1: raise {_prefix}Mismatch")
+
+
+def _write_seed(writer: _Writer, plan: _CheckPlan, sizes: _Sizes) -> None:
+    # Every size might be bound by the scope, so they're all initialised to None.
+    sizes.maybe.update(range(plan.num_sizes))
+    names = writer.constant(tuple(plan.size_names))
+    variables = "".join(f"{_prefix}size{slot}, " for slot in range(plan.num_sizes))
+    writer.line(f"{_prefix}scope = {_prefix}dims.get()")
+    writer.line(f"if {_prefix}scope is not None:")
+    writer.line(f"    {variables}= {_prefix}seed({_prefix}scope, {names})")
+
+
+def _write_record(writer: _Writer, plan: _CheckPlan) -> None:
+    names = writer.constant(tuple(plan.size_names))
+    variables = "".join(f"{_prefix}size{slot}, " for slot in range(plan.num_sizes))
+    writer.line(f"if {_prefix}scope is not None:")
+    writer.line(f"    {_prefix}record({_prefix}scope, {names}, ({variables}))")
+
+
+def _write_checks(
+    writer: _Writer, checks: List[tuple], sizes: _Sizes, func_name: str
+) -> None:
+    # `checks` contains tuples (value, description, expected_type, spec, optional),
+    # where `value` is the source of the value to check.
+    start = len(writer.lines)
+    for value, description, expected_type, spec, optional in checks:
+        if spec is None:
+            writer.line(
+                f"{_prefix}check_type({description!r}, {value}, "
+                f"{writer.constant(expected_type)}, {_prefix}memo0)"
+            )
+        else:
+            _write_tensor_check(writer, value, spec, optional, sizes)
+    _write_value_checks(
+        writer,
+        [
+            (value, description, spec)
+            for value, description, _, spec, _ in checks
+            if spec is not None
+        ],
+        func_name,
+    )
+    if len(writer.lines) == start:
+        writer.line("pass")
+
+
+def _signature_source(signature: inspect.Signature) -> Dict[str, str]:
+    # The source of the wrapper's parameters (with placeholder defaults; the real ones
+    # are copied over afterwards), of the call to the wrapped function, and of the
+    # arguments as a dictionary (for the generic checks) and as args and kwargs (for the
+    # sampling policies).
+    params = []
+    call = []
+    arguments = []
+    positional = []
+    keywords = []
+    kinds = inspect.Parameter
+    previous_kind = None
+    for name, parameter in signature.parameters.items():
+        kind = parameter.kind
+        if previous_kind is kinds.POSITIONAL_ONLY and kind is not kinds.POSITIONAL_ONLY:
+            params.append("/")
+        if kind is kinds.KEYWORD_ONLY and previous_kind not in (
+            kinds.KEYWORD_ONLY,
+            kinds.VAR_POSITIONAL,
+        ):
+            params.append("*")
+        default = "" if parameter.default is parameter.empty else "=None"
+        if kind in (kinds.POSITIONAL_ONLY, kinds.POSITIONAL_OR_KEYWORD):
+            params.append(name + default)
+            call.append(name)
+            positional.append(name)
+        elif kind is kinds.VAR_POSITIONAL:
+            params.append("*" + name)
+            call.append("*" + name)
+            positional.append("*" + name)
+        elif kind is kinds.KEYWORD_ONLY:
+            params.append(name + default)
+            call.append(f"{name}={name}")
+            keywords.append(f"{name!r}: {name}")
+        else:
+            params.append("**" + name)
+            call.append("**" + name)
+            keywords.append("**" + name)
+        arguments.append(f"{name!r}: {name}")
+        previous_kind = kind
+    if previous_kind is kinds.POSITIONAL_ONLY:
+        params.append("/")
+    return {
+        "params": ", ".join(params),
+        "call": ", ".join(call),
+        "arguments": "{" + ", ".join(arguments) + "}",
+        "args": "(" + "".join(arg + ", " for arg in positional) + ")",
+        "kwargs": "{" + ", ".join(keywords) + "}",
+    }
+
+
+_stub = """\
+def _tt_wrapper({params}):
+    _tt_first_call()
+    return _tt_wrapper({call})
+"""
+
+_delegate = """\
+def _tt_wrapper({params}):
+    return _tt_delegate({call})
+"""
+
+_prelude = """\
+def _tt_wrapper({params}):
+    if not _tt_switch.enabled:
+        return _tt_func({call})
+    _tt_stats.calls += 1
+    if (
+        _tt_plan.sample is not None or _tt_sampling._default_policy is not None
+    ) and _tt_skip(_tt_plan, {args}, {kwargs}):
+        return _tt_func({call})
+    _tt_stats.checked += 1
+    if _tt_failures:
+        _tt_report()
+"""
+
+_generic_body = """\
+    _tt_memo = _tt_new_memo({arguments})
+    _tt_check_argument_types(_tt_memo)
+    _tt_ret = _tt_func({call})
+    _tt_check_return_type(_tt_ret, _tt_memo)
+    return _tt_ret
+"""
+
+_inline_body = """\
+    _tt_start = _tt_perf_counter_ns()
+    _tt_memo = None
+    try:
+{checks}
+    except _tt_Mismatch:
+        _tt_memo = _tt_recheck_arguments({arguments})
+    except _tt_TypeError:
+        _tt_stats.failures += 1
+        raise
+    _tt_func_start = _tt_perf_counter_ns()
+    _tt_stats.check_time_ns += _tt_func_start - _tt_start
+    _tt_ret = _tt_func({call})
+    if _tt_memo is None:
+        _tt_return_start = _tt_perf_counter_ns()
+        try:
+{return_checks}
+        except _tt_Mismatch:
+            # The arguments may have been modified by the function, so only the return
+            # value is checked again, against the sizes found for the arguments.
+            _tt_check_return(_tt_ret, {arguments}, ({argument_sizes}), {scope})
+            return _tt_ret
+        except _tt_TypeError:
+            _tt_stats.failures += 1
+            raise
+        else:
+            _tt_end = _tt_perf_counter_ns()
+            _tt_stats.check_time_ns += _tt_end - _tt_return_start
+            if _tt_plan.sampler_record is not None:
+                _tt_plan.sampler_record(
+                    (_tt_func_start - _tt_start + _tt_end - _tt_return_start) * 1e-9,
+                    (_tt_return_start - _tt_func_start) * 1e-9,
+                )
+            return _tt_ret
+    _tt_check_return_type(_tt_ret, _tt_memo)
+    return _tt_ret
+"""
+
+
+_checker = """\
+def _tt_checker({params}):
+    if not _tt_switch.enabled:
+        return
+    if _tt_failures:
+        _tt_report()
+    try:
+{checks}
+    except _tt_Mismatch:
+        _tt_recheck_arguments({arguments})
+"""
+
+
+def _make_checker(
+    names: List[str], plan: _CheckPlan, helpers: Dict[str, Any], name: str
+) -> Callable:
+    # A function with parameters `names`, checking its arguments against `plan` (see
+    # torchtyping.Checker). The same as the argument checks of a wrapper made by
+    # _specialise, but without the call to anything afterwards.
+    for param in names:
+        if not param.isidentifier() or param.startswith(_prefix):
+            raise ValueError(f"Invalid name {param!r}.")
+    writer = _Writer()
+    writer.indent = 2
+    if _is_inline(plan):
+        sizes = _Sizes()
+        if plan.num_sizes:
+            _write_seed(writer, plan, sizes)
+        _write_checks(writer, plan.arguments, sizes, plan.func_name)
+        if plan.num_sizes:
+            _write_record(writer, plan)
+        inits = [f"        {_prefix}size{slot} = None" for slot in sorted(sizes.maybe)]
+        writer.lines = inits + writer.lines
+    else:
+        writer.line(f"raise {_prefix}Mismatch")
+    namespace = writer.namespace
+    namespace.update({_prefix + key: value for key, value in helpers.items()})
+    namespace.update(
+        {
+            f"{_prefix}switch": plan.switch,
+            f"{_prefix}Mismatch": _Mismatch,
+            f"{_prefix}isinstance": isinstance,
+            f"{_prefix}len": len,
+            f"{_prefix}values_match_later": _values_match_later,
+            f"{_prefix}failures": _failures,
+            f"{_prefix}report": _report,
+            f"{_prefix}dims": _dims,
+            f"{_prefix}seed": _seed,
+            f"{_prefix}record": _record,
+        }
+    )
+    text = _checker.format(
+        params=", ".join(names),
+        checks="\n".join(writer.lines),
+        arguments="{" + ", ".join(f"{param!r}: {param}" for param in names) + "}",
+    )
+    exec(_compile(text, name), namespace)
+    return namespace[f"{_prefix}checker"]
+
+
+_predicate = """\
+def _tt_predicate(_tt_value):
+    try:
+{checks}
+    except _tt_Mismatch:
+        return False
+    return True
+"""
+
+
+def _tensor_predicate(spec: _TensorSpec) -> Optional[Callable[[Any], bool]]:
+    # A function returning whether a single value matches `spec`, using the same inlined
+    # checks as above. Named dimensions are only checked for consistency within the
+    # value itself. Returns None if `spec` can't be inlined.
+    if not _inlinable(spec):
+        return None
+    writer = _Writer()
+    writer.indent = 2
+    _write_tensor_check(writer, f"{_prefix}value", spec, False, _Sizes())
+    _write_value_checks(writer, [(f"{_prefix}value", "", spec)], None)
+    namespace = writer.namespace
+    namespace.update(
+        {
+            f"{_prefix}Mismatch": _Mismatch,
+            f"{_prefix}isinstance": isinstance,
+            f"{_prefix}len": len,
+            f"{_prefix}values_match": _values_match,
+        }
+    )
+    text = _predicate.format(checks="\n".join(writer.lines))
+    exec(_compile(text, spec.metadata["cls_name"]), namespace)
+    return namespace[f"{_prefix}predicate"]
+
+
+def _is_inline(plan: _CheckPlan) -> bool:
+    checks = list(plan.arguments)
+    if plan.return_type is not None:
+        checks.append((None, *plan.return_type))
+    for _, _, expected_type, spec, _ in checks:
+        if spec is None:
+            if _contains_spec(plan, expected_type):
+                return False
+        elif not _inlinable(spec):
+            return False
+    return True
+
+
+def _compile(text: str, name: str) -> Any:
+    return compile(text, f"<torchtyping wrapper of {name}>", "exec")
+
+
+def _make_stub(
+    func: Callable, signature: inspect.Signature, first_call: Callable[[], None]
+) -> Callable:
+    # A wrapper with the same parameters as `func`, which calls `first_call()` the first
+    # time it's called. This should then replace the wrapper's code using either
+    # _specialise or _delegate_to. (The wrapper's globals are shared by all of these.)
+    for name in signature.parameters:
+        if name.startswith(_prefix):
+            raise ValueError(f"Parameter name {name!r} is reserved.")
+    text = _stub.format(**_signature_source(signature))
+    namespace = {f"{_prefix}first_call": first_call}
+    exec(_compile(text, func.__qualname__), namespace)
+    wrapper = namespace[f"{_prefix}wrapper"]
+    wrapper.__defaults__ = func.__defaults__
+    if func.__kwdefaults__ is not None:
+        wrapper.__kwdefaults__ = dict(func.__kwdefaults__)
+    return wrapper
+
+
+def _set_code(
+    wrapper: Callable, text: str, name: str, namespace: Dict[str, Any]
+) -> None:
+    scratch = {}
+    exec(_compile(text, name), scratch)
+    wrapper.__globals__.update(namespace)
+    wrapper.__code__ = scratch[f"{_prefix}wrapper"].__code__
+
+
+def _delegate_to(
+    wrapper: Callable, signature: inspect.Signature, name: str, target: Callable
+) -> None:
+    # Makes `wrapper` just call `target`.
+    text = _delegate.format(**_signature_source(signature))
+    _set_code(wrapper, text, name, {f"{_prefix}delegate": target})
+
+
+def _specialise(
+    wrapper: Callable,
+    signature: inspect.Signature,
+    func: Callable,
+    plan: _CheckPlan,
+    helpers: Dict[str, Any],
+) -> None:
+    # Makes `wrapper` check and call `func`, as described above.
+    #
+    # `helpers` provides the generic checks (see typechecker.py):
+    # - "new_memo": arguments -> a memo for a call with these arguments.
+    # - "recheck_arguments": arguments -> a memo, after checking the arguments the
+    #   generic way.
+    # - "check_return": (return value, arguments, sizes, scope) -> None, checking the
+    #   return value the generic way, given the sizes of the named dimensions (by slot)
+    #   and the dimension scope found when checking the arguments.
+    # - "check_argument_types", "check_return_type": as patched by patch_typeguard.
+    # - "check_type" and "memo0": typeguard's (unpatched) check_type, and a memo to
+    #   pass to it.
+    source = _signature_source(signature)
+    writer = _Writer()
+    writer.indent = 2
+    if _is_inline(plan):
+        sizes = _Sizes()
+        if plan.num_sizes:
+            _write_seed(writer, plan, sizes)
+        _write_checks(writer, plan.arguments, sizes, plan.func_name)
+        if plan.num_sizes:
+            _write_record(writer, plan)
+        checks = writer.lines
+        writer.lines = []
+        # The sizes known once the arguments have been checked.
+        argument_sizes = "".join(
+            f"{_prefix}size{slot}, " if slot in sizes.bound | sizes.maybe else "None, "
+            for slot in range(plan.num_sizes)
+        )
+        writer.indent = 3
+        if plan.return_type is not None:
+            _write_checks(
+                writer,
+                [(f"{_prefix}ret", *plan.return_type)],
+                sizes,
+                plan.func_name,
+            )
+            if plan.num_sizes:
+                _write_record(writer, plan)
+        else:
+            writer.line("pass")
+        return_checks = writer.lines
+        inits = [f"        {_prefix}size{slot} = None" for slot in sorted(sizes.maybe)]
+        body = _inline_body.format(
+            checks="\n".join(inits + checks),
+            return_checks="\n".join(return_checks),
+            argument_sizes=argument_sizes,
+            scope=f"{_prefix}scope" if plan.num_sizes else "None",
+            **source,
+        )
+    else:
+        body = _generic_body.format(**source)
+
+    namespace = writer.namespace
+    namespace.update({_prefix + name: value for name, value in helpers.items()})
+    namespace.update(
+        {
+            f"{_prefix}func": func,
+            f"{_prefix}plan": plan,
+            f"{_prefix}stats": plan.stats,
+            f"{_prefix}switch": plan.switch,
+            f"{_prefix}sampling": sampling,
+            f"{_prefix}skip": sampling._skip,
+            f"{_prefix}perf_counter_ns": time.perf_counter_ns,
+            f"{_prefix}Mismatch": _Mismatch,
+            f"{_prefix}isinstance": isinstance,
+            f"{_prefix}len": len,
+            f"{_prefix}values_match_later": _values_match_later,
+            f"{_prefix}failures": _failures,
+            f"{_prefix}report": _report,
+            f"{_prefix}TypeError": TypeError,
+            f"{_prefix}dims": _dims,
+            f"{_prefix}seed": _seed,
+            f"{_prefix}record": _record,
+        }
+    )
+    _set_code(wrapper, _prelude.format(**source) + body, plan.func_name, namespace)
@@ -0,0 +1,178 @@
+import atexit
+import os
+import queue
+import threading
+import torch
+import warnings
+
+from .value_details import _cache_key, _values_match
+
+from typing import Any, List, Optional, Sequence, Tuple
+
+# DEFERRED VALUE CHECKS
+#######################
+# Details that read the values of a tensor (see DetailCost) can be expensive, and for a
+# CUDA tensor checking them means waiting for the device. With
+# `torchtyping.set_deferred(True)` they're instead checked on a background thread: the
+# rest of each call's checks (shapes, dtypes, and so on) still happen during the call,
+# but the value details of the tensors passed directly as arguments (or returned) are
+# put on a queue, together with the `_version` of each tensor at the time of the call.
+#
+# The worker thread checks each call's tensors together, as they would have been (see
+# value_details.py). Any tensor that has been modified in place by the time the worker
+# reaches it (i.e. whose `_version` has changed) is skipped, as the values it was
+# passed with are gone. Any failures are recorded, along with the function and argument
+# they came from, and raised as a TypeError at the next checkpoint: the start of the
+# next checked call, a call to `torchtyping.flush()`, or (as a warning) at exit.
+#
+# If the queue is full, or a tensor doesn't have a `_version` (inference tensors), then
+# the call's values are just checked immediately, as usual. Tensors already known to
+# pass (see value_details.py) aren't queued at all.
+#
+# Only torchtyping.typechecked, Checker and typeguard 2 patched by patch_typeguard defer
+# checks. Every other checked value (inside other types, or with beartype or typeguard 3
+# or later) is still checked immediately.
+
+
+_lock = threading.Lock()
+_enabled = False
+_queue = queue.Queue(maxsize=64)
+_worker: Optional[threading.Thread] = None
+# Messages describing the failures found since the last checkpoint. This list is only
+# ever mutated in place, so that generated code may hold a reference to it.
+_failures: List[str] = []
+
+
+def set_deferred(enabled: bool = True, *, max_pending: int = 64) -> None:
+    # Turns deferred value checks on or off. `max_pending` is the number of calls whose
+    # checks may be waiting at once, beyond which calls are checked immediately. Turning
+    # deferred checks off first waits for any pending ones, as `flush` does.
+    global _enabled
+    if max_pending < 1:
+        raise ValueError(f"max_pending must be at least 1; got {max_pending}.")
+    if not enabled:
+        _enabled = False
+        flush()
+    _queue.maxsize = max_pending
+    _enabled = enabled
+
+
+def get_deferred() -> bool:
+    return _enabled
+
+
+def flush() -> None:
+    # Waits for every deferred check so far, and raises a TypeError if any have failed.
+    if _worker is not None:
+        _queue.join()
+    _report()
+
+
+def _report() -> None:
+    # Raises the failures found since the last checkpoint, if there are any.
+    with _lock:
+        failures = _failures[:]
+        _failures.clear()
+    if failures:
+        message = failures[0]
+        if len(failures) > 1:
+            message += f" (And {len(failures) - 1} more deferred check failures.)"
+        raise TypeError(message)
+
+
+def _values_match_later(
+    items: Sequence[Tuple[Optional[torch.Tensor], Sequence[Any]]],
+    targets: Sequence[Tuple[str, Any]],
+    func_name: str,
+) -> int:
+    # As _values_match, but if deferred checks are on then it queues the checks and
+    # returns -1 straight away. `targets` contains a pair (description, spec) for each
+    # of `items`, describing where its tensor came from.
+    if not _enabled:
+        return _values_match(items)
+    entries = []
+    for (value, details), (description, spec) in zip(items, targets):
+        if value is None or value.numel() == 0 or _cache_key(value, details) is None:
+            continue
+        try:
+            version = value._version
+        except RuntimeError:  # inference tensor
+            return _values_match(items)
+        stream = torch.cuda.current_stream(value.device) if value.is_cuda else None
+        entries.append((value, version, stream, details, description, spec))
+    if not entries:
+        return -1
+    if _worker is None:
+        _start()
+    try:
+        _queue.put_nowait((func_name, entries))
+    except queue.Full:
+        return _values_match(items)
+    return -1
+
+
+def _start() -> None:
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(
+                target=_work, name="torchtyping-deferred", daemon=True
+            )
+            _worker.start()
+
+
+def _work() -> None:
+    while True:
+        func_name, entries = _queue.get()
+        try:
+            _check(func_name, entries)
+        except Exception as exc:  # the worker must outlive any one check
+            with _lock:
+                _failures.append(f"Deferred check of {func_name} raised {exc!r}.")
+        finally:
+            _queue.task_done()
+
+
+def _check(func_name: str, entries: List[Tuple[Any, ...]]) -> None:
+    items = []
+    for value, version, stream, details, _, _ in entries:
+        if stream is not None:
+            # Wait for the work that produced the tensor.
+            stream.synchronize()
+        items.append((value if value._version == version else None, details))
+    with torch.no_grad():
+        while True:
+            index = _values_match(items)
+            if index == -1:
+                return
+            value, version, _, details, description, spec = entries[index]
+            items[index] = (None, details)
+            if value._version != version:  # modified while it was being checked
+                continue
+            message = (
+                f"{description} of {func_name} (checked in the background) "
+                f"{spec.mismatch_message(value)}"
+            )
+            with _lock:
+                _failures.append(message)
+
+
+def _at_exit() -> None:
+    try:
+        flush()
+    except TypeError as exc:
+        warnings.warn(str(exc), RuntimeWarning)
+
+
+def _after_fork() -> None:
+    # The worker thread doesn't survive a fork (and may have held the lock).
+    global _lock, _queue, _worker
+    _lock = threading.Lock()
+    _queue = queue.Queue(maxsize=_queue.maxsize)
+    _worker = None
+    _failures.clear()
+
+
+atexit.register(_at_exit)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
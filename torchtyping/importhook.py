@@ -0,0 +1,320 @@
+import ast
+import sys
+
+from importlib.abc import MetaPathFinder
+from importlib.machinery import PathFinder, SourceFileLoader
+from importlib.util import cache_from_source, decode_source
+from unittest.mock import patch
+
+from typing import Any, Iterable, List, Optional, Set, Union
+
+# IMPORT HOOK
+#######################
+# Like typeguard's import hook, this rewrites the AST of every module in the given
+# packages as it's imported. Unlike typeguard's, it only touches functions with a
+# TensorType somewhere in their annotations:
+#
+# - In "instrument" mode, each such function gets `@torchtyping.typechecked` as its
+#   innermost decorator (so that it's applied before e.g. staticmethod or property).
+#   Every other function is left alone, so costs nothing.
+# - In "strip" mode, which is meant for release builds, the torchtyping decorators
+#   (`typechecked` and `beartyped`) are removed from every function and class, as is
+#   `typeguard.typechecked` from each such function.
+#
+# As the hook only sees source code, a "TensorType" is anything referred to as
+# `TensorType` or `torchtyping.TensorType`, or by any other name it's imported under.
+# String annotations are parsed and looked through as well.
+
+
+_modes = ("instrument", "strip")
+
+# The name that torchtyping is imported under in instrumented modules.
+_module_alias = "_torchtyping_importhook"
+
+_checks = {"typechecked", "beartyped"}
+
+
+# The name of this function is magical: it's removed from tracebacks by importlib.
+def _call_with_frames_removed(f, *args, **kwargs):
+    return f(*args, **kwargs)
+
+
+def _string_value(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if sys.version_info < (3, 8) and isinstance(node, ast.Str):
+        return node.s
+    return None
+
+
+class _Names:
+    # The names that torchtyping and typeguard (and the parts of them that we care
+    # about) are bound to in a module. These are collected from the module's imports
+    # before anything is transformed.
+
+    def __init__(self):
+        self.tensor_types = {"TensorType"}
+        self.checks = set()  # torchtyping.typechecked and torchtyping.beartyped
+        self.typeguard_checks = set()
+        self.torchtyping_modules = {"torchtyping"}
+        self.typeguard_modules = set()
+
+    def collect(self, tree: ast.AST) -> None:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    bound = alias.asname or alias.name.split(".")[0]
+                    if alias.name == "torchtyping":
+                        self.torchtyping_modules.add(bound)
+                    elif alias.name == "typeguard":
+                        self.typeguard_modules.add(bound)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                for alias in node.names:
+                    bound = alias.asname or alias.name
+                    if node.module in ("torchtyping", "torchtyping.tensor_type"):
+                        if alias.name == "TensorType":
+                            self.tensor_types.add(bound)
+                    if node.module in ("torchtyping", "torchtyping.typechecker"):
+                        if alias.name in _checks:
+                            self.checks.add(bound)
+                    elif node.module == "torchtyping.beartype_backend":
+                        if alias.name == "beartyped":
+                            self.checks.add(bound)
+                    elif node.module == "typeguard" and alias.name == "typechecked":
+                        self.typeguard_checks.add(bound)
+
+    def is_tensor_type(self, node: ast.AST) -> bool:
+        if isinstance(node, ast.Name):
+            return node.id in self.tensor_types
+        if isinstance(node, ast.Attribute):
+            return (
+                node.attr == "TensorType"
+                and isinstance(node.value, ast.Name)
+                and node.value.id in self.torchtyping_modules
+            )
+        return False
+
+    def _matches(self, node: ast.AST, names: Set[str], modules: Set[str]) -> bool:
+        if isinstance(node, ast.Call):
+            # e.g. @typechecked(always=True)
+            node = node.func
+        if isinstance(node, ast.Name):
+            return node.id in names
+        if isinstance(node, ast.Attribute):
+            return (
+                node.attr in _checks
+                and isinstance(node.value, ast.Name)
+                and node.value.id in modules
+            )
+        return False
+
+    def is_check(self, node: ast.AST) -> bool:
+        return self._matches(node, self.checks, self.torchtyping_modules)
+
+    def is_typeguard_check(self, node: ast.AST) -> bool:
+        if isinstance(node, ast.Attribute) and node.attr != "typechecked":
+            return False
+        return self._matches(node, self.typeguard_checks, self.typeguard_modules)
+
+
+def _mentions_tensor_type(node: Optional[ast.AST], names: _Names) -> bool:
+    if node is None:
+        return False
+    for child in ast.walk(node):
+        if names.is_tensor_type(child):
+            return True
+        string = _string_value(child)
+        if string is not None:
+            try:
+                expression = ast.parse(string.strip(), mode="eval")
+            except SyntaxError:
+                continue
+            if _mentions_tensor_type(expression, names):
+                return True
+    return False
+
+
+def _has_tensor_annotations(
+    node: Union[ast.FunctionDef, ast.AsyncFunctionDef], names: _Names
+) -> bool:
+    arguments = node.args
+    args = list(getattr(arguments, "posonlyargs", [])) + arguments.args
+    args += arguments.kwonlyargs + [arguments.vararg, arguments.kwarg]
+    annotations = [arg.annotation for arg in args if arg is not None]
+    annotations.append(node.returns)
+    return any(_mentions_tensor_type(annotation, names) for annotation in annotations)
+
+
+class _Transformer(ast.NodeTransformer):
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.names = _Names()
+        self.changed = False
+        self._checked_classes = 0
+
+    def visit_Module(self, node: ast.Module) -> ast.Module:
+        self.names.collect(node)
+        self.generic_visit(node)
+        if self.changed and self.mode == "instrument":
+            # Insert the import after any docstring and `from __future__` imports.
+            for index, child in enumerate(node.body):
+                if isinstance(child, ast.ImportFrom) and child.module == "__future__":
+                    continue
+                if index == 0 and isinstance(child, ast.Expr):
+                    if _string_value(child.value) is not None:
+                        continue
+                break
+            else:
+                index = len(node.body)
+            alias = ast.alias(name="torchtyping", asname=_module_alias)
+            node.body.insert(index, ast.Import(names=[alias]))
+        return node
+
+    def _strip(self, decorators: List[ast.AST], typeguard: bool) -> List[ast.AST]:
+        kept = [
+            decorator
+            for decorator in decorators
+            if not self.names.is_check(decorator)
+            and not (typeguard and self.names.is_typeguard_check(decorator))
+        ]
+        if len(kept) != len(decorators):
+            self.changed = True
+        return kept
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> ast.ClassDef:
+        if self.mode == "strip":
+            node.decorator_list = self._strip(node.decorator_list, typeguard=False)
+            self.generic_visit(node)
+            return node
+        # Methods of a class that's already checked as a whole are left alone.
+        checked = any(self.names.is_check(d) for d in node.decorator_list)
+        self._checked_classes += checked
+        self.generic_visit(node)
+        self._checked_classes -= checked
+        return node
+
+    def _visit_function(
+        self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef]
+    ) -> ast.AST:
+        if _has_tensor_annotations(node, self.names):
+            if self.mode == "strip":
+                node.decorator_list = self._strip(node.decorator_list, typeguard=True)
+            elif not self._checked_classes and not any(
+                self.names.is_check(decorator) for decorator in node.decorator_list
+            ):
+                decorator = ast.Attribute(
+                    value=ast.Name(id=_module_alias, ctx=ast.Load()),
+                    attr="typechecked",
+                    ctx=ast.Load(),
+                )
+                node.decorator_list.append(ast.copy_location(decorator, node))
+                self.changed = True
+        elif self.mode == "strip":
+            node.decorator_list = self._strip(node.decorator_list, typeguard=False)
+        # Nested functions are transformed too, but not counted as methods.
+        checked_classes = self._checked_classes
+        self._checked_classes = 0
+        self.generic_visit(node)
+        self._checked_classes = checked_classes
+        return node
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+
+class _Loader(SourceFileLoader):
+    def __init__(self, fullname: str, path: str, mode: str):
+        super().__init__(fullname, path)
+        self.mode = mode
+
+    def source_to_code(self, data, path, *, _optimize=-1):
+        source = decode_source(data)
+        tree = _call_with_frames_removed(
+            compile,
+            source,
+            path,
+            "exec",
+            ast.PyCF_ONLY_AST,
+            dont_inherit=True,
+            optimize=_optimize,
+        )
+        tree = _Transformer(self.mode).visit(tree)
+        ast.fix_missing_locations(tree)
+        return _call_with_frames_removed(
+            compile, tree, path, "exec", dont_inherit=True, optimize=_optimize
+        )
+
+    def exec_module(self, module):
+        # Keep the transformed bytecode apart from the usual cached bytecode (and from
+        # that of the other mode). The import lock makes this patch safe.
+        optimization = "torchtyping" + self.mode
+
+        def optimized_cache_from_source(path, debug_override=None):
+            return cache_from_source(path, debug_override, optimization=optimization)
+
+        with patch(
+            "importlib._bootstrap_external.cache_from_source",
+            optimized_cache_from_source,
+        ):
+            return super().exec_module(module)
+
+
+class _Finder(MetaPathFinder):
+    # Wraps another path finder, and loads the modules of the given packages with a
+    # _Loader.
+
+    def __init__(self, packages: List[str], original_pathfinder: Any, mode: str):
+        self.packages = packages
+        self.mode = mode
+        self._original_pathfinder = original_pathfinder
+
+    def find_spec(self, fullname, path=None, target=None):
+        if self.should_transform(fullname):
+            spec = self._original_pathfinder.find_spec(fullname, path, target)
+            if spec is not None and isinstance(spec.loader, SourceFileLoader):
+                spec.loader = _Loader(spec.loader.name, spec.loader.path, self.mode)
+                return spec
+        return None
+
+    def should_transform(self, module_name: str) -> bool:
+        for package in self.packages:
+            if module_name == package or module_name.startswith(package + "."):
+                return True
+        return False
+
+
+class ImportHookManager:
+    def __init__(self, hook: MetaPathFinder):
+        self.hook = hook
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+
+    def uninstall(self) -> None:
+        try:
+            sys.meta_path.remove(self.hook)
+        except ValueError:
+            pass  # already removed
+
+
+def install_import_hook(
+    packages: Union[str, Iterable[str]], *, mode: str = "instrument"
+) -> ImportHookManager:
+    # Transforms the modules of `packages` (and their subpackages) imported from now on,
+    # as described above. `mode` is either "instrument" or "strip". Returns a context
+    # manager that uninstalls the hook on exit, or when its `uninstall()` is called.
+    if mode not in _modes:
+        raise ValueError(f"mode must be one of {_modes}, not {mode!r}.")
+    if isinstance(packages, str):
+        packages = [packages]
+    for finder in sys.meta_path:
+        if finder is PathFinder:
+            break
+    else:
+        raise RuntimeError("Cannot find a PathFinder in sys.meta_path")
+    hook = _Finder(list(packages), finder, mode)
+    sys.meta_path.insert(0, hook)
+    return ImportHookManager(hook)
@@ -0,0 +1,196 @@
+import contextlib
+import os
+import threading
+import types
+
+from .sampling import (
+    SampleBudget,
+    SampleEvery,
+    SampleFirst,
+    SampleNewShapes,
+    SampleRandom,
+    SamplingPolicy,
+)
+
+from typing import Dict, Iterator, Optional, Union
+
+# MODE
+#######################
+# Whether checking is on at all is decided by the TORCHTYPING_MODE environment
+# variable, which may be:
+#
+# "on": check every call (subject to any sampling policies set in code).
+# "off": torchtyping.typechecked returns functions unchanged, and patch_typeguard does
+#     nothing, so there's no per-call cost at all.
+# "sample": as "on", but with a global default sampling policy given by the
+#     TORCHTYPING_SAMPLE environment variable. (See _parse_policy.)
+#
+# If it isn't set then the mode is "on", unless Python is running with -O, in which
+# case it is "off". (Except that, as with typeguard, functions decorated with
+# `typechecked(always=True)` are still checked; only an explicit "off" turns those off
+# too.) The mode is read every time it's needed (i.e. at decoration time), not just
+# once at import time.
+
+
+_modes = ("on", "off", "sample")
+
+
+def _explicit_mode() -> Optional[str]:
+    # The mode set by TORCHTYPING_MODE, or None if it isn't set.
+    mode = os.environ.get("TORCHTYPING_MODE", "").strip().lower()
+    if mode == "":
+        return None
+    if mode not in _modes:
+        raise ValueError(
+            f"TORCHTYPING_MODE must be one of {', '.join(_modes)}; got {mode!r}."
+        )
+    return mode
+
+
+def get_mode() -> str:
+    mode = _explicit_mode()
+    if mode is None:
+        return "on" if __debug__ else "off"
+    return mode
+
+
+_policies = {
+    "first": lambda arg: SampleFirst(int(arg)),
+    "every": lambda arg: SampleEvery(int(arg)),
+    "random": lambda arg: SampleRandom(float(arg)),
+    "budget": lambda arg: SampleBudget(float(arg)),
+    "new_shapes": lambda arg: SampleNewShapes(int(arg)),
+}
+_default_args = {"new_shapes": "1024", "budget": "0.01"}
+
+
+def _parse_policy(spec: str) -> SamplingPolicy:
+    # Parses e.g. "every:100", "first:10", "random:0.01", "budget:0.01" or
+    # "new_shapes". Defaults to "new_shapes".
+    spec = spec.strip().lower() or "new_shapes"
+    name, _, arg = spec.partition(":")
+    try:
+        make = _policies[name]
+    except KeyError:
+        raise ValueError(
+            f"TORCHTYPING_SAMPLE must be one of {', '.join(_policies)}, optionally "
+            f"followed by ':<argument>'; got {spec!r}."
+        ) from None
+    if arg == "":
+        try:
+            arg = _default_args[name]
+        except KeyError:
+            raise ValueError(
+                f"TORCHTYPING_SAMPLE={spec!r} needs an argument."
+            ) from None
+    return make(arg)
+
+
+def _env_policy() -> SamplingPolicy:
+    return _parse_policy(os.environ.get("TORCHTYPING_SAMPLE", ""))
+
+
+# RUNTIME SWITCH
+#######################
+# Independently of the above, checking can be enabled or disabled at runtime, either
+# globally or for individual modules (and their submodules). This is only possible if
+# the functions have been decorated in the first place, i.e. not in mode "off".
+#
+# Every module with checked functions has a _Switch, holding whether checking is
+# enabled for that module once the global setting and any per-module settings have
+# been taken into account. Each function's plan holds its module's switch, so checking
+# whether a call should be checked is a single attribute lookup. The switches are all
+# recomputed whenever a setting changes, which is comparatively rare.
+
+
+class _Switch:
+    __slots__ = ("enabled",)
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+
+
+_lock = threading.Lock()
+_global_enabled = True
+_overrides: Dict[str, bool] = {}
+_switches: Dict[str, _Switch] = {}
+
+
+def _module_name(module: Union[None, str, types.ModuleType]) -> Optional[str]:
+    if isinstance(module, types.ModuleType):
+        return module.__name__
+    return module
+
+
+def _enabled(name: str) -> bool:
+    while name:
+        try:
+            return _overrides[name]
+        except KeyError:
+            name = name.rpartition(".")[0]
+    return _global_enabled
+
+
+def _update() -> None:
+    for name, switch in _switches.items():
+        switch.enabled = _enabled(name)
+
+
+def _switch(module: Optional[str]) -> _Switch:
+    module = module or ""
+    try:
+        return _switches[module]
+    except KeyError:
+        with _lock:
+            return _switches.setdefault(module, _Switch(_enabled(module)))
+
+
+def _set(module: Union[None, str, types.ModuleType], enabled: Optional[bool]) -> None:
+    # `enabled=None` removes a per-module setting.
+    global _global_enabled
+    name = _module_name(module)
+    with _lock:
+        if name is None:
+            _global_enabled = True if enabled is None else enabled
+        elif enabled is None:
+            _overrides.pop(name, None)
+        else:
+            _overrides[name] = enabled
+        _update()
+
+
+def enable_checking(module: Union[None, str, types.ModuleType] = None) -> None:
+    _set(module, True)
+
+
+def disable_checking(module: Union[None, str, types.ModuleType] = None) -> None:
+    _set(module, False)
+
+
+def checking_enabled(module: Union[None, str, types.ModuleType] = None) -> bool:
+    name = _module_name(module)
+    return _global_enabled if name is None else _enabled(name)
+
+
+def reset_checking() -> None:
+    # Removes every per-module setting, and enables checking globally.
+    global _global_enabled
+    with _lock:
+        _global_enabled = True
+        _overrides.clear()
+        _update()
+
+
+@contextlib.contextmanager
+def checking(
+    enabled: bool = True, module: Union[None, str, types.ModuleType] = None
+) -> Iterator[None]:
+    # Enables (or disables) checking, globally or for a module, within a `with` block.
+    # The previous setting is restored afterwards.
+    name = _module_name(module)
+    previous = _global_enabled if name is None else _overrides.get(name)
+    _set(name, enabled)
+    try:
+        yield
+    finally:
+        _set(name, previous)
@@ -0,0 +1,262 @@
+import abc
+import collections
+import random
+import torch
+
+from .utils import LRUCache
+
+from typing import Any, Callable, Dict, Optional
+
+# SAMPLING
+#######################
+# A sampling policy decides which calls of a checked function are actually checked.
+# Each function gets its own sampler from its policy (so that e.g. counts are kept per
+# function), which is called with the arguments of every call and returns whether that
+# call should be checked. Unchecked calls skip everything else we do, so samplers should
+# be as cheap as possible: typically just a counter.
+#
+# A sampler may also have a `record(check_time, func_time)` method, in which case it is
+# told how long (in seconds) each checked call spent checking, and how long it spent in
+# the function itself.
+
+
+Sampler = Callable[[tuple, Dict[str, Any]], bool]
+
+
+class SamplingPolicy(metaclass=abc.ABCMeta):
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def __repr__(self) -> str:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def sampler(self) -> Sampler:
+        raise NotImplementedError
+
+
+def _check_positive(n: int) -> None:
+    if n <= 0:
+        raise ValueError(f"Expected a positive integer, got {n}.")
+
+
+class SampleFirst(SamplingPolicy):
+    # Check the first `n` calls, and none after that.
+    __slots__ = ("n",)
+
+    def __init__(self, n: int):
+        _check_positive(n)
+        self.n = n
+
+    def __repr__(self) -> str:
+        return f"SampleFirst({self.n})"
+
+    def sampler(self) -> Sampler:
+        remaining = self.n
+
+        def sample(args, kwargs):
+            nonlocal remaining
+            if remaining:
+                remaining -= 1
+                return True
+            return False
+
+        return sample
+
+
+class SampleEvery(SamplingPolicy):
+    # Check every `n`th call, starting with the first.
+    __slots__ = ("n",)
+
+    def __init__(self, n: int):
+        _check_positive(n)
+        self.n = n
+
+    def __repr__(self) -> str:
+        return f"SampleEvery({self.n})"
+
+    def sampler(self) -> Sampler:
+        n = self.n
+        count = 0
+
+        def sample(args, kwargs):
+            nonlocal count
+            count -= 1
+            if count <= 0:
+                count = n
+                return True
+            return False
+
+        return sample
+
+
+class SampleRandom(SamplingPolicy):
+    # Check each call with probability `p`.
+    __slots__ = ("p", "seed")
+
+    def __init__(self, p: float, seed: Optional[int] = None):
+        if not 0 <= p <= 1:
+            raise ValueError(f"Expected a probability, got {p}.")
+        self.p = p
+        self.seed = seed
+
+    def __repr__(self) -> str:
+        return f"SampleRandom({self.p}, seed={self.seed})"
+
+    def sampler(self) -> Sampler:
+        p = self.p
+        draw = random.Random(self.seed).random
+
+        def sample(args, kwargs):
+            return draw() < p
+
+        return sample
+
+
+class SampleNewShapes(SamplingPolicy):
+    # Check each call whose tensor arguments have a combination of shapes, dtypes and
+    # layouts that hasn't been seen before. Only tensors passed directly as arguments
+    # are considered (not e.g. those inside a tuple). Up to `maxsize` combinations are
+    # remembered, the least recently used being forgotten first.
+    __slots__ = ("maxsize",)
+
+    def __init__(self, maxsize: int = 1024):
+        _check_positive(maxsize)
+        self.maxsize = maxsize
+
+    def __repr__(self) -> str:
+        return f"SampleNewShapes(maxsize={self.maxsize})"
+
+    def sampler(self) -> Sampler:
+        seen = LRUCache(self.maxsize)
+
+        def sample(args, kwargs):
+            key = []
+            for value in args:
+                if isinstance(value, torch.Tensor):
+                    key.append((value.shape, value.dtype, value.layout))
+                else:
+                    key.append(None)
+            for name, value in kwargs.items():
+                if isinstance(value, torch.Tensor):
+                    key.append((name, value.shape, value.dtype, value.layout))
+            key = tuple(key)
+            if seen.get(key) is None:
+                seen.put(key, True)
+                return True
+            return False
+
+        return sample
+
+
+BudgetInfo = collections.namedtuple(
+    "BudgetInfo", ["rate", "overhead", "check_time", "func_time"]
+)
+
+
+class SampleBudget(SamplingPolicy):
+    # Adjusts the fraction of calls that are checked, so that the time spent checking is
+    # about `overhead` times the time spent in the function itself. The time taken by
+    # each is estimated from the checked calls, as an exponential moving average with
+    # weight `smoothing` on the newest measurement. At least a fraction `min_rate` of
+    # calls are always checked.
+    __slots__ = ("overhead", "min_rate", "smoothing")
+
+    def __init__(
+        self, overhead: float = 0.01, *, min_rate: float = 0.001, smoothing: float = 0.1
+    ):
+        if overhead <= 0:
+            raise ValueError(f"Expected a positive overhead, got {overhead}.")
+        if not 0 < min_rate <= 1:
+            raise ValueError(f"Expected a probability, got {min_rate}.")
+        if not 0 < smoothing <= 1:
+            raise ValueError(f"Expected a value in (0, 1], got {smoothing}.")
+        self.overhead = overhead
+        self.min_rate = min_rate
+        self.smoothing = smoothing
+
+    def __repr__(self) -> str:
+        return (
+            f"SampleBudget({self.overhead}, min_rate={self.min_rate}, "
+            f"smoothing={self.smoothing})"
+        )
+
+    def sampler(self) -> Sampler:
+        return _BudgetSampler(self.overhead, self.min_rate, self.smoothing)
+
+
+class _BudgetSampler:
+    __slots__ = (
+        "target",
+        "min_rate",
+        "smoothing",
+        "rate",
+        "credit",
+        "check_time",
+        "func_time",
+    )
+
+    def __init__(self, target: float, min_rate: float, smoothing: float):
+        self.target = target
+        self.min_rate = min_rate
+        self.smoothing = smoothing
+        # Check every call until we've measured something.
+        self.rate = 1.0
+        self.credit = 0.0
+        self.check_time = None
+        self.func_time = None
+
+    def __call__(self, args, kwargs):
+        # Deterministically check a fraction `rate` of calls.
+        credit = self.credit + self.rate
+        if credit >= 1:
+            self.credit = credit - 1
+            return True
+        self.credit = credit
+        return False
+
+    def record(self, check_time: float, func_time: float) -> None:
+        if self.check_time is None:
+            self.check_time = check_time
+            self.func_time = func_time
+        else:
+            smoothing = self.smoothing
+            self.check_time += smoothing * (check_time - self.check_time)
+            self.func_time += smoothing * (func_time - self.func_time)
+        if self.check_time > 0:
+            rate = self.target * self.func_time / self.check_time
+            self.rate = min(1.0, max(self.min_rate, rate))
+
+    def info(self) -> BudgetInfo:
+        if self.check_time is None or self.func_time <= 0:
+            overhead = None
+        else:
+            overhead = self.rate * self.check_time / self.func_time
+        return BudgetInfo(self.rate, overhead, self.check_time, self.func_time)
+
+
+_default_policy = None
+
+
+def set_sampling(policy: Optional[SamplingPolicy]) -> None:
+    # Sets the sampling policy used by every function that doesn't specify its own. None
+    # (the default) means that every call is checked.
+    global _default_policy
+    _default_policy = policy
+
+
+def get_sampling() -> Optional[SamplingPolicy]:
+    return _default_policy
+
+
+def _skip(plan, args: tuple, kwargs: Dict[str, Any]) -> bool:
+    policy = plan.sample
+    if policy is None:
+        policy = _default_policy
+        if policy is None:
+            return False
+    if plan.sampler_policy is not policy:
+        plan.sampler = policy.sampler()
+        plan.sampler_policy = policy
+        plan.sampler_record = getattr(plan.sampler, "record", None)
+    return not plan.sampler(args, kwargs)
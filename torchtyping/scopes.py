@@ -0,0 +1,121 @@
+import contextlib
+import contextvars
+import threading
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# DIMENSION SCOPES
+#######################
+# Normally the sizes of named dimensions are only consistent within a single call.
+# `torchtyping.dims` opens a scope in which some names have the same size across every
+# checked call, e.g.
+#
+# with torchtyping.dims(batch=32, seq=...):
+#     ...
+#
+# checks that every dimension called "batch" has size 32, and that every dimension
+# called "seq" has the same size as the first one checked within the block. Scopes nest:
+# an inner scope sees all the names of the enclosing ones, and may pre-bind a name to a
+# different size for its duration. Naming the same name with `...` in an inner scope
+# shares the outer binding.
+#
+# The current scope is held in a context variable, so each thread (and each asyncio
+# task, from the point at which it's created) has its own. It's a dictionary mapping
+# each name to a _Binding, which holds its size once it's known. These are shared
+# between the scope in which they're declared and all the scopes nested in it, so that
+# sizes accumulated in an inner scope are seen by the outer one afterwards.
+#
+# The checks themselves work in terms of slots (see check_plan.py), so each call looks
+# up the names of its plan in the current scope, seeds its sizes with those that are
+# known, and records any it had to infer once its checks have passed. If no scope is
+# active then all this costs is a single lookup of the context variable.
+
+
+class _Binding:
+    __slots__ = ("size",)
+
+    def __init__(self, size: Optional[int]):
+        self.size = size
+
+
+_dims = contextvars.ContextVar("torchtyping_dims", default=None)
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def dims(*names: str, **sizes: Any) -> Iterator[None]:
+    # Within a `with` block, dimensions with any of the given names must have the same
+    # size in every checked call. Each of `sizes` is either an integer, to which that
+    # dimension is bound, or `...`, in which case it's bound to the size of the first
+    # such dimension checked. Names passed positionally are the same as passing `...`.
+    #
+    # This only applies to named dimensions, not to named `...`.
+    outer = _dims.get()
+    scope = {} if outer is None else dict(outer)
+    for name in names:
+        sizes.setdefault(name, ...)
+    for name, size in sizes.items():
+        if size is ...:
+            if name not in scope:
+                scope[name] = _Binding(None)
+        elif isinstance(size, int) and not isinstance(size, bool) and size >= 0:
+            scope[name] = _Binding(size)
+        else:
+            raise TypeError(
+                f"The size of dimension '{name}' must be a non-negative integer or "
+                f"`...`; got {size!r}."
+            )
+    token = _dims.set(scope)
+    try:
+        yield
+    finally:
+        _dims.reset(token)
+
+
+def _inconsistent(name: str, size: int, lookup_size: int) -> TypeError:
+    return TypeError(
+        f"Dimension '{name}' of inconsistent size. Got both {size} and {lookup_size}."
+    )
+
+
+def _seed(scope: Dict[str, _Binding], names: Sequence[str]) -> Tuple[Any, ...]:
+    # The sizes already known for `names` (or None where they aren't).
+    sizes = []
+    for name in names:
+        binding = scope.get(name)
+        sizes.append(None if binding is None else binding.size)
+    return tuple(sizes)
+
+
+def _seed_list(
+    scope: Dict[str, _Binding], names: Sequence[str], sizes: List[Optional[int]]
+) -> None:
+    # As _seed, but fills in the unknown entries of `sizes` (indexed by slot) in place.
+    for slot, name in enumerate(names):
+        if sizes[slot] is None:
+            binding = scope.get(name)
+            if binding is not None:
+                sizes[slot] = binding.size
+
+
+def _record(
+    scope: Dict[str, _Binding], names: Sequence[str], sizes: Sequence[Optional[int]]
+) -> None:
+    # Binds the names of the scope that weren't yet known to the sizes inferred for
+    # them. Raises a TypeError if one has been bound to something else in the meantime
+    # (by another thread or task sharing the scope).
+    for name, size in zip(names, sizes):
+        if size is None:
+            continue
+        binding = scope.get(name)
+        if binding is None:
+            continue
+        lookup_size = binding.size
+        if lookup_size is None:
+            with _lock:
+                lookup_size = binding.size
+                if lookup_size is None:
+                    binding.size = size
+                    continue
+        if lookup_size != size:
+            raise _inconsistent(name, size, lookup_size)
@@ -0,0 +1,116 @@
+import json
+import weakref
+
+from typing import Dict, TextIO, Union
+
+# STATISTICS
+#######################
+# Every checked function keeps a _FunctionStats (on its _CheckPlan), counting its calls,
+# how many of them were checked (see sampling.py), how many of those had their arguments
+# found in the metadata cache, how many failed their checks, and the total time spent
+# checking them. These are all registered here, so that they can be
+# reported together.
+
+
+class _FunctionStats:
+    __slots__ = (
+        "name",
+        "calls",
+        "checked",
+        "cache_hits",
+        "failures",
+        "check_time_ns",
+        "__weakref__",
+    )
+
+    def __init__(self):
+        self.name = None
+        self.reset()
+        _registry.add(self)
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.checked = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.check_time_ns = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "checked": self.checked,
+            "cache_hits": self.cache_hits,
+            "failures": self.failures,
+            "check_time_ns": self.check_time_ns,
+        }
+
+
+_registry = weakref.WeakSet()
+
+
+def stats_snapshot() -> Dict[str, Dict[str, int]]:
+    # Stats for every function that has been called, keyed by the function's name.
+    # Functions with the same name (e.g. closures created by the same code) are
+    # summed together.
+    snapshot = {}
+    for stats in list(_registry):
+        if stats.name is None:
+            continue
+        function_snapshot = stats.snapshot()
+        try:
+            existing = snapshot[stats.name]
+        except KeyError:
+            snapshot[stats.name] = function_snapshot
+        else:
+            for key, value in function_snapshot.items():
+                existing[key] += value
+    return dict(sorted(snapshot.items()))
+
+
+def reset_stats() -> None:
+    for stats in list(_registry):
+        stats.reset()
+
+
+_prometheus_metrics = (
+    ("calls", "calls_total", "Number of calls of each checked function.", 1),
+    ("checked", "checked_total", "Number of calls that were checked.", 1),
+    ("cache_hits", "cache_hits_total", "Number of hits in the metadata cache.", 1),
+    ("failures", "failures_total", "Number of calls that failed their checks.", 1),
+    ("check_time_ns", "check_seconds_total", "Total time spent checking.", 1e-9),
+)
+
+
+def _prometheus_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _to_prometheus(snapshot: Dict[str, Dict[str, int]]) -> str:
+    lines = []
+    for key, metric, description, scale in _prometheus_metrics:
+        metric = f"torchtyping_{metric}"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, function_snapshot in snapshot.items():
+            value = function_snapshot[key]
+            if scale != 1:
+                value = value * scale
+            lines.append(f'{metric}{{function="{_prometheus_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def dump_stats(file: Union[str, TextIO], format: str = "json") -> None:
+    # Writes `stats_snapshot()` to `file` (a path or a file object), as either "json"
+    # or "prometheus" (the Prometheus text exposition format).
+    snapshot = stats_snapshot()
+    if format == "json":
+        text = json.dumps(snapshot, indent=2) + "\n"
+    elif format == "prometheus":
+        text = _to_prometheus(snapshot)
+    else:
+        raise ValueError(f"Unknown format {format!r}; expected 'json' or 'prometheus'.")
+    if isinstance(file, str):
+        with open(file, "w") as f:
+            f.write(text)
+    else:
+        file.write(text)
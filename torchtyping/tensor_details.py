@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import abc
 import collections
+import enum
 import torch
 
 from typing import Optional, Union
@@ -10,7 +11,20 @@ from typing import Optional, Union
 ellipsis = type(...)
 
 
+class DetailCost(enum.IntEnum):
+    # How expensive a TensorDetail's check is. The details of a TensorType are checked
+    # in increasing order of cost, so that the cheap checks get a chance to fail before
+    # the expensive ones are run.
+    METADATA = 0  # only looks at the tensor's metadata: its shape, dtype, ...
+    VALUES = 1  # reads the tensor's values
+
+
 class TensorDetail(metaclass=abc.ABCMeta):
+    __slots__ = ()
+
+    # Details are assumed to read the tensor's values unless they say otherwise.
+    cost = DetailCost.VALUES
+
     @abc.abstractmethod
     def __repr__(self) -> str:
         raise NotImplementedError
@@ -53,11 +67,47 @@ class _Dim(collections.namedtuple("_Dim", ["name", "size"])):
 
 
 class ShapeDetail(TensorDetail):
+    __slots__ = (
+        "dims",
+        "check_names",
+        "_num_dims",
+        "_has_ellipsis",
+        "_size_checks",
+        "_name_checks",
+    )
+    cost = DetailCost.METADATA
+
     def __init__(self, *, dims: list[_Dim], check_names: bool, **kwargs) -> None:
         super().__init__(**kwargs)
-        self.dims = dims
+        self.dims = tuple(dims)
         self.check_names = check_names
 
+        # Precompute what `check` needs to look at, so that it doesn't have to loop
+        # over every dimension. In particular this means that `tensor.names` (which is
+        # comparatively expensive) is only accessed if there are names to check.
+        # Ellipses only occur on the left hand edge, so every other dimension can be
+        # indexed from the right.
+        fixed_dims = [dim for dim in self.dims if dim.size is not ...]
+        self._num_dims = len(fixed_dims)
+        self._has_ellipsis = len(fixed_dims) != len(self.dims)
+        size_checks = []
+        name_checks = []
+        for index, dim in enumerate(fixed_dims, start=-len(fixed_dims)):
+            if not isinstance(dim.size, str) and dim.size != -1:
+                size_checks.append((index, dim.size))
+            if check_names and dim.name is not _no_name:
+                name_checks.append((index, dim.name))
+        self._size_checks = tuple(size_checks)
+        self._name_checks = tuple(name_checks)
+
+    def __eq__(self, other: object) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.dims == other.dims and self.check_names == other.check_names
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.dims, self.check_names))
+
     def __repr__(self) -> str:
         if len(self.dims) == 0:
             out = "()"
@@ -70,47 +120,37 @@ class ShapeDetail(TensorDetail):
         return out
 
     def check(self, tensor: torch.Tensor) -> bool:
-        self_names = [self_dim.name for self_dim in self.dims]
-        self_shape = [self_dim.size for self_dim in self.dims]
-
-        if ... in self_shape:
-            if sum(1 for size in self_shape if size is not ...) > len(tensor.names):
+        ndim = tensor.dim()
+        if self._has_ellipsis:
+            if self._num_dims > ndim:
                 return False
         else:
-            if len(self_shape) != len(tensor.names):
+            if self._num_dims != ndim:
                 return False
 
-        for self_name, self_size, tensor_name, tensor_size in zip(
-            reversed(self_names),
-            reversed(self_shape),
-            reversed(tensor.names),
-            reversed(tensor.shape),
-        ):
-            if self_size is ...:
-                # This assumes that Ellipses only occur on the left hand edge.
-                # So once we hit one we're done.
-                break
-
-            if (
-                self.check_names
-                and self_name is not _no_name
-                and self_name != tensor_name
-            ):
-                return False
-            if not isinstance(self_size, str) and self_size not in (-1, tensor_size):
+        shape = tensor.shape
+        for index, size in self._size_checks:
+            if shape[index] != size:
                 return False
 
+        if self._name_checks:
+            names = tensor.names
+            for index, name in self._name_checks:
+                if names[index] != name:
+                    return False
+
         return True
 
     @classmethod
     def tensor_repr(cls, tensor: torch.Tensor) -> str:
-        dims = []
-        check_names = any(name is not None for name in tensor.names)
-        for name, size in zip(tensor.names, tensor.shape):
-            if not check_names:
-                name = _no_name
-            dims.append(_Dim(name=name, size=size))
-        return repr(cls(dims=dims, check_names=check_names))
+        if tensor.has_names():
+            dims = [
+                _Dim(name=name, size=size)
+                for name, size in zip(tensor.names, tensor.shape)
+            ]
+        else:
+            dims = [_Dim(name=_no_name, size=size) for size in tensor.shape]
+        return repr(cls(dims=dims, check_names=tensor.has_names()))
 
     def update(
         self,
@@ -125,11 +165,22 @@ class ShapeDetail(TensorDetail):
 
 
 class DtypeDetail(TensorDetail):
+    __slots__ = ("dtype",)
+    cost = DetailCost.METADATA
+
     def __init__(self, *, dtype, **kwargs) -> None:
         super().__init__(**kwargs)
         assert isinstance(dtype, torch.dtype)
         self.dtype = dtype
 
+    def __eq__(self, other: object) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.dtype == other.dtype
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.dtype))
+
     def __repr__(self) -> str:
         return repr(self.dtype)
 
@@ -142,10 +193,21 @@ class DtypeDetail(TensorDetail):
 
 
 class LayoutDetail(TensorDetail):
+    __slots__ = ("layout",)
+    cost = DetailCost.METADATA
+
     def __init__(self, *, layout, **kwargs) -> None:
         super().__init__(**kwargs)
         self.layout = layout
 
+    def __eq__(self, other: object) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.layout == other.layout
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.layout))
+
     def __repr__(self) -> str:
         return repr(self.layout)
 
@@ -158,6 +220,17 @@ class LayoutDetail(TensorDetail):
 
 
 class _FloatDetail(TensorDetail):
+    __slots__ = ()
+    cost = DetailCost.METADATA
+
+    def __eq__(self, other: object) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        return True
+
+    def __hash__(self) -> int:
+        return hash(type(self))
+
     def __repr__(self) -> str:
         return "is_float"
 
@@ -174,6 +247,9 @@ class _FloatDetail(TensorDetail):
 # It's only a TensorDetail for consistency, as the other
 # extra flags that get passed are TensorDetails.
 class _NamedTensorDetail(TensorDetail):
+    __slots__ = ()
+    cost = DetailCost.METADATA
+
     def __repr__(self) -> str:
         raise RuntimeError
 
@@ -12,7 +12,7 @@ from .tensor_details import (
     ShapeDetail,
     TensorDetail,
 )
-from .utils import frozendict
+from .utils import frozendict, LRUCache
 
 from typing import Any, NoReturn
 
@@ -28,6 +28,26 @@ else:
 _AnnotatedType = type(Annotated[torch.Tensor, ...])
 
 
+# Identical subscriptions of TensorType return the same annotation, which is both
+# cheaper than rebuilding it and means that caches keyed on annotations (like the ones
+# typeguard and our check plans use) are effective.
+_annotation_cache = LRUCache(maxsize=4096)
+
+
+def _cache_key_element(item_i: Any) -> Any:
+    # Include the type so that e.g. TensorType[1] and TensorType[True] are kept apart.
+    # Slices are unhashable before Python 3.12, so unpack them.
+    if isinstance(item_i, slice):
+        return (
+            slice,
+            _cache_key_element(item_i.start),
+            _cache_key_element(item_i.stop),
+            _cache_key_element(item_i.step),
+        )
+    else:
+        return type(item_i), item_i
+
+
 # For use when we have a plain TensorType, without any [].
 class _TensorTypeMeta(type(torch.Tensor)):
     def __instancecheck__(cls, obj: Any) -> bool:
@@ -83,6 +103,33 @@ class TensorType(torch.Tensor, metaclass=_TensorTypeMeta):
             return item_i
 
     def __class_getitem__(cls, item: Any) -> _AnnotatedType:
+        # `float` is interpreted as the default dtype at the time of subscription, so
+        # this is part of the key as well.
+        items = item if isinstance(item, tuple) else (item,)
+        key = (
+            cls,
+            torch.get_default_dtype(),
+            tuple(_cache_key_element(item_i) for item_i in items),
+        )
+        try:
+            annotation = _annotation_cache.get(key)
+        except TypeError:  # unhashable, e.g. a custom detail without __hash__
+            return cls._getitem(item)
+        if annotation is None:
+            annotation = cls._getitem(item)
+            # Equal annotations subscripted differently (e.g. with float and with the
+            # default dtype) are the same object too. (typing's own cache also does
+            # this, but it's small enough that we can't rely on it.)
+            canonical = _annotation_cache.get(annotation)
+            if canonical is None:
+                _annotation_cache.put(annotation, annotation)
+            else:
+                annotation = canonical
+            _annotation_cache.put(key, annotation)
+        return annotation
+
+    @classmethod
+    def _getitem(cls, item: Any) -> _AnnotatedType:
         if isinstance(item, tuple):
             if len(item) == 0:
                 item = ((),)
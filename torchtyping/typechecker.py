@@ -1,19 +1,44 @@
+import functools
 import inspect
 import sys
+import threading
+import time
 import torch
 import typeguard
+import types
+import warnings
+import weakref
 
-from .tensor_details import _Dim, _no_name, ShapeDetail
-from .tensor_type import _AnnotatedType
+from .check_plan import (
+    _check_memo,
+    _check_values,
+    _CheckPlan,
+    _metadata_key,
+    _TensorSpec,
+    get_plan,
+)
+from . import typeguard_lookup
+from .codegen import _delegate_to, _is_inline, _make_stub, _specialise
+from .deferred import _failures, _report
+from .mode import _env_policy, _explicit_mode, _switch, get_mode
+from .scopes import _dims, _record, _seed_list
+from .sampling import (
+    _BudgetSampler,
+    _skip,
+    BudgetInfo,
+    get_sampling,
+    SamplingPolicy,
+    set_sampling,
+)
+from .utils import CacheInfo
 
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, NoReturn, Optional, Tuple
 
-# get_args is available in python version 3.8
 # get_type_hints with include_extras parameter is available in 3.9 PEP 593.
 if sys.version_info >= (3, 9):
-    from typing import get_type_hints, get_args, Type
+    from typing import get_type_hints
 else:
-    from typing_extensions import get_type_hints, get_args, Type
+    from typing_extensions import get_type_hints
 
 
 # TYPEGUARD PATCHER
@@ -30,6 +55,13 @@ else:
 # So the first thing we do is enhance that with a couple extra slots to store our
 # information
 #
+# The first time a function is called we also compile its type hints into a
+# _CheckPlan (see check_plan.py), which is cached on the function and attached to each
+# _CallMemo.
+# On later calls this lets us skip most of typeguard's own per-call work in
+# `_CallMemo.__init__` (which otherwise recomputes the signature of the function every
+# time) and bind the arguments with a precomputed _ArgumentBinder instead.
+#
 # Second, we patch `check_type`. typeguard traverses the [] hierarchy, e.g. from
 # Tuple[List[int]] to List[int] to int, recursively calling `check_type`. By patching
 # `check_type` we can check for our `TensorType`s and record every value-type pair.
@@ -40,329 +72,909 @@ else:
 # our annotations aren't stripped.)
 #
 # Then we patch `check_argument_types` and `check_return_type`, to perform our extra
-# TensorType checking. This is the same checking in both cases so we factor that out
-# into _check_memo.
+# TensorType checking. Arguments annotated directly with a TensorType are checked
+# straight from the plan, without going back through `check_type`. The rest of the
+# checking is the same in both cases so we factor that out into _check_memo.
 #
 # _check_memo performs the real logic of the checking here. This looks at all the
 # recorded value-type pairs and checks for any inconsistencies.
 
 
-def _to_string(name, detail_reprs: List[str]) -> str:
-    assert len(detail_reprs) > 0
-    string = name + "["
-    pieces = []
-    for detail_repr in detail_reprs:
-        if detail_repr != "":
-            pieces.append(detail_repr)
-    string += ", ".join(pieces)
-    string += "]"
-    return string
+_positional_kinds = (
+    inspect.Parameter.POSITIONAL_ONLY,
+    inspect.Parameter.POSITIONAL_OR_KEYWORD,
+)
 
 
-def _check_tensor(
-    argname: str, value: Any, origin: Type[torch.Tensor], metadata: Dict[str, Any]
-):
-    details = metadata["details"]
-    if not isinstance(value, origin) or any(
-        not detail.check(value) for detail in details
-    ):
-        expected_string = _to_string(
-            metadata["cls_name"], [repr(detail) for detail in details]
+def _argument_getter(signature: inspect.Signature, *names: str):
+    # Returns a function `get(args, kwargs)`, returning the values of the parameters
+    # `names` as if by `signature.bind(*args, **kwargs).arguments`. This is much cheaper
+    # than actually binding, which matters as the patched typeguard functions are called
+    # for every argument of every checked function.
+    parameters = list(signature.parameters.values())
+    lookups = []
+    for name in names:
+        parameter = signature.parameters[name]
+        index = (
+            parameters.index(parameter) if parameter.kind in _positional_kinds else None
         )
-        if isinstance(value, torch.Tensor):
-            given_string = _to_string(
-                metadata["cls_name"], [detail.tensor_repr(value) for detail in details]
-            )
-        else:
-            value = type(value)
-            if hasattr(value, "__qualname__"):
-                given_string = value.__qualname__
-            elif hasattr(value, "__name__"):
-                given_string = value.__name__
+        lookups.append((name, index, parameter.default))
+
+    def get(args, kwargs):
+        values = []
+        for name, index, default in lookups:
+            if index is not None and index < len(args):
+                values.append(args[index])
+            elif name in kwargs:
+                values.append(kwargs[name])
+            elif default is not inspect.Parameter.empty:
+                values.append(default)
             else:
-                given_string = repr(value)
-        raise TypeError(
-            f"{argname} must be of type {expected_string}, got type {given_string} "
-            "instead."
-        )
+                signature.bind(*args, **kwargs)  # raises an error
+        return values
 
+    return get
 
-def _check_memo(memo):
-    ###########
-    # Parse the tensors and figure out the sizes of all labelled
-    # dimensions.
-    # This also performs some (and in practice most) of the consistency
-    # checks. However its job is primarily one of assigning sizes to labels.
-    # The final checking of the inferred sizes is performed afterwards.
-    #
-    # This logic is a bit hairy. Most of the complexity comes from
-    # supporting `...` arbitrary numbers of dimensions.
-    ###########
-
-    # ordered set
-    shape_info = {
-        (argname, value.shape, detail): None
-        for argname, value, _, detail in memo.value_info
-    }
-    while len(shape_info):
-        for argname, shape, detail in shape_info:
-            num_free_ellipsis = 0
-            for dim in detail.dims:
-                if dim.size is ... and dim.name not in memo.name_to_shape:
-                    num_free_ellipsis += 1
-            if num_free_ellipsis <= 1:
-                reversed_shape = enumerate(reversed(shape))
-                for dim in reversed(detail.dims):
-                    try:
-                        reverse_dim_index, size = next(reversed_shape)
-                    except StopIteration:
-                        if dim.size is ...:
-                            if dim.name not in (None, _no_name):
-                                try:
-                                    lookup_shape = memo.name_to_shape[dim.name]
-                                except KeyError:
-                                    memo.name_to_shape[dim.name] = ()
-                                else:
-                                    if lookup_shape != ():
-                                        raise TypeError(
-                                            f"Dimension group '{dim.name}' of "
-                                            f"inconsistent shape. Got both () and "
-                                            f"{lookup_shape}."
-                                        )
-                        else:
-                            # I don't think it's possible to get here, as the earlier
-                            # call to _check_tensor in check_type should catch
-                            # this case.
-                            raise TypeError(
-                                f"{argname} has {len(shape)} dimensions but type "
-                                "requires more than this."
-                            )
-
-                    if dim.name not in (None, _no_name):
-                        if dim.size is ...:
-                            try:
-                                lookup_shape = memo.name_to_shape[dim.name]
-                            except KeyError:
-                                # Can only get here if we're the single free
-                                # ellipsis.
-                                # Therefore the number of dimensions the ellipsis
-                                # corresponds to, is the number of dimensions
-                                # remaining.
-                                forward_index = 0
-                                for forward_dim in detail.dims:  # now iterate forwards
-                                    if forward_dim is dim:
-                                        break
-                                    assert forward_dim.size is ...
-                                    forward_index += len(
-                                        memo.name_to_shape[forward_dim.name]
-                                    )
-                                if reverse_dim_index == 0:
-                                    # since [:-0] doesn't work
-                                    end_index = None
-                                else:
-                                    end_index = -reverse_dim_index
-                                clip_shape = shape[forward_index:end_index]
-                                memo.name_to_shape[dim.name] = tuple(clip_shape)
-                                for _ in range(len(clip_shape) - 1):
-                                    next(reversed_shape)
-                            else:
-                                reversed_shape_piece = []
-                                if len(lookup_shape) >= 1:
-                                    reversed_shape_piece.append(size)
-                                for _ in range(len(lookup_shape) - 1):
-                                    try:
-                                        _, size = next(reversed_shape)
-                                    except StopIteration:
-                                        break
-                                    reversed_shape_piece.append(size)
-
-                                shape_piece = tuple(reversed(reversed_shape_piece))
-                                if lookup_shape != shape_piece:
-                                    raise TypeError(
-                                        f"Dimension group '{dim.name}' of "
-                                        f"inconsistent shape. Got both {shape_piece} "
-                                        f"and {lookup_shape}."
-                                    )
-                        else:
-                            names_to_check = (
-                                [dim.name, dim.size]
-                                if isinstance(dim.size, str)
-                                else [dim.name]
-                            )
-                            for name in names_to_check:
-                                try:
-                                    lookup_size = memo.name_to_size[name]
-                                except KeyError:
-                                    memo.name_to_size[name] = size
-                                else:
-                                    # Technically not necessary, as one of the
-                                    # sizes will override the other, and then the
-                                    # instance check will fail.
-                                    # This gives a nicer error message though.
-                                    if lookup_size != size:
-                                        raise TypeError(
-                                            f"Dimension '{dim.name}' of inconsistent"
-                                            f" size. Got both {size} and "
-                                            f"{lookup_size}."
-                                        )
-
-                del shape_info[argname, shape, detail]
-                break
-        else:
-            if len(shape_info):
-                names = {argname for argname, _, _ in shape_info}
-                raise TypeError(
-                    f"Could not resolve the size of all `...` in {names}. Either:\n"
-                    "(1) the specification is ambiguous. For example "
-                    "`func(tensor: TensorType['x': ..., 'y': ...])`.\n"
-                    "(2) or repeated named `...` are used without being able to "
-                    "resolve the size of those named `...` via another argument "
-                    "For example `func(tensor: TensorType['x': ..., 'x': ...])`. "
-                    "(But `func(tensor1: TensorType['x': ..., 'x': ...], tensor2: "
-                    "TensorType['x': ...])` would be fine.)\n"
-                    "\n"
-                    "Removing the names of the `...` should suffice to resolve this "
-                    "error. (But will of course remove that checking as well.)"
-                )
 
-    ###########
-    # Do the final checking with the inferred sizes filled in.
-    # In practice, malformed inputs will usually trip one of the
-    # checks in the previous logic, so this block doesn't actually raise
-    # errors very often. (In 1/37 tests at time of writing.)
-    # A potential performance improvement might be to integrate it into
-    # the previous block.
-    ###########
-
-    for argname, value, cls_name, detail in memo.value_info:
-        dims = []
-        for dim in detail.dims:
-            size = dim.size
-            if dim.name not in (None, _no_name):
-                if size == -1:
-                    size = memo.name_to_size[dim.name]
-                elif isinstance(size, str):
-                    size = memo.name_to_size[size]
-                elif size is ...:
-                    # This assumes that named Ellipses only occur to the
-                    # right of unnamed Ellipses, to avoid filling in
-                    # Ellipses that occur to the left of other Ellipses.
-                    for size in memo.name_to_shape[dim.name]:
-                        dims.append(_Dim(name=_no_name, size=size))
-                    continue
-            dims.append(_Dim(name=dim.name, size=size))
-        detail = detail.update(dims=tuple(dims))
-        _check_tensor(
-            argname, value, torch.Tensor, {"cls_name": cls_name, "details": [detail]}
-        )
+class _ArgumentBinder:
+    # Equivalent to `signature.bind(*args, **kwargs).arguments`, but with fast paths for
+    # the common cases. Anything unusual (including any error) falls back to actually
+    # binding.
+    __slots__ = (
+        "signature",
+        "positional",
+        "keywords",
+        "required",
+        "num_required_positional",
+        "var_positional",
+        "var_keyword",
+    )
+
+    def __init__(self, signature: inspect.Signature):
+        self.signature = signature
+        positional = []
+        keywords = set()
+        required = []
+        self.var_positional = None
+        self.var_keyword = None
+        for name, parameter in signature.parameters.items():
+            if parameter.kind is inspect.Parameter.VAR_POSITIONAL:
+                self.var_positional = name
+            elif parameter.kind is inspect.Parameter.VAR_KEYWORD:
+                self.var_keyword = name
+            else:
+                if parameter.kind in _positional_kinds:
+                    positional.append(name)
+                if parameter.kind is not inspect.Parameter.POSITIONAL_ONLY:
+                    keywords.add(name)
+                if parameter.default is inspect.Parameter.empty:
+                    required.append(name)
+        self.positional = tuple(positional)
+        self.keywords = frozenset(keywords)
+        # Parameters without defaults can't follow those with defaults positionally, so
+        # the required positional parameters are a prefix of `positional`, and come
+        # first in `required`.
+        self.num_required_positional = sum(name in required for name in positional)
+        self.required = tuple(required)
+
+    def bind(self, args: tuple, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        num_positional = len(self.positional)
+        arguments = dict(zip(self.positional, args))
+        if len(args) > num_positional:
+            if self.var_positional is None:
+                return self.signature.bind(*args, **kwargs).arguments
+            arguments[self.var_positional] = args[num_positional:]
+        if kwargs:
+            var_kwargs = {}
+            for name, value in kwargs.items():
+                if name in arguments:
+                    return self.signature.bind(*args, **kwargs).arguments
+                elif name in self.keywords:
+                    arguments[name] = value
+                elif self.var_keyword is None:
+                    return self.signature.bind(*args, **kwargs).arguments
+                else:
+                    var_kwargs[name] = value
+            if var_kwargs:
+                arguments[self.var_keyword] = var_kwargs
+        for name in self.required[min(len(args), self.num_required_positional) :]:
+            if name not in arguments:
+                return self.signature.bind(*args, **kwargs).arguments
+        return arguments
+
+
+def _take_scratch(plan: _CheckPlan) -> List[Any]:
+    # A list from the plan's pool (see _CheckPlan), or a new one if every list in the
+    # pool is in use, e.g. by a recursive call or by another thread. (Popping from and
+    # appending to a list are atomic, so the pool needs no lock.)
+    try:
+        return plan.scratch.pop()
+    except IndexError:
+        return [None] * max(len(plan.order), 1)
+
+
+def _give_scratch(plan: _CheckPlan, scratch: List[Any]) -> None:
+    # Returns a list to the pool, without keeping its tensors alive.
+    for index in range(len(scratch)):
+        scratch[index] = None
+    plan.scratch.append(scratch)
+
+
+def _check_cached(
+    memo,
+    direct: List[Optional[Tuple[str, torch.Tensor, _TensorSpec]]],
+    key_prefix: Any,
+    count_hit: bool,
+) -> Tuple[Any, ...]:
+    # `direct` are the tensors (and Nones, which are skipped) that have only had
+    # `check_uncached` performed. (Every other tensor, in memo.value_info, has been
+    # fully checked already.) If their metadata matches an earlier successful call then
+    # we can skip everything else and just restore the sizes of the named dimensions
+    # from that call. `count_hit` is whether a hit counts towards the function's stats,
+    # which count each call once.
+    plan = memo.plan
+    key = (key_prefix, _metadata_key(direct, memo.value_info, plan.check_names))
+    bindings = plan.cache.get(key)
+    if bindings is None:
+        for item in direct:
+            if item is not None:
+                argname, value, spec = item
+                spec.check_metadata(argname, value)
+        _check_memo(direct, memo.value_info, plan, memo.sizes, memo.groups)
+        plan.cache.put(key, (tuple(memo.sizes), tuple(memo.groups)))
+    else:
+        memo.sizes = list(bindings[0])
+        memo.groups = list(bindings[1])
+        if count_hit:
+            plan.stats.cache_hits += 1
+    return key
+
+
+# Resolved type hints, keyed by function. Resolving them means evaluating any string
+# annotations (e.g. from `from __future__ import annotations`), so we only want to do it
+# once per function. Each entry also records the annotations and namespaces it was
+# resolved from, so that it's recomputed if any of those change.
+_type_hints_cache = weakref.WeakKeyDictionary()
+
+
+def _get_type_hints(obj, globalns=None, localns=None):
+    annotations = getattr(obj, "__annotations__", None)
+    try:
+        entry = _type_hints_cache.get(obj)
+    except TypeError:  # not weakref-able or not hashable
+        entry = None
+    if entry is not None:
+        cached_annotations, cached_globalns, cached_localns, hints = entry
+        if (
+            cached_globalns is globalns
+            and cached_localns is localns
+            and cached_annotations == annotations
+        ):
+            return hints
+    # include_extras so that our Annotated types aren't stripped.
+    hints = get_type_hints(obj, globalns, localns, include_extras=True)
+    if annotations is not None:
+        try:
+            _type_hints_cache[obj] = (dict(annotations), globalns, localns, hints)
+        except TypeError:
+            pass
+    return hints
 
 
 unpatched_typeguard = True
 
+# The names in typeguard's namespace that _patch replaces.
+_patched_names = (
+    "_CallMemo",
+    "check_type",
+    "check_argument_types",
+    "check_return_type",
+    "get_type_hints",
+)
+
+
+class _Patch:
+    # typeguard's _CallMemo, check_argument_types and check_return_type, as patched to
+    # check TensorTypes, together with its original check_type and `typechecked`, and
+    # the `originals` that were replaced. These live in a `namespace`: either
+    # typeguard's own module namespace (see patch_typeguard) or a private copy of it
+    # (see _scoped_patch).
+    __slots__ = (
+        "namespace",
+        "call_memo",
+        "check_argument_types",
+        "check_return_type",
+        "unpatched_check_type",
+        "originals",
+    )
+
+    @property
+    def typechecked(self) -> Callable:
+        return self.namespace["typechecked"]
+
+
+# Set by patch_typeguard.
+_global_patch: Optional[_Patch] = None
+
 
 def patch_typeguard():
-    global unpatched_typeguard
+    # Patches typeguard itself, so that every function it checks (whether via
+    # typeguard.typechecked, its import hook, or its pytest plugin) also has its
+    # TensorTypes checked.
+    global unpatched_typeguard, _global_patch
+    mode = get_mode()
+    if mode == "off":
+        return
     if unpatched_typeguard:
         unpatched_typeguard = False
+        if mode == "sample" and get_sampling() is None:
+            set_sampling(_env_policy())
+        if typeguard_lookup._available:
+            # typeguard 3 or later. See typeguard_lookup.py.
+            typeguard_lookup._install()
+            return
+        _global_patch = _patch(vars(typeguard))
 
-        # Defined dynamically, in case something else is doing similar levels of hackery
-        # patching typeguard. We want to get typeguard._CallMemo at the time we patch,
-        # not any earlier. (Someone might have replaced it since the import statement.)
-        class _CallMemo(typeguard._CallMemo):
-            __slots__ = (
-                "value_info",
-                "name_to_size",
-                "name_to_shape",
-            )
-            value_info: List[Tuple[str, torch.Tensor, str, Dict[str, Any]]]
-            name_to_size: Dict[str, int]
-            name_to_shape: Dict[str, Tuple[int]]
-
-        _check_type = typeguard.check_type
-        _check_argument_types = typeguard.check_argument_types
-        _check_return_type = typeguard.check_return_type
-
-        check_type_signature = inspect.signature(_check_type)
-        check_argument_types_signature = inspect.signature(_check_argument_types)
-        check_return_type_signature = inspect.signature(_check_return_type)
-
-        def check_type(*args, **kwargs):
-            bound_args = check_type_signature.bind(*args, **kwargs).arguments
-            argname = bound_args["argname"]
-            value = bound_args["value"]
-            expected_type = bound_args["expected_type"]
-            memo = bound_args["memo"]
-            # First look for an annotated type
-            is_torchtyping_annotation = (
-                memo is not None
-                and hasattr(memo, "value_info")
-                and isinstance(expected_type, _AnnotatedType)
-            )
-            # Now check if it's annotating a tensor
-            if is_torchtyping_annotation:
-                base_cls, *all_metadata = get_args(expected_type)
-                if not issubclass(base_cls, torch.Tensor):
-                    is_torchtyping_annotation = False
-            # Now check if the annotation's metadata is our metadata
-            if is_torchtyping_annotation:
-                for metadata in all_metadata:
-                    if isinstance(metadata, dict) and "__torchtyping__" in metadata:
-                        break
-                else:
-                    is_torchtyping_annotation = False
-            if is_torchtyping_annotation:
-                # We call _check_tensor here -- despite calling _check_tensor again
-                # once we've seen every argument and filled in the shape details --
-                # just because we want to check that `value` is in fact a tensor before
-                # we access its `shape` field on the next line.
-                _check_tensor(argname, value, base_cls, metadata)
-                for detail in metadata["details"]:
-                    if isinstance(detail, ShapeDetail):
-                        memo.value_info.append(
-                            (argname, value, metadata["cls_name"], detail)
-                        )
-                        break
 
-            else:
-                _check_type(*args, **kwargs)
+# SCOPED PATCHING
+#######################
+# Patching typeguard itself means that every function that typeguard checks pays for
+# our patched functions, including those in other libraries that have nothing to do
+# with tensors. So torchtyping.typechecked instead uses a private copy of typeguard:
+# every function defined in typeguard is copied with a new globals dictionary (itself
+# a copy of typeguard's module namespace), in which our patch is then applied. The
+# classes whose methods refer to any of the patched names are copied by subclassing
+# them with such copies of their methods.
+#
+# So functions checked with torchtyping.typechecked see the patched functions (even
+# when typeguard recurses into e.g. a Tuple[TensorType[...], ...]), while typeguard
+# itself, and anything else using it, is left untouched.
+
+_scoped: Optional[_Patch] = None
+_scoped_lock = threading.Lock()
+
+
+def _code_names(code: types.CodeType) -> set:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _copy_typeguard() -> Dict[str, Any]:
+    original = vars(typeguard)
+    namespace = dict(original)
+    if _global_patch is not None:
+        namespace.update(_global_patch.originals)
+    # Mutable state that would otherwise be shared with typeguard itself.
+    namespace["_type_hints_map"] = weakref.WeakKeyDictionary()
+    namespace["_functions_map"] = weakref.WeakValueDictionary()
 
-        def check_argument_types(*args, **kwargs):
-            bound_args = check_argument_types_signature.bind(*args, **kwargs).arguments
-            memo = bound_args["memo"]
-            if memo is None:
-                return _check_argument_types(*args, **kwargs)
+    def copy_function(func):
+        copy = types.FunctionType(
+            func.__code__, namespace, func.__name__, func.__defaults__, func.__closure__
+        )
+        copy.__kwdefaults__ = func.__kwdefaults__
+        copy.__qualname__ = func.__qualname__
+        copy.__module__ = func.__module__
+        copy.__doc__ = func.__doc__
+        copy.__dict__.update(func.__dict__)
+        return copy
+
+    copies = {}
+    for name, value in namespace.items():
+        if isinstance(value, types.FunctionType) and value.__globals__ is original:
+            namespace[name] = copies[value] = copy_function(value)
+        elif (
+            isinstance(value, type)
+            and value.__module__ == typeguard.__name__
+            and not issubclass(value, BaseException)
+        ):
+            methods = {
+                key: copy_function(method)
+                for key, method in vars(value).items()
+                if isinstance(method, types.FunctionType)
+                and method.__globals__ is original
+                and _code_names(method.__code__) & set(_patched_names)
+            }
+            if methods:
+                methods.update(
+                    __module__=value.__module__,
+                    __qualname__=value.__qualname__,
+                    __slots__=(),
+                )
+                namespace[name] = type(value)(value.__name__, (value,), methods)
+    namespace["origin_type_checkers"] = {
+        origin: copies.get(checker, checker)
+        for origin, checker in namespace["origin_type_checkers"].items()
+    }
+    return namespace
+
+
+def _scoped_patch() -> _Patch:
+    global _scoped
+    with _scoped_lock:
+        if _scoped is None:
+            _scoped = _patch(_copy_typeguard())
+    return _scoped
+
+
+def _patch(namespace: Dict[str, Any]) -> _Patch:
+    # Patches the typeguard functions in `namespace`, which is either typeguard's own
+    # module namespace or a copy of it.
+    type_hints_map = namespace["_type_hints_map"]
+    originals = {name: namespace[name] for name in _patched_names}
+
+    # Defined dynamically, in case something else is doing similar levels of hackery
+    # patching typeguard. We want to get typeguard._CallMemo at the time we patch,
+    # not any earlier. (Someone might have replaced it since the import statement.)
+    class _CallMemo(namespace["_CallMemo"]):
+        __slots__ = (
+            "plan",
+            "value_info",
+            "sizes",
+            "groups",
+            "scope",
+            "cache_key",
+            "skip",
+            "start",
+            "func_start",
+        )
+        plan: _CheckPlan
+        value_info: List[Tuple[str, torch.Tensor, _TensorSpec]]
+        sizes: List[Optional[int]]
+        groups: List[Optional[Tuple[int, ...]]]
+        scope: Optional[Dict[str, Any]]
+        cache_key: Optional[Tuple[Any, ...]]
+        skip: bool
+        start: int
+        func_start: Optional[int]
+
+        def __init__(
+            self,
+            func,
+            frame_locals=None,
+            args=None,
+            kwargs=None,
+            forward_refs_policy=typeguard.ForwardRefPolicy.ERROR,
+        ):
+            plan = getattr(func, "__torchtyping_plan__", None)
+            if plan is not None and not plan.switch.enabled:
+                # Checking has been disabled at runtime: do as little as possible.
+                # (check_argument_types and check_return_type will do nothing
+                # either.)
+                self._init_skipped(func, frame_locals, plan)
+                return
+            start = time.perf_counter_ns()
+            fast = (
+                plan is not None
+                and plan.binder is not None
+                and args is not None
+                and kwargs is not None
+            )
+            if fast and _skip(plan, args, kwargs):
+                # Not sampled.
+                self._init_skipped(func, frame_locals, plan)
+                plan.stats.calls += 1
+                return
+            self.skip = False
+            if plan is not None and func.__annotations__ != plan.annotations:
+                # typeguard never invalidates its own cache of type hints.
+                type_hints_map.pop(func, None)
+                plan = None
+            if (
+                not fast
+                or plan is None
+                or type_hints_map.get(func) is not plan.type_hints
+            ):
+                super().__init__(func, frame_locals, args, kwargs, forward_refs_policy)
+                self.plan = get_plan(self.func, self.type_hints)
+                if self.plan.binder is None:
+                    self.plan.binder = _ArgumentBinder(inspect.signature(func))
+                    self.plan.annotations = dict(func.__annotations__)
+                    self.plan.func_name = self.func_name
+                    self.plan.is_generator = self.is_generator
+                    self.plan.stats.name = self.func_name
+                if not self.plan.switch.enabled:
+                    self.skip = True
+                    return
+                if not fast and args is not None and kwargs is not None:
+                    self.skip = _skip(self.plan, args, kwargs)
             else:
-                memo.value_info = []
-                memo.name_to_size = {}
-                memo.name_to_shape = {}
-                retval = _check_argument_types(*args, **kwargs)
+                # Fast path: everything typeguard would compute about the function
+                # has been computed before, so we skip straight to binding the
+                # arguments.
+                typeguard._TypeCheckMemo.__init__(self, func.__globals__, frame_locals)
+                self.func = func
+                self.func_name = plan.func_name
+                self.is_generator = plan.is_generator
+                self.arguments = plan.binder.bind(args, kwargs)
+                self.type_hints = plan.type_hints
+                self.plan = plan
+            stats = self.plan.stats
+            stats.calls += 1
+            if not self.skip:
+                stats.checked += 1
+                self.start = start
+                self.func_start = None
+
+        def _init_skipped(self, func, frame_locals, plan):
+            typeguard._TypeCheckMemo.__init__(self, func.__globals__, frame_locals)
+            self.func = func
+            self.func_name = plan.func_name
+            self.is_generator = plan.is_generator
+            self.arguments = {}
+            self.type_hints = plan.type_hints
+            self.plan = plan
+            self.skip = True
+
+    _check_type = namespace["check_type"]
+    _check_argument_types = namespace["check_argument_types"]
+    _check_return_type = namespace["check_return_type"]
+
+    get_check_type_args = _argument_getter(
+        inspect.signature(_check_type), "argname", "value", "expected_type", "memo"
+    )
+    get_check_argument_types_args = _argument_getter(
+        inspect.signature(_check_argument_types), "memo"
+    )
+    get_check_return_type_args = _argument_getter(
+        inspect.signature(_check_return_type), "retval", "memo"
+    )
+
+    def check_type(*args, **kwargs):
+        argname, value, expected_type, memo = get_check_type_args(args, kwargs)
+        # Look up the compiled TensorType annotation, if this is one.
+        if memo is not None and hasattr(memo, "value_info"):
+            spec = memo.plan.spec(expected_type)
+        else:
+            spec = None
+        if spec is not None:
+            spec.check(argname, value)
+            memo.value_info.append((argname, value, spec))
+        else:
+            _check_type(*args, **kwargs)
+
+    def check_argument_types(*args, **kwargs):
+        (memo,) = get_check_argument_types_args(args, kwargs)
+        plan = getattr(memo, "plan", None)
+        if plan is None:
+            return _check_argument_types(*args, **kwargs)
+        elif memo.skip:
+            return True
+        else:
+            if _failures:
+                _report()
+            try:
+                _check_arguments(memo, plan)
+            except TypeError:
+                plan.stats.failures += 1
+                raise
+            finally:
+                memo.func_start = time.perf_counter_ns()
+                plan.stats.check_time_ns += memo.func_start - memo.start
+            return True
+
+    def _check_arguments(memo, plan):
+        memo.value_info = []
+        memo.sizes = [None] * plan.num_sizes
+        memo.groups = [None] * plan.num_groups
+        memo.cache_key = None
+        # The sizes of any dimensions bound in the current dimension scope (see
+        # scopes.py) are known up front.
+        scope = memo.scope = _dims.get()
+        if scope is not None:
+            _seed_list(scope, plan.size_names, memo.sizes)
+        cache = plan.cache
+        # A flat loop over the precomputed arguments. Arguments annotated
+        # directly with a TensorType are checked here; everything else (which
+        # may still contain TensorTypes, e.g. Tuple[TensorType[...], ...])
+        # goes via check_type.
+        # The tensor arguments are put straight into `direct`, in `plan.order`.
+        arguments = memo.arguments
+        ranks = plan.ranks
+        direct = _take_scratch(plan)
+        try:
+            for index, argument in enumerate(plan.arguments):
+                argname, description, expected_type, spec, optional = argument
                 try:
-                    _check_memo(memo)
-                except TypeError as exc:  # suppress long traceback
-                    raise TypeError(*exc.args) from None
-                return retval
-
-        def check_return_type(*args, **kwargs):
-            bound_args = check_return_type_signature.bind(*args, **kwargs).arguments
-            memo = bound_args["memo"]
-            if memo is None:
-                return _check_return_type(*args, **kwargs)
+                    value = arguments[argname]
+                except KeyError:
+                    continue
+                if spec is None:
+                    check_type(description, value, expected_type, memo)
+                elif not (optional and value is None):
+                    spec.check_uncached(description, value)
+                    if cache is None:
+                        spec.check_metadata(description, value)
+                    direct[ranks[index]] = (description, value, spec)
+            if cache is None:
+                _check_memo(direct, memo.value_info, plan, memo.sizes, memo.groups)
             else:
-                # Reset the collection of things that need checking.
-                memo.value_info = []
-                # Do _not_ set memo.name_to_size or memo.name_to_shape, as we want to
-                # keep using the same sizes inferred from the arguments.
+                # The seeded sizes affect the outcome, so they're part of the key.
+                key_prefix = None if scope is None else tuple(memo.sizes)
+                memo.cache_key = _check_cached(memo, direct, key_prefix, True)
+            # Reading the values of tensors is left until everything else has passed.
+            if plan.has_value_details:
+                _check_values(direct, plan.func_name)
+            if scope is not None:
+                _record(scope, plan.size_names, memo.sizes)
+        except TypeError as exc:  # suppress long traceback
+            raise TypeError(*exc.args) from None
+        finally:
+            _give_scratch(plan, direct)
+
+    def check_return_type(*args, **kwargs):
+        value, memo = get_check_return_type_args(args, kwargs)
+        plan = getattr(memo, "plan", None)
+        if plan is None:
+            return _check_return_type(*args, **kwargs)
+        elif memo.skip:
+            return True
+        else:
+            start = time.perf_counter_ns()
+            try:
+                retval = _check_return_value(value, memo, plan, args, kwargs)
+            except TypeError:
+                plan.stats.failures += 1
+                raise
+            finally:
+                end = time.perf_counter_ns()
+                plan.stats.check_time_ns += end - start
+            if plan.sampler_record is not None and memo.func_start is not None:
+                check_time = (memo.func_start - memo.start) + (end - start)
+                func_time = start - memo.func_start
+                plan.sampler_record(check_time * 1e-9, func_time * 1e-9)
+            return retval
+
+    def _check_return_value(value, memo, plan, args, kwargs):
+        if not hasattr(memo, "sizes"):
+            return _check_return_type(*args, **kwargs)
+        else:
+            # Reset the collection of things that need checking.
+            memo.value_info = []
+            # Do _not_ reset memo.sizes or memo.groups, as we want to keep using
+            # the same sizes inferred from the arguments.
+            if plan.return_type is None:
+                return True
+            description, expected_type, spec, optional = plan.return_type
+            cache = plan.cache
+            if spec is None:
                 retval = _check_return_type(*args, **kwargs)
-                try:
-                    _check_memo(memo)
-                except TypeError as exc:  # suppress long traceback
-                    raise TypeError(*exc.args) from None
-                return retval
-
-        typeguard._CallMemo = _CallMemo
-        typeguard.check_type = check_type
-        typeguard.check_argument_types = check_argument_types
-        typeguard.check_return_type = check_return_type
-        typeguard.get_type_hints = lambda *args, **kwargs: get_type_hints(
-            *args, **kwargs, include_extras=True
+                direct = ()
+            else:
+                direct = _take_scratch(plan)
+                retval = True
+            try:
+                if spec is not None and not (optional and value is None):
+                    spec.check_uncached(description, value)
+                    if cache is None:
+                        spec.check_metadata(description, value)
+                    direct[0] = (description, value, spec)
+                if cache is None:
+                    _check_memo(direct, memo.value_info, plan, memo.sizes, memo.groups)
+                else:
+                    _check_cached(memo, direct, memo.cache_key, False)
+                if plan.has_value_details:
+                    _check_values(direct, plan.func_name)
+                if memo.scope is not None:
+                    _record(memo.scope, plan.size_names, memo.sizes)
+            except TypeError as exc:  # suppress long traceback
+                raise TypeError(*exc.args) from None
+            finally:
+                if spec is not None:
+                    _give_scratch(plan, direct)
+            return retval
+
+    namespace["_CallMemo"] = _CallMemo
+    namespace["check_type"] = check_type
+    namespace["check_argument_types"] = check_argument_types
+    namespace["check_return_type"] = check_return_type
+    namespace["get_type_hints"] = _get_type_hints
+
+    patch = _Patch()
+    patch.namespace = namespace
+    patch.call_memo = _CallMemo
+    patch.check_argument_types = check_argument_types
+    patch.check_return_type = check_return_type
+    patch.unpatched_check_type = _check_type
+    patch.originals = originals
+    return patch
+
+
+def _set_options(func: Any, options: dict) -> None:
+    if isinstance(func, (classmethod, staticmethod)):
+        func = func.__func__
+    func = inspect.unwrap(func, stop=lambda f: hasattr(f, "__code__"))
+    try:
+        func.__torchtyping_options__ = options
+    except (AttributeError, TypeError):
+        pass
+
+
+def _native_type_hints(
+    signature: inspect.Signature, hints: Dict[str, Any]
+) -> Dict[str, Any]:
+    # As computed by typeguard's _CallMemo.
+    type_hints = {}
+    for name, parameter in signature.parameters.items():
+        if name in hints:
+            annotated_type = hints[name]
+            if parameter.default is None:
+                annotated_type = Optional[annotated_type]
+            if parameter.kind is inspect.Parameter.VAR_POSITIONAL:
+                annotated_type = Tuple[annotated_type, ...]
+            elif parameter.kind is inspect.Parameter.VAR_KEYWORD:
+                annotated_type = Dict[str, annotated_type]
+            type_hints[name] = annotated_type
+    if "return" in hints:
+        type_hints["return"] = hints["return"]
+    return type_hints
+
+
+def _native(func: Any, always: bool, options: dict, localns: Any) -> Optional[Callable]:
+    # Returns `func` wrapped in a generated wrapper that checks it (see codegen.py), or
+    # None if it should be left to typeguard's wrapper instead. That's the case for
+    # anything that typeguard does more with than check the arguments and return value
+    # (generators, coroutines, the special-casing of NotImplemented), or that has an
+    # unusual signature.
+    #
+    # As with typeguard, the annotations are resolved when the function is first called
+    # (so that they may contain forward references), at which point the wrapper's code
+    # is replaced with the code specialised to them.
+    if (
+        not inspect.isfunction(func)
+        or not getattr(func, "__annotations__", None)
+        or hasattr(func, "__wrapped__")
+        or hasattr(func, "__signature__")
+        or inspect.isgeneratorfunction(func)
+        or inspect.iscoroutinefunction(func)
+        or inspect.isasyncgenfunction(func)
+        or func.__name__ in typeguard.BINARY_MAGIC_METHODS
+    ):
+        return None
+    signature = inspect.signature(func)
+    lock = threading.Lock()
+    compiled = False
+
+    def first_call():
+        nonlocal compiled
+        with lock:
+            if not compiled:
+                _compile_native(wrapper, func, signature, always, options, localns)
+                compiled = True
+
+    try:
+        wrapper = _make_stub(func, signature, first_call)
+    except ValueError:  # a parameter name clashes with the wrapper's own variables
+        return None
+    return functools.update_wrapper(wrapper, func)
+
+
+def _helpers(
+    patch: _Patch,
+    func: Optional[Callable],
+    plan: _CheckPlan,
+    globalns: Dict[str, Any],
+    localns: Any,
+) -> Dict[str, Any]:
+    # The generic checks used by generated code (see codegen.py), going via the patched
+    # functions of `patch`.
+    call_memo = patch.call_memo
+
+    def new_memo(arguments):
+        memo = call_memo.__new__(call_memo)
+        typeguard._TypeCheckMemo.__init__(memo, globalns, localns)
+        memo.func = func
+        memo.func_name = plan.func_name
+        memo.is_generator = False
+        memo.arguments = arguments
+        memo.type_hints = plan.type_hints
+        memo.plan = plan
+        memo.skip = False
+        memo.start = time.perf_counter_ns()
+        memo.func_start = None
+        return memo
+
+    def recheck_arguments(arguments):
+        memo = new_memo(arguments)
+        patch.check_argument_types(memo)
+        return memo
+
+    def check_return(value, arguments, sizes, scope):
+        memo = new_memo(arguments)
+        memo.value_info = []
+        memo.sizes = list(sizes)
+        memo.groups = [None] * plan.num_groups
+        memo.cache_key = None
+        memo.scope = scope
+        patch.check_return_type(value, memo)
+
+    return {
+        "new_memo": new_memo,
+        "recheck_arguments": recheck_arguments,
+        "check_return": check_return,
+        "check_argument_types": patch.check_argument_types,
+        "check_return_type": patch.check_return_type,
+        "check_type": patch.unpatched_check_type,
+        "memo0": typeguard._TypeCheckMemo(globalns, localns),
+    }
+
+
+def _compile_native(
+    wrapper: Callable,
+    func: Callable,
+    signature: inspect.Signature,
+    always: bool,
+    options: dict,
+    localns: Any,
+) -> None:
+    patch = _scoped_patch()
+    name = typeguard.function_name(func)
+    hints = _get_type_hints(func, localns=localns)
+    type_hints = _native_type_hints(signature, hints)
+    return_type = type_hints.get("return")
+    if return_type is NoReturn or getattr(return_type, "__origin__", None) in (
+        typeguard.generator_origin_types + typeguard.asyncgen_origin_types
+    ):
+        # typeguard has special handling for these.
+        _set_options(func, options)
+        target = patch.typechecked(func, always=always, _localns=localns)
+        _delegate_to(wrapper, signature, name, target)
+        return
+
+    plan = _CheckPlan(type_hints, **options)
+    plan.switch = _switch(func.__module__)
+    plan.annotations = dict(func.__annotations__)
+    plan.func_name = plan.stats.name = name
+    plan.is_generator = False
+    if plan.cache is not None and _is_inline(plan):
+        # The inlined checks are cheaper than the cache (see codegen.py).
+        plan.cache = None
+    helpers = _helpers(patch, func, plan, func.__globals__, localns)
+    _specialise(wrapper, signature, func, plan, helpers)
+    wrapper.__torchtyping_plan__ = plan
+
+
+def _typechecked(func: Any, always: bool, options: dict, localns: Any) -> Any:
+    if inspect.isclass(func):
+        # As typeguard.typechecked: check every annotated method and property.
+        prefix = func.__qualname__ + "."
+        for key, attr in func.__dict__.items():
+            if (
+                inspect.isfunction(attr)
+                or inspect.ismethod(attr)
+                or inspect.isclass(attr)
+            ):
+                if attr.__qualname__.startswith(prefix) and getattr(
+                    attr, "__annotations__", None
+                ):
+                    setattr(
+                        func, key, _typechecked(attr, always, options, func.__dict__)
+                    )
+            elif isinstance(attr, (classmethod, staticmethod)):
+                if getattr(attr.__func__, "__annotations__", None):
+                    wrapped = _typechecked(
+                        attr.__func__, always, options, func.__dict__
+                    )
+                    setattr(func, key, type(attr)(wrapped))
+            elif isinstance(attr, property):
+                kwargs = dict(doc=attr.__doc__)
+                for name in ("fset", "fget", "fdel"):
+                    property_func = kwargs[name] = getattr(attr, name)
+                    if property_func is not None and getattr(
+                        property_func, "__annotations__", ()
+                    ):
+                        kwargs[name] = _typechecked(
+                            property_func, always, options, func.__dict__
+                        )
+                setattr(func, key, attr.__class__(**kwargs))
+        return func
+
+    wrapper = _native(func, always, options, localns)
+    if wrapper is not None:
+        return wrapper
+    _set_options(func, options)
+    return _scoped_patch().typechecked(func, always=always, _localns=localns)
+
+
+def typechecked(
+    func=None,
+    *,
+    always: bool = False,
+    cache_size: Optional[int] = None,
+    sample: Optional[SamplingPolicy] = None,
+):
+    # A drop-in replacement for typeguard.typechecked, that also accepts some extra
+    # torchtyping-specific options.
+    #
+    # `cache_size`: if not None, then keep a per-function LRU cache of up to this many
+    # combinations of tensor metadata (shape, dtype, layout and names) that have
+    # already been validated. Calls whose metadata matches an entry skip the shape,
+    # dtype and layout checks. Any other details are still checked on every call.
+    # Functions whose checks are inlined (see codegen.py) don't use a cache.
+    #
+    # `sample`: a SamplingPolicy deciding which calls are checked. If None then the
+    # global default (see torchtyping.set_sampling) is used.
+    #
+    # Rather than going via typeguard's wrapper, functions are wrapped in generated code
+    # specialised to their annotations (see codegen.py). The annotations are read when
+    # the function is decorated. (typeguard is still used for checking anything other
+    # than tensors, and its wrapper for generators and coroutines.) This uses a private
+    # copy of typeguard (see "scoped patching" above), so it doesn't patch typeguard
+    # itself: call patch_typeguard for that.
+    #
+    # If checking is turned off (see mode.py) then the function is returned unchanged.
+    if func is None:
+        return functools.partial(
+            typechecked, always=always, cache_size=cache_size, sample=sample
         )
+
+    mode = get_mode()
+    # Zero overhead: don't even wrap the function. Under -O, `always` overrides the
+    # default mode of "off", but not an explicit one.
+    if mode == "off" and (not always or _explicit_mode() == "off"):
+        return func
+    if not __debug__:
+        # Checking was asked for explicitly (by `always` or TORCHTYPING_MODE), so
+        # typeguard's own wrapper mustn't skip it either.
+        always = True
+    if typeguard_lookup._available:
+        # typeguard 3 or later instruments the function itself, so this has to go via
+        # typeguard's checker lookup. The torchtyping-specific options aren't supported.
+        if always or cache_size is not None or sample is not None:
+            warnings.warn(
+                "The `always`, `cache_size` and `sample` options of "
+                "torchtyping.typechecked require typeguard<3, and are ignored with "
+                "typeguard 3 or later.",
+                stacklevel=2,
+            )
+        patch_typeguard()
+        return typeguard.typechecked(func)
+    if mode == "sample" and sample is None and get_sampling() is None:
+        sample = _env_policy()
+    options = {"cache_size": cache_size, "sample": sample}
+    return _typechecked(func, always, options, sys._getframe(1).f_locals)
+
+
+def _find_plan(func: Any) -> Optional[_CheckPlan]:
+    # Finds the plan of a (possibly wrapped) function, if it's been called.
+    while True:
+        plan = getattr(func, "__torchtyping_plan__", None)
+        if plan is not None:
+            return plan
+        try:
+            func = func.__wrapped__
+        except AttributeError:
+            return None
+
+
+def cache_info(func: Any) -> Optional[CacheInfo]:
+    # The hits, misses, evictions, maxsize and current size of a function's cache, as
+    # created by `torchtyping.typechecked(cache_size=...)`. Returns None if the function
+    # doesn't have a cache, or hasn't been called yet.
+    plan = _find_plan(func)
+    if plan is None or plan.cache is None:
+        return None
+    return plan.cache.info()
+
+
+def function_stats(func: Any) -> Optional[Dict[str, int]]:
+    # The calls, checked calls, cache hits, failures and total time spent checking (in
+    # nanoseconds) of a single function. Returns None if it hasn't been called yet.
+    plan = _find_plan(func)
+    if plan is None:
+        return None
+    return plan.stats.snapshot()
+
+
+def budget_info(func: Any) -> Optional[BudgetInfo]:
+    # The current sampling rate and measured overhead of a function using a
+    # SampleBudget policy, along with the averaged time (in seconds) spent checking
+    # each call and in the function itself. Returns None if the function isn't using a
+    # SampleBudget policy, or hasn't been called yet.
+    plan = _find_plan(func)
+    if plan is None or not isinstance(plan.sampler, _BudgetSampler):
+        return None
+    return plan.sampler.info()
@@ -0,0 +1,128 @@
+import functools
+import torch
+import typeguard
+
+from .check_plan import _CheckPlan, _Scope, _tensor_mismatch, _TensorSpec
+from .mode import _switch
+
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# TYPEGUARD 3/4
+#######################
+# typeguard 3 and later no longer have a _CallMemo for us to patch (see
+# typechecker.py). Instead they instrument each function so that it calls
+# `check_argument_types` and `check_return_type` itself, and look up the checker for
+# each annotation via a list of lookup functions, `typeguard.checker_lookup_functions`.
+# So here we just add a lookup function for our TensorTypes.
+#
+# Each checker checks a single tensor against its TensorType. To also check that the
+# sizes of named dimensions are consistent, the sizes seen so far during a call are
+# stored in a _Scope. The memo that typeguard passes to every checker is created
+# afresh at the start of each call of an instrumented function, with the function's
+# `locals()` as its `locals`, so the _Scope is stored in there. (When typeguard's
+# `check_type` is called directly, the memo's `locals` are those of the calling
+# frame, so the sizes must then be consistent across all the tensors checked by the
+# same call of the calling function. At module level there is no scope at all.)
+#
+# All TensorTypes are compiled against the same _CheckPlan, so that every dimension
+# name has the same slot everywhere, and a _Scope just holds the sizes for each slot.
+#
+# Checking may be turned off at runtime for the module in which the check happens (see
+# mode.py), which is taken to be that of the memo's `globals`.
+
+
+_available = hasattr(typeguard, "checker_lookup_functions")
+
+_scope_key = "__torchtyping_scope__"
+
+
+_plan = _CheckPlan({})
+_checkers: Dict[Tuple[type, Any], Callable] = {}
+
+
+def _get_scope(memo: Any) -> Optional[_Scope]:
+    namespace = memo.locals
+    if namespace is None or namespace is memo.globals:
+        return None
+    try:
+        return namespace[_scope_key]
+    except KeyError:
+        scope = _Scope()
+        try:
+            namespace[_scope_key] = scope
+        except TypeError:  # e.g. a mappingproxy
+            return None
+        return scope
+
+
+def _inconsistent(exc: TypeError) -> "typeguard.TypeCheckError":
+    message = str(exc).strip()
+    if not message.startswith("must be"):
+        message = f"has an inconsistent shape: {message}"
+    return typeguard.TypeCheckError(message)
+
+
+def _check(
+    spec: _TensorSpec, value: Any, origin_type: Any, args: Tuple[Any, ...], memo: Any
+) -> None:
+    globalns = memo.globals
+    if not _switch(None if globalns is None else globalns.get("__name__")).enabled:
+        return
+    message = _tensor_mismatch(value, spec)
+    if message is not None:
+        raise typeguard.TypeCheckError(message)
+    scope = _get_scope(memo)
+    if scope is not None:
+        try:
+            scope.bind(value, spec, _plan)
+        except TypeError as exc:
+            raise _inconsistent(exc) from None
+
+
+def _lookup(
+    origin_type: Any, args: Tuple[Any, ...], extras: Tuple[Any, ...]
+) -> Optional[Callable]:
+    # Called by typeguard for every annotation it checks, so this is kept cheap for
+    # anything that isn't a TensorType.
+    if not extras:
+        return None
+    for extra in extras:
+        if isinstance(extra, dict) and "__torchtyping__" in extra:
+            break
+    else:
+        return None
+    if not (isinstance(origin_type, type) and issubclass(origin_type, torch.Tensor)):
+        return None
+    key = (origin_type, extra)
+    try:
+        return _checkers[key]
+    except KeyError:
+        pass
+    except TypeError:  # unhashable details
+        return functools.partial(_check, _TensorSpec(origin_type, extra, _plan))
+    checker = _checkers[key] = functools.partial(
+        _check, _TensorSpec(origin_type, extra, _plan)
+    )
+    return checker
+
+
+# When instrumenting a function, typeguard treats any string inside an annotation as a
+# forward reference, so it would turn e.g. TensorType["batch"] into TensorType[batch].
+# It leaves the insides of Literal[...] alone though, so we have it treat TensorType the
+# same way.
+_literal_names = ("torchtyping.TensorType", "torchtyping.tensor_type.TensorType")
+
+
+def _install() -> None:
+    if _lookup not in typeguard.checker_lookup_functions:
+        # Before typeguard's own lookup, which would otherwise just check isinstance.
+        typeguard.checker_lookup_functions.insert(0, _lookup)
+    try:
+        from typeguard import _transformer
+    except ImportError:
+        return
+    literal_names = getattr(_transformer, "literal_names", None)
+    if literal_names is not None:
+        _transformer.literal_names = literal_names + tuple(
+            name for name in _literal_names if name not in literal_names
+        )
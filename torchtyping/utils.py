@@ -1,11 +1,15 @@
+import collections
+
+from typing import Any, Hashable
+
+
 class frozendict(dict):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Calling this immediately ensures that no unhashable types are used as
-        # entries.
-        # There's also no way this is an efficient hash algorithm, but we're only
-        # planning on using this with small dictionaries.
-        self._hash = hash(tuple(sorted(self.items())))
+        # entries. A frozenset doesn't need its items to be sortable, and is
+        # insensitive to their order, which is what we want for a dict.
+        self._hash = hash(frozenset(self.items()))
 
     def __setitem__(self, item):
         raise RuntimeError(f"Cannot add items to a {type(self)}.")
@@ -21,3 +25,56 @@ class frozendict(dict):
 
     def __deepcopy__(self, memo):
         return self
+
+
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"]
+)
+
+
+class LRUCache:
+    # A bounded mapping that evicts its least recently used entry once it's full.
+    # `get` returns None for missing keys, so None shouldn't be stored as a value.
+    __slots__ = ("maxsize", "hits", "misses", "evictions", "_data")
+
+    def __init__(self, maxsize: int):
+        if maxsize <= 0:
+            raise ValueError(f"maxsize must be positive, got {maxsize}.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        try:
+            self._data.move_to_end(key)
+        except KeyError:  # evicted by another thread in the meantime
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            try:
+                self._data.popitem(last=False)
+            except KeyError:
+                break
+            self.evictions += 1
+
+    def discard(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(
+            self.hits, self.misses, self.evictions, self.maxsize, len(self._data)
+        )
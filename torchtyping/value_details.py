@@ -0,0 +1,322 @@
+import functools
+import torch
+import weakref
+
+from .tensor_details import DetailCost, TensorDetail
+from .utils import CacheInfo, LRUCache
+
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# VALUE DETAILS
+#######################
+# Details that check a tensor's values: that they're finite, that they lie in a range,
+# or that they're normalised along some dimension.
+#
+# Checked one at a time, each of these would make its own pass over the tensor, and
+# wait for its own result (which for a CUDA tensor means synchronising with the
+# device). Instead each says which reductions of the tensor it needs (`reductions`),
+# and decides whether the tensor is acceptable from their results (`accepts`). All the
+# reductions needed for every value-checked tensor of a call are then computed
+# together, each at most once per tensor, and their results copied back in one go per
+# device. A single `aminmax` covers finiteness and any ranges: NaNs propagate into both
+# the min and the max, and infinities are the min or max, so a tensor is finite exactly
+# when its min and max are. Normalisation is checked from the min and max of the sums.
+#
+# Any other value-reading details (see DetailCost) are just checked one by one.
+#
+# Some tensors, e.g. a model's weights, are passed to the same functions over and over
+# again without changing. So the tensors that pass their value details are remembered,
+# along with their `_version` at the time, which PyTorch increments on every in-place
+# modification (including through views). A tensor whose version hasn't changed since
+# it last passed the same details isn't checked again. This is only done for tensors
+# whose value details are all the ones here, which depend on nothing but the values.
+# (Custom details may depend on anything.) The cache is keyed on the id of the tensor,
+# and holds a weak reference to it, so each entry is removed as soon as its tensor is
+# freed. Inference tensors don't have a version, so they're always checked.
+#
+# Note that modifications through `tensor.data`, or through memory shared with e.g.
+# NumPy, don't increment the version, so they won't be seen.
+
+
+_cache: Optional[LRUCache] = LRUCache(maxsize=4096)
+
+
+def set_value_cache(maxsize: Optional[int] = 4096) -> None:
+    # Sets the number of tensors (or rather, combinations of tensor and value details)
+    # whose passing value checks are remembered. None turns the cache off.
+    global _cache
+    _cache = None if maxsize is None else LRUCache(maxsize)
+
+
+def value_cache_info() -> Optional[CacheInfo]:
+    # The hits, misses, evictions, maxsize and current size of the cache, or None if
+    # it's turned off.
+    cache = _cache
+    return None if cache is None else cache.info()
+
+
+def _discard(key: Hashable, ref: Any) -> None:
+    cache = _cache
+    if cache is not None:
+        cache.discard(key)
+
+
+def _cache_key(tensor: torch.Tensor, details: Sequence[Any]) -> Optional[Tuple]:
+    # Returns None if the result of checking `details` against `tensor` is already known
+    # to be a pass. Otherwise returns a pair (key, version) with which to remember a
+    # pass, or () if it can't be remembered.
+    cache = _cache
+    if cache is None:
+        return ()
+    for detail in details:
+        if not isinstance(detail, _ValueDetail):
+            return ()
+    try:
+        version = tensor._version
+    except RuntimeError:  # inference tensor
+        return ()
+    key = (id(tensor), details)
+    try:
+        entry = cache.get(key)
+    except TypeError:  # unhashable detail
+        return ()
+    if entry is not None and entry[0]() is tensor and entry[1] == version:
+        return None
+    return key, version
+
+
+def _remember(tensor: torch.Tensor, key: Tuple) -> None:
+    cache = _cache
+    if cache is not None and key:
+        key, version = key
+        cache.put(key, (weakref.ref(tensor, functools.partial(_discard, key)), version))
+
+
+_minmax = "minmax"
+
+
+def _reduce(tensor: torch.Tensor, key: Any) -> Optional[Tuple[torch.Tensor, ...]]:
+    # Computes a reduction as a pair of scalar tensors, or returns None if it can't be
+    # computed for this tensor (which will fail any detail needing it). `key` is either
+    # _minmax, for the min and max of the tensor, or ("sums", dim), for the min and max
+    # of its sums along `dim`.
+    if key != _minmax:
+        _, dim = key
+        if tensor.dim() == 0 or not -tensor.dim() <= dim < tensor.dim():
+            return None
+        tensor = tensor.sum(dim, dtype=torch.float64)
+        if tensor.numel() == 0:
+            return None
+    elif tensor.is_complex():
+        tensor = torch.view_as_real(tensor)
+    elif tensor.dtype is torch.bool:
+        tensor = tensor.to(torch.uint8)
+    if hasattr(torch, "aminmax"):
+        return torch.aminmax(tensor)
+    return tensor.min(), tensor.max()
+
+
+def _values_match(items: Sequence[Tuple[Optional[torch.Tensor], Sequence[Any]]]) -> int:
+    # `items` contains pairs (tensor, value_details). Returns the index of the first
+    # pair whose tensor doesn't satisfy its details, or -1 if they all do. A tensor of
+    # None is skipped, as is one that's already known to pass.
+    #
+    # Every reduction is computed first. The results for CPU tensors are read straight
+    # away; those for any other device are copied back together, at the end.
+    # This only reads the tensors, so there's no need for autograd to record anything.
+    with torch.no_grad():
+        queued: Dict[torch.device, List[torch.Tensor]] = {}
+        layout = []
+        keys = []
+        for tensor, details in items:
+            if tensor is None or tensor.numel() == 0:
+                layout.append(None)
+                keys.append(())
+                continue
+            key = _cache_key(tensor, details)
+            keys.append(key)
+            if key is None:
+                layout.append(None)
+                continue
+            device = tensor.device
+            cpu = device.type == "cpu"
+            stats = {}
+            for detail in details:
+                for key in getattr(detail, "reductions", ()):
+                    if key in stats:
+                        continue
+                    result = _reduce(tensor, key)
+                    if result is None or cpu:
+                        stats[key] = result
+                    else:
+                        parts = queued.setdefault(device, [])
+                        stats[key] = (device, len(parts))
+                        parts.extend(result)
+            layout.append(stats)
+
+        results = {
+            device: torch.stack([part.to(torch.float64) for part in parts]).tolist()
+            for device, parts in queued.items()
+        }
+
+        for index, (tensor, details) in enumerate(items):
+            stats = layout[index]
+            if stats is None:
+                continue
+            for detail in details:
+                if isinstance(detail, _ValueDetail):
+                    values = {}
+                    for key in detail.reductions:
+                        result = stats[key]
+                        if result is None:
+                            return index
+                        if isinstance(result[0], torch.Tensor):
+                            values[key] = (result[0].item(), result[1].item())
+                        else:
+                            device, offset = result
+                            values[key] = tuple(results[device][offset : offset + 2])
+                    if not detail.accepts(tensor, values):
+                        return index
+                elif not detail.check(tensor):
+                    return index
+            _remember(tensor, keys[index])
+        return -1
+
+
+class _ValueDetail(TensorDetail):
+    # A detail checked from the results of some reductions of the tensor. Subclasses
+    # set `reductions`, and implement `accepts(tensor, stats)`, where `stats` maps each
+    # reduction to its results, as a pair of numbers.
+
+    __slots__ = ()
+    cost = DetailCost.VALUES
+    reductions: Tuple[Any, ...] = ()
+
+    def accepts(
+        self, tensor: torch.Tensor, stats: Dict[Any, Tuple[float, float]]
+    ) -> bool:
+        raise NotImplementedError
+
+    def check(self, tensor: torch.Tensor) -> bool:
+        return _values_match(((tensor, (self,)),)) == -1
+
+
+def _bound_repr(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+class _FiniteDetail(_ValueDetail):
+    __slots__ = ()
+    reductions = (_minmax,)
+
+    def __eq__(self, other: object) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        return True
+
+    def __hash__(self) -> int:
+        return hash(type(self))
+
+    def __repr__(self) -> str:
+        return "is_finite"
+
+    def accepts(
+        self, tensor: torch.Tensor, stats: Dict[Any, Tuple[float, float]]
+    ) -> bool:
+        minimum, maximum = stats[_minmax]
+        return -float("inf") < minimum and maximum < float("inf")
+
+    @classmethod
+    def tensor_repr(cls, tensor: torch.Tensor) -> str:
+        return "is_finite" if is_finite.check(tensor) else "not is_finite"
+
+
+class RangeDetail(_ValueDetail):
+    # Every value is at least `min` and at most `max` (either of which may be None).
+    # NaNs are never in range.
+
+    __slots__ = ("min", "max")
+    reductions = (_minmax,)
+
+    def __init__(self, *, min: Optional[float] = None, max: Optional[float] = None):
+        super().__init__()
+        self.min = min
+        self.max = max
+
+    def __eq__(self, other: object) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.min == other.min and self.max == other.max
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.min, self.max))
+
+    def __repr__(self) -> str:
+        bounds = []
+        if self.min is not None:
+            bounds.append(f"min={self.min!r}")
+        if self.max is not None:
+            bounds.append(f"max={self.max!r}")
+        return f"RangeDetail({', '.join(bounds)})"
+
+    def accepts(
+        self, tensor: torch.Tensor, stats: Dict[Any, Tuple[float, float]]
+    ) -> bool:
+        if tensor.is_complex():
+            return False
+        minimum, maximum = stats[_minmax]
+        if minimum != minimum or maximum != maximum:  # NaN
+            return False
+        if self.min is not None and minimum < self.min:
+            return False
+        if self.max is not None and maximum > self.max:
+            return False
+        return True
+
+    @classmethod
+    def tensor_repr(cls, tensor: torch.Tensor) -> str:
+        if tensor.numel() == 0 or tensor.is_complex():
+            return ""
+        minimum, maximum = (result.item() for result in _reduce(tensor, _minmax))
+        return f"RangeDetail(min={_bound_repr(minimum)}, max={_bound_repr(maximum)})"
+
+
+class NormalizedDetail(_ValueDetail):
+    # The values sum to 1 (to within `atol`) along dimension `dim`.
+
+    __slots__ = ("dim", "atol", "reductions")
+
+    def __init__(self, *, dim: int = -1, atol: float = 1e-5):
+        super().__init__()
+        self.dim = dim
+        self.atol = atol
+        self.reductions = (("sums", dim),)
+
+    def __eq__(self, other: object) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.dim == other.dim and self.atol == other.atol
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.dim, self.atol))
+
+    def __repr__(self) -> str:
+        if self == is_normalized:
+            return "is_normalized"
+        return f"NormalizedDetail(dim={self.dim!r}, atol={self.atol!r})"
+
+    def accepts(
+        self, tensor: torch.Tensor, stats: Dict[Any, Tuple[float, float]]
+    ) -> bool:
+        minimum, maximum = stats[self.reductions[0]]
+        # Written this way round so that NaNs fail.
+        return 1 - self.atol <= minimum and maximum <= 1 + self.atol
+
+    @classmethod
+    def tensor_repr(cls, tensor: torch.Tensor) -> str:
+        return ""
+
+
+is_finite = _FiniteDetail()  # singleton flag
+is_nonnegative = RangeDetail(min=0)
+is_normalized = NormalizedDetail()